@@ -0,0 +1,196 @@
+import fnmatch
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from Scan_engine import allocated_size
+
+# dirs — имена каталогов (шаблоны fnmatch) или пути, начинающиеся с / или ~;
+# files — шаблоны имён файлов; older_than_days относится только к файлам (по mtime)
+CleanupRule = namedtuple('CleanupRule', ['name', 'dirs', 'files', 'older_than_days'])
+
+# items: [(занято на диске, путь)] по убыванию размера
+CleanupGroup = namedtuple('CleanupGroup', ['rule', 'disk_size', 'items'])
+
+DEFAULT_RULES = [
+    CleanupRule("Кэш приложений", ['~/.cache'], [], 0),
+    CleanupRule("Корзина", ['~/.local/share/Trash'], [], 0),
+    CleanupRule("Кэш Python", ['__pycache__', '.pytest_cache', '.mypy_cache', '.tox'], [], 0),
+    CleanupRule("Зависимости Node.js", ['node_modules'], [], 0),
+    CleanupRule("Артефакты сборки", ['CMakeFiles'], ['*.o', '*.obj'], 0),
+    CleanupRule("Дампы памяти", [], ['core', 'core.[0-9]*', '*.core', 'vgcore.*'], 0),
+    CleanupRule("Старые журналы", [], ['*.log', '*.log.[0-9]*', '*.log.gz', '*.log.old'], 30),
+]
+
+_WILDCARDS = re.compile(r'[*?\[]')
+_SUFFIX = re.compile(r'\*(\.[^*?\[/.]+)')
+
+
+def default_rules_path():
+    config_dir = os.environ.get('XDG_CONFIG_HOME') or os.path.join(
+        os.path.expanduser('~'), '.config')
+    return os.path.join(config_dir, 'disk-analyzer', 'cleanup_rules.json')
+
+
+def load_rules(path=None):
+    # Файл — список объектов с полями CleanupRule; если его нет, берутся DEFAULT_RULES
+    path = path or default_rules_path()
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return list(DEFAULT_RULES)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка при чтении правил очистки {path}: {str(e)}")
+        return list(DEFAULT_RULES)
+    if not isinstance(data, list):
+        print(f"Ошибка в правилах очистки {path}: ожидается список правил")
+        return list(DEFAULT_RULES)
+    rules = []
+    for number, item in enumerate(data, 1):
+        # Неверное правило пропускается: иначе оно упало бы в потоке обхода
+        problem = rule_problem(item)
+        if problem is not None:
+            print(f"Ошибка в правиле очистки {number} из {path}: {problem}")
+            continue
+        rules.append(CleanupRule(item['name'], list(item.get('dirs', [])),
+                                 list(item.get('files', [])), item.get('older_than_days', 0)))
+    return rules or list(DEFAULT_RULES)
+
+
+def rule_problem(item):
+    if not isinstance(item, dict):
+        return "ожидается объект"
+    if not isinstance(item.get('name'), str):
+        return "name должно быть строкой"
+    for field in ('dirs', 'files'):
+        patterns = item.get(field, [])
+        if not isinstance(patterns, list) or not all(isinstance(p, str) for p in patterns):
+            return f"{field} должно быть списком строк"
+    days = item.get('older_than_days', 0)
+    if isinstance(days, bool) or not isinstance(days, (int, float)) or days < 0:
+        return "older_than_days должно быть неотрицательным числом"
+    return None
+
+
+class NameMatcher:
+    # Шаблоны всех правил собраны в три таблицы: точные имена и суффиксы вида *.log —
+    # словари, остальные шаблоны — одно регулярное выражение с группой на правило.
+    # На каждое имя — один-два поиска в словаре и не больше одного re.match;
+    # при совпадении нескольких правил выигрывает первое в списке
+    def __init__(self, patterns):
+        # patterns: [(шаблон, правило)] в порядке приоритета
+        self.names = {}
+        self.suffixes = {}
+        self.rules = []
+        alternatives = []
+        for pattern, rule in patterns:
+            suffix = _SUFFIX.fullmatch(pattern)
+            if not _WILDCARDS.search(pattern):
+                self.names.setdefault(pattern, rule)
+            elif suffix is not None:
+                self.suffixes.setdefault(suffix.group(1), rule)
+            else:
+                alternatives.append(f"(?P<r{len(self.rules)}>{fnmatch.translate(pattern)})")
+                self.rules.append(rule)
+        self.pattern = re.compile('|'.join(alternatives)) if alternatives else None
+
+    def match(self, name):
+        rule = self.names.get(name)
+        if rule is not None:
+            return rule
+        dot = name.rfind('.')
+        if dot > 0:
+            rule = self.suffixes.get(name[dot:])
+            if rule is not None:
+                return rule
+        if self.pattern is not None:
+            found = self.pattern.match(name)
+            if found is not None:
+                return self.rules[int(found.lastgroup[1:])]
+        return None
+
+
+class CleanupMatcher:
+    def __init__(self, rules):
+        self.rules = rules
+        self.paths = {}
+        dir_names = []
+        file_names = []
+        for rule in rules:
+            for pattern in rule.dirs:
+                if pattern.startswith(('/', '~')):
+                    self.paths.setdefault(os.path.normpath(os.path.expanduser(pattern)), rule)
+                else:
+                    dir_names.append((pattern, rule))
+            file_names.extend((pattern, rule) for pattern in rule.files)
+        self.dir_names = NameMatcher(dir_names)
+        self.file_names = NameMatcher(file_names)
+
+    def match_dir(self, path, name):
+        return self.paths.get(path) or self.dir_names.match(name)
+
+    def match_file(self, name):
+        return self.file_names.match(name)
+
+
+class CleanupCandidates:
+    # on_file для scan_tree: файлы по правилам отбираются в том же обходе, что и размеры.
+    # Каталоги по правилам находятся после обхода по уже посчитанному дереву в памяти:
+    # их размер известен только после aggregate
+    def __init__(self, rules=None):
+        self.matcher = CleanupMatcher(rules if rules is not None else load_rules())
+        self.now = time.time()
+        self._files = []
+        self._lock = threading.Lock()
+
+    def on_file(self, entry, st):
+        rule = self.matcher.match_file(entry.name)
+        if rule is None:
+            return
+        if rule.older_than_days and self.now - st.st_mtime < rule.older_than_days * 86400:
+            return
+        # Файл с другими жёсткими ссылками не освободит места
+        if st.st_nlink > 1:
+            return
+        with self._lock:
+            self._files.append((rule, allocated_size(st), entry.path))
+
+    def groups(self, tree):
+        found = {}
+        matched_dirs = set()
+        stack = [(tree.root_path, child_name, child) for child_name, child
+                 in tree.root.children.items()]
+        while stack:
+            parent, name, node = stack.pop()
+            path = os.path.join(parent, name)
+            rule = self.matcher.match_dir(path, name)
+            if rule is not None:
+                # Вложенные каталоги и файлы уже учтены в найденном
+                found.setdefault(rule.name, (rule, []))[1].append((node.disk_size, path))
+                matched_dirs.add(path)
+                continue
+            stack.extend((path, child_name, child) for child_name, child in node.children.items())
+
+        for rule, disk_size, path in self._files:
+            if not any_parent_in(path, matched_dirs):
+                found.setdefault(rule.name, (rule, []))[1].append((disk_size, path))
+
+        result = [
+            CleanupGroup(rule, sum(size for size, _ in items), sorted(items, reverse=True))
+            for rule, items in found.values()
+        ]
+        result.sort(key=lambda group: group.disk_size, reverse=True)
+        return result
+
+
+def any_parent_in(path, dirs):
+    parent = os.path.dirname(path)
+    while parent not in dirs:
+        up = os.path.dirname(parent)
+        if up == parent:
+            return False
+        parent = up
+    return True
@@ -0,0 +1,190 @@
+import os
+import struct
+import sys
+from array import array
+
+SNAPSHOT_MAGIC = b'DASNAP01'
+# Заголовок: число узлов, длина пула имён, длина пути корня, время снимка
+SNAPSHOT_HEADER = struct.Struct('<QQIq')
+
+
+class CompactTree:
+    # Дерево каталогов в параллельных массивах без объекта на узел.
+    # Узлы лежат в прямом порядке обхода, поэтому поддерево i занимает отрезок
+    # [i, end[i]), а дети i — это i + 1, end[i + 1], end[end[i + 1]], ... до end[i].
+    # Имена хранятся один раз в общем байтовом пуле, полные пути собираются по запросу.
+    def __init__(self, root_path):
+        self.root_path = os.path.normpath(root_path)
+        self.parent = array('i')
+        self.end = array('I')
+        self.name_start = array('Q')
+        self.name_len = array('H')
+        self.size = array('Q')
+        self.disk_size = array('Q')
+        self.files = array('Q')
+        self.mtime_ns = array('q')
+        # Место с каждой жёсткой ссылкой; заполняется только из ScanTree и в снимок не пишется
+        self.raw_disk = array('Q')
+        self.names = bytearray()
+        self.created_ns = 0
+        self._interned = {}
+        # Родитель -> {имя: ребёнок} для find, только для каталогов, где уже искали
+        self._lookup = {}
+        if self.root_path.endswith(os.sep):
+            self._prefix = self.root_path
+        else:
+            self._prefix = self.root_path + os.sep
+
+    def __len__(self):
+        return len(self.parent)
+
+    def intern(self, name):
+        raw = os.fsencode(name)
+        start = self._interned.get(raw)
+        if start is None:
+            start = len(self.names)
+            self.names += raw
+            self._interned[raw] = start
+        return start, len(raw)
+
+    def append(self, parent, name, size, disk_size, files, mtime_ns):
+        start, length = self.intern(name)
+        self.parent.append(parent)
+        self.end.append(0)
+        self.name_start.append(start)
+        self.name_len.append(length)
+        self.size.append(size)
+        self.disk_size.append(disk_size)
+        self.files.append(files)
+        self.mtime_ns.append(mtime_ns)
+        return len(self.parent) - 1
+
+    def freeze(self):
+        # Словарь интернирования нужен только при построении; bytes режется быстрее bytearray
+        self._interned = {}
+        self.names = bytes(self.names)
+
+    @classmethod
+    def from_scan_tree(cls, tree):
+        compact = cls(tree.root_path)
+        stack = [(tree.root, -1, '')]
+        while stack:
+            node, parent, name = stack.pop()
+            if node is None:
+                # Все потомки parent уже добавлены: закрываем его отрезок
+                compact.end[parent] = len(compact)
+                continue
+            index = compact.append(parent, name, node.size, node.disk_size, node.files,
+                                   node.mtime_ns)
+            compact.raw_disk.append(node.raw_disk)
+            stack.append((None, index, None))
+            for child_name, child in sorted(node.children.items(), reverse=True):
+                stack.append((child, index, child_name))
+        compact.freeze()
+        return compact
+
+    def subtree(self, index):
+        # Поддерево index как отдельное дерево: отрезок массивов со сдвигом номеров,
+        # пул имён общий
+        if index == 0:
+            return self
+        end = self.end[index]
+        compact = CompactTree(self.path_of(index))
+        compact.parent = array('i', [-1] + [p - index for p in self.parent[index + 1:end]])
+        compact.end = array('I', [e - index for e in self.end[index:end]])
+        for name in ('name_start', 'name_len', 'size', 'disk_size', 'files', 'mtime_ns',
+                     'raw_disk'):
+            setattr(compact, name, getattr(self, name)[index:end])
+        compact.names = self.names
+        compact.created_ns = self.created_ns
+        return compact
+
+    def raw_disk_of(self, index):
+        return self.raw_disk[index] if self.raw_disk else self.disk_size[index]
+
+    def raw_name(self, index):
+        start = self.name_start[index]
+        return bytes(self.names[start:start + self.name_len[index]])
+
+    def name(self, index):
+        return os.fsdecode(self.raw_name(index))
+
+    def children(self, index):
+        child = index + 1
+        end = self.end[index]
+        while child < end:
+            yield child
+            child = self.end[child]
+
+    def path_of(self, index):
+        parts = []
+        while index > 0:
+            parts.append(self.name(index))
+            index = self.parent[index]
+        parts.reverse()
+        return os.path.join(self.root_path, *parts)
+
+    def contains(self, path):
+        path = os.path.normpath(path)
+        return path == self.root_path or path.startswith(self._prefix)
+
+    def find(self, path):
+        path = os.path.normpath(path)
+        if path == self.root_path:
+            return 0 if len(self) else None
+        if not path.startswith(self._prefix) or not len(self):
+            return None
+
+        index = 0
+        for part in path[len(self._prefix):].split(os.sep):
+            names = self._lookup.get(index)
+            if names is None:
+                names = self._lookup[index] = {
+                    self.raw_name(child): child for child in self.children(index)}
+            index = names.get(os.fsencode(part))
+            if index is None:
+                return None
+        return index
+
+    def arrays(self):
+        return (self.parent, self.end, self.name_start, self.name_len, self.size,
+                self.disk_size, self.files, self.mtime_ns)
+
+    def nbytes(self):
+        arrays = self.arrays() + (self.raw_disk,)
+        return sum(a.itemsize * len(a) for a in arrays) + len(self.names)
+
+    def save(self, path):
+        # Массивы пишутся как есть, little-endian; запись через временный файл,
+        # чтобы прерванное сохранение не оставило битый снимок
+        root = os.fsencode(self.root_path)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(SNAPSHOT_HEADER.pack(len(self), len(self.names), len(root), self.created_ns))
+            f.write(root)
+            for a in self.arrays():
+                if sys.byteorder != 'little':
+                    a = array(a.typecode, a)
+                    a.byteswap()
+                a.tofile(f)
+            f.write(self.names)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ValueError(f"Не файл снимка: {path}")
+            count, names_len, root_len, created_ns = SNAPSHOT_HEADER.unpack(
+                f.read(SNAPSHOT_HEADER.size))
+            compact = cls(os.fsdecode(f.read(root_len)))
+            for a in compact.arrays():
+                a.fromfile(f, count)
+                if sys.byteorder != 'little':
+                    a.byteswap()
+            compact.names = f.read(names_len)
+            if len(compact.names) != names_len:
+                raise EOFError(f"Снимок обрезан: {path}")
+        compact.created_ns = created_ns
+        return compact
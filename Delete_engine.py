@@ -0,0 +1,231 @@
+import os
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from PySide6.QtCore import QObject, Signal, QTimer
+from Scan_engine import allocated_size
+
+# Каталоги открываются относительно уже открытого родителя и без перехода по симлинкам:
+# каталог, подменённый ссылкой во время удаления, не уведёт его за пределы дерева
+OPEN_DIR = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW | getattr(os, 'O_CLOEXEC', 0)
+# Итоги сбрасываются в общий счётчик и отмена проверяется раз в столько записей
+BATCH = 256
+
+
+class DeleteCounter:
+    # Общие для всех потоков итоги: удалено файлов и освобождено байт на диске
+    def __init__(self):
+        self.files = 0
+        self.disk_size = 0
+        self._lock = threading.Lock()
+
+    def add(self, files, disk_size):
+        with self._lock:
+            self.files += files
+            self.disk_size += disk_size
+
+    def totals(self):
+        with self._lock:
+            return self.files, self.disk_size
+
+
+def unlink_at(dir_fd, name, st):
+    os.unlink(name, dir_fd=dir_fd)
+    # Место освобождает только последняя жёсткая ссылка на файл
+    return allocated_size(st) if st.st_nlink <= 1 else 0
+
+
+def delete_files(dir_fd, path, counter, should_stop, errors):
+    # Удаляет всё, кроме подкаталогов, в открытом каталоге dir_fd.
+    # Возвращает (имена подкаталогов, освобождено байт)
+    subdirs = []
+    freed = 0
+    files = 0
+    batch_freed = 0
+    try:
+        with os.scandir(dir_fd) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                        continue
+                    size = unlink_at(dir_fd, entry.name, entry.stat(follow_symlinks=False))
+                except OSError as e:
+                    errors.append(f"{os.path.join(path, entry.name)}: {str(e)}")
+                    continue
+                files += 1
+                batch_freed += size
+                if files == BATCH:
+                    counter.add(files, batch_freed)
+                    freed += batch_freed
+                    files = batch_freed = 0
+                    if should_stop():
+                        break
+    except OSError as e:
+        errors.append(f"{path}: {str(e)}")
+    counter.add(files, batch_freed)
+    return subdirs, freed + batch_freed
+
+
+def delete_subtree(parent_fd, name, path, counter, should_stop, errors):
+    # Каталог name внутри parent_fd удаляется в глубину без рекурсии: кадр стека
+    # держит открытый дескриптор каталога, пока не удалены все его подкаталоги.
+    # Возвращает (освобождено байт, удалён ли каталог целиком)
+    freed = 0
+    stack = [(parent_fd, name, path, None)]
+    try:
+        while stack:
+            if should_stop():
+                return freed, False
+            parent, name, path, fd = stack[-1]
+            if fd is None:
+                try:
+                    fd = os.open(name, OPEN_DIR, dir_fd=parent)
+                except OSError as e:
+                    errors.append(f"{path}: {str(e)}")
+                    stack.pop()
+                    continue
+                stack[-1] = (parent, name, path, fd)
+                subdirs, size = delete_files(fd, path, counter, should_stop, errors)
+                freed += size
+                if subdirs:
+                    stack.extend((fd, d, os.path.join(path, d), None) for d in reversed(subdirs))
+                    continue
+
+            # Все подкаталоги уже обработаны
+            stack.pop()
+            os.close(fd)
+            try:
+                os.rmdir(name, dir_fd=parent)
+            except OSError as e:
+                errors.append(f"{path}: {str(e)}")
+        return freed, not errors
+    finally:
+        for _, _, _, fd in stack:
+            if fd is not None:
+                os.close(fd)
+
+
+def delete_path(path, executor, counter, should_stop, errors):
+    # Файл или ссылка удаляются сразу. У каталога собственные файлы удаляет вызывающий
+    # поток, а подкаталоги первого уровня расходятся по потокам executor.
+    # Возвращает (освобождено байт, удалён ли path целиком)
+    path = os.path.normpath(path)
+    parent_path, name = os.path.split(path)
+    own_errors = []
+    freed = 0
+    try:
+        parent_fd = os.open(parent_path or os.curdir, OPEN_DIR & ~os.O_NOFOLLOW)
+    except OSError as e:
+        errors.append(f"{path}: {str(e)}")
+        return 0, False
+
+    try:
+        st = os.stat(name, dir_fd=parent_fd, follow_symlinks=False)
+        if not stat.S_ISDIR(st.st_mode):
+            freed = unlink_at(parent_fd, name, st)
+            counter.add(1, freed)
+            return freed, True
+
+        fd = os.open(name, OPEN_DIR, dir_fd=parent_fd)
+        try:
+            subdirs, freed = delete_files(fd, path, counter, should_stop, own_errors)
+            futures = [
+                executor.submit(delete_subtree, fd, d, os.path.join(path, d), counter,
+                                should_stop, own_errors)
+                for d in subdirs
+            ]
+            # Дескриптор fd нужен всем задачам: закрывается только после последней
+            wait(futures)
+        finally:
+            os.close(fd)
+        for future in futures:
+            freed += future.result()[0]
+        if should_stop() or own_errors:
+            return freed, False
+        os.rmdir(name, dir_fd=parent_fd)
+        return freed, True
+    except OSError as e:
+        own_errors.append(f"{path}: {str(e)}")
+        return freed, False
+    finally:
+        errors.extend(own_errors)
+        os.close(parent_fd)
+
+
+class DeleteService(QObject):
+    # Удаление в фоновых потоках. Итоги забираются таймером в потоке интерфейса,
+    # как у MountUsageService, поэтому сигналы испускаются только из него.
+    # path_deleted приходит по каждому пути по мере готовности, в том числе
+    # для удалённого частично (при отмене или ошибках): освобождённое уже не вернуть.
+    progress = Signal(int, 'qint64')
+    path_deleted = Signal(str, 'qint64', bool)
+    finished = Signal(int, 'qint64', list, bool)
+
+    def __init__(self, workers=None, parent=None):
+        super().__init__(parent)
+        # unlink и rmdir отпускают GIL, потоков может быть больше, чем ядер
+        self.workers = workers or min(8, 2 * (os.cpu_count() or 1))
+        self.counter = DeleteCounter()
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._deleted = []
+        self._result = None
+
+        self._collect_timer = QTimer(self)
+        self._collect_timer.setInterval(100)
+        self._collect_timer.timeout.connect(self.collect)
+
+    def is_running(self):
+        return self._thread is not None
+
+    def start(self, paths):
+        if self.is_running():
+            return False
+        self.counter = DeleteCounter()
+        self._cancel.clear()
+        self._deleted = []
+        self._result = None
+        self._thread = threading.Thread(target=self._run, args=(list(paths),), daemon=True)
+        self._thread.start()
+        self._collect_timer.start()
+        return True
+
+    def cancel(self):
+        self._cancel.set()
+
+    def stop(self, timeout=None):
+        self.cancel()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self, paths):
+        errors = []
+        with ThreadPoolExecutor(self.workers) as executor:
+            for path in paths:
+                if self._cancel.is_set():
+                    break
+                freed, complete = delete_path(path, executor, self.counter,
+                                              self._cancel.is_set, errors)
+                with self._lock:
+                    self._deleted.append((path, freed, complete))
+        with self._lock:
+            self._result = (errors, self._cancel.is_set())
+
+    def collect(self):
+        with self._lock:
+            deleted = self._deleted
+            self._deleted = []
+            result = self._result
+
+        files, disk_size = self.counter.totals()
+        for path, freed, complete in deleted:
+            self.path_deleted.emit(path, freed, complete)
+        self.progress.emit(files, disk_size)
+
+        if result is not None:
+            self._collect_timer.stop()
+            self._thread = None
+            errors, cancelled = result
+            self.finished.emit(files, disk_size, errors, cancelled)
@@ -1,47 +1,49 @@
 import os
-import shutil
-from PySide6.QtWidgets import QDialog, QMessageBox, QFileSystemModel, QTreeView
-from PySide6.QtCore import Qt, Signal, QTimer, QSortFilterProxyModel
+from PySide6.QtWidgets import (QDialog, QMessageBox, QFileSystemModel, QTreeView,
+                               QTreeWidget, QTreeWidgetItem, QTabWidget, QProgressDialog,
+                               QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel)
+from PySide6.QtCore import Qt, Signal, QTimer
 from ui_dialog import Ui_Dialog
-from ThreadCalculator import ThreadCalculator
+from Size_proxy_model import SizeProxyModel, size_filter_box
+from Treemap_view import TreemapWidget
+from Delete_engine import DeleteService
+from Duplicate_finder import DuplicateService
 
-class ProxyModel(QSortFilterProxyModel):
+LARGEST_ITEMS = 50
+# Больше групп дубликатов в списке не показывается: они отсортированы по лишнему месту
+DUPLICATE_GROUPS = 1000
+# Столько самых больших кандидатов на очистку показывается в группе правила
+CLEANUP_ITEMS = 500
+
+class ProxyModel(SizeProxyModel):
     def __init__(self, drives=None, parent=None):
-        super().__init__(parent)
         self.drives = drives or []
-        self.size_cache = {}
-        self.calculator = ThreadCalculator()
-        self.calculator.worker.calculated.connect(self.update_size)
+        super().__init__(parent)
 
     def data(self, index, role=Qt.DisplayRole):
         if index.column() == 1 and role == Qt.DisplayRole:
             source_index = self.mapToSource(index)
-            path = self.sourceModel().filePath(source_index)
-
-            if os.path.isdir(path) or os.path.islink(path):
-                if path in self.size_cache:
-                    return self.size_cache[path]
-                else:
-                    QTimer.singleShot(0, lambda p=path: self.calculator.add_task(p))
-                    return "Вычисление..."
+            size = self.directory_size(source_index, self.sourceModel().filePath(source_index))
+            if size is not None:
+                return size
 
         return super().data(index, role)
 
-    def update_size(self, path, size):
-        if path not in self.size_cache or self.size_cache[path] != size:
-            self.size_cache[path] = size
-            root_index = self.sourceModel().index(path)
-            if root_index.isValid():
-                proxy_index = self.mapFromSource(root_index)
-                if proxy_index.isValid():
-                    self.dataChanged.emit(proxy_index, proxy_index, [Qt.DisplayRole])
-
-    def format_size(self, bytes):
-        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-            if bytes < 1024:
-                return f"{bytes:.1f} {unit}"
-            bytes /= 1024
-        return f"{bytes:.1f} PB"
+
+def top_level_groups(view):
+    for i in range(view.topLevelItemCount()):
+        group = view.topLevelItem(i)
+        yield group, [group.child(j) for j in range(group.childCount())]
+
+
+def checked_paths(view):
+    return {
+        child.data(0, Qt.UserRole)
+        for _, children in top_level_groups(view)
+        for child in children
+        if child.checkState(0) == Qt.Checked
+    }
+
 
 class DiskCleanupDialog(QDialog):
     dialog_finished = Signal()
@@ -53,29 +55,254 @@ class DiskCleanupDialog(QDialog):
         self.drive_path = drive_path
         self.setWindowTitle(f"Очистите диск {drive_path}")
         self.setModal(True)
+        # Закрытое окно удаляется вместе с моделями и потоком QFileSystemModel
+        self.setAttribute(Qt.WA_DeleteOnClose)
         self.ui.pushButton.setEnabled(False)
 
-        self.file_model = QFileSystemModel()
+        self.file_model = QFileSystemModel(self)
         self.file_model.setRootPath(self.drive_path)
         self.file_model.setReadOnly(False)
 
-        self.proxy_model = ProxyModel()
+        self.proxy_model = ProxyModel(parent=self)
         self.proxy_model.setSourceModel(self.file_model)
 
-        self.ui.treeView.setModel(self.proxy_model)
+        self.proxy_model.show_in(self.ui.treeView)
         self.ui.treeView.setRootIndex(
-            self.proxy_model.mapFromSource(
+            self.proxy_model.to_view(
                 self.file_model.index(self.drive_path)
             )
         )
         self.ui.treeView.setColumnWidth(0, 300)
         self.ui.treeView.setSelectionMode(QTreeView.ExtendedSelection)
+        self.ui.treeView.setUniformRowHeights(True)
+        self.ui.treeView.setSortingEnabled(True)
+        self.ui.treeView.sortByColumn(0, Qt.AscendingOrder)
+        self.size_filter = size_filter_box(self.proxy_model)
+        self.ui.verticalLayout.insertWidget(0, self.size_filter)
 
         self.ui.pushButton.clicked.connect(self.delete_selected)
-        self.ui.treeView.selectionModel().selectionChanged.connect(
-            self.update_selection_count)
+        self.ui.treeView.collapsed.connect(self.proxy_model.cancel_branch)
+        self.proxy_model.selection_changed.connect(self.update_selection_count)
+
+        self.deleter = DeleteService(parent=self)
+        self.deleter.progress.connect(self.on_delete_progress)
+        self.deleter.path_deleted.connect(self.on_path_deleted)
+        self.deleter.finished.connect(self.on_delete_finished)
+        self.delete_progress = None
+        self.deleted_count = 0
+
+        self.setup_largest_view()
+        self.setup_cleanup_view()
+        self.setup_duplicates_view()
+        self.update_selection_count()
+        # Один обход даёт самые большие элементы, кандидатов на очистку и карту
+        self.proxy_model.calculator.find_largest(self.drive_path, LARGEST_ITEMS)
+
+    def setup_largest_view(self):
+        self.largest_view = QTreeWidget()
+        self.largest_view.setHeaderLabels(["Самые большие элементы", "Размер"])
+        self.largest_view.setColumnWidth(0, 600)
+        self.largest_files = QTreeWidgetItem(self.largest_view, ["Файлы", "Вычисление..."])
+        self.largest_dirs = QTreeWidgetItem(self.largest_view, ["Каталоги", "Вычисление..."])
+        self.treemap = TreemapWidget()
+        self.treemap.path_activated.connect(self.reveal_path)
+        self.largest_tabs = QTabWidget()
+        self.largest_tabs.addTab(self.largest_view, "Самые большие")
+        self.largest_tabs.addTab(self.treemap, "Карта")
+        self.ui.verticalLayout.insertWidget(1, self.largest_tabs)
+
+        self.largest_view.itemActivated.connect(self.reveal_largest_item)
+        worker = self.proxy_model.calculator.worker
+        worker.largest_found.connect(self.show_largest)
+        worker.treemap_ready.connect(self.show_treemap)
+
+    def setup_cleanup_view(self):
+        page = QWidget()
+        layout = QVBoxLayout(page)
+        self.cleanup_label = QLabel("Поиск кэшей, старых журналов и артефактов сборки...")
+        layout.addWidget(self.cleanup_label)
+        self.cleanup_view = QTreeWidget()
+        self.cleanup_view.setHeaderLabels(["Можно удалить", "Размер"])
+        self.cleanup_view.setColumnWidth(0, 600)
+        layout.addWidget(self.cleanup_view)
+        self.largest_tabs.insertTab(0, page, "Рекомендации")
+        self.largest_tabs.setCurrentIndex(0)
+
+        self.cleanup_view.itemChanged.connect(self.update_selection_count)
+        self.cleanup_view.itemActivated.connect(self.reveal_largest_item)
+        self.proxy_model.calculator.worker.cleanup_found.connect(self.show_cleanup)
+
+    def show_cleanup(self, path, groups):
+        if path != self.drive_path:
+            return
+        total = sum(group.disk_size for group in groups)
+        if groups:
+            self.cleanup_label.setText(
+                f"Можно освободить {self.proxy_model.format_size(total)}: "
+                f"отметьте группы или отдельные элементы")
+        else:
+            self.cleanup_label.setText("Кэшей, старых журналов и артефактов сборки не найдено")
+
+        self.cleanup_view.blockSignals(True)
+        self.cleanup_view.clear()
+        for group in groups:
+            title = f"{group.rule.name}: {len(group.items)}"
+            if len(group.items) > CLEANUP_ITEMS:
+                title += f" (показаны {CLEANUP_ITEMS} самых больших)"
+            item = QTreeWidgetItem(self.cleanup_view,
+                                   [title, self.proxy_model.format_size(group.disk_size)])
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable | Qt.ItemIsAutoTristate)
+            item.setCheckState(0, Qt.Unchecked)
+            for size, item_path in group.items[:CLEANUP_ITEMS]:
+                child = QTreeWidgetItem(item, [item_path, self.proxy_model.format_size(size)])
+                child.setData(0, Qt.UserRole, item_path)
+                child.setData(1, Qt.UserRole, size)
+                child.setCheckState(0, Qt.Unchecked)
+        self.cleanup_view.blockSignals(False)
+
+    def candidate_sizes(self):
+        return {
+            child.data(0, Qt.UserRole): child.data(1, Qt.UserRole)
+            for _, children in top_level_groups(self.cleanup_view)
+            for child in children
+        }
+
+    def prune_cleanup(self):
+        for group, children in list(top_level_groups(self.cleanup_view)):
+            for child in children:
+                if not os.path.lexists(child.data(0, Qt.UserRole)):
+                    group.removeChild(child)
+            if not group.childCount():
+                self.cleanup_view.takeTopLevelItem(self.cleanup_view.indexOfTopLevelItem(group))
+            else:
+                size = sum(group.child(i).data(1, Qt.UserRole) for i in range(group.childCount()))
+                group.setText(1, self.proxy_model.format_size(size))
+
+    def setup_duplicates_view(self):
+        page = QWidget()
+        layout = QVBoxLayout(page)
+        controls = QHBoxLayout()
+        self.duplicates_button = QPushButton("Найти дубликаты")
+        self.duplicates_button.clicked.connect(self.toggle_duplicates_search)
+        controls.addWidget(self.duplicates_button)
+        self.select_copies_button = QPushButton("Отметить лишние копии")
+        self.select_copies_button.setEnabled(False)
+        self.select_copies_button.clicked.connect(self.select_duplicate_copies)
+        controls.addWidget(self.select_copies_button)
+        self.duplicates_label = QLabel()
+        controls.addWidget(self.duplicates_label, 1)
+        layout.addLayout(controls)
+
+        self.duplicates_view = QTreeWidget()
+        self.duplicates_view.setHeaderLabels(["Одинаковые файлы", "Размер"])
+        self.duplicates_view.setColumnWidth(0, 600)
+        layout.addWidget(self.duplicates_view)
+        self.largest_tabs.addTab(page, "Дубликаты")
+
+        self.duplicates_view.itemChanged.connect(self.update_selection_count)
+        self.duplicates_view.itemActivated.connect(self.reveal_largest_item)
+        self.duplicate_finder = DuplicateService(parent=self)
+        self.duplicate_finder.progress.connect(self.duplicates_label.setText)
+        self.duplicate_finder.finished.connect(self.show_duplicates)
+
+    def toggle_duplicates_search(self):
+        if self.duplicate_finder.is_running():
+            self.duplicate_finder.cancel()
+            self.duplicates_button.setEnabled(False)
+            return
+        self.duplicates_view.clear()
+        self.select_copies_button.setEnabled(False)
+        self.duplicate_finder.start(self.drive_path)
+        self.duplicates_button.setText("Остановить")
+        self.update_selection_count()
+
+    def show_duplicates(self, path, groups, cancelled):
+        self.duplicates_button.setText("Найти дубликаты")
+        self.duplicates_button.setEnabled(True)
+        if cancelled:
+            self.duplicates_label.setText("Поиск остановлен")
+            return
+
+        wasted = sum(group.wasted for group in groups)
+        self.duplicates_label.setText(
+            f"Групп: {len(groups)}, лишние копии занимают {self.proxy_model.format_size(wasted)}")
+        # Отметки выставляются при построении: itemChanged на каждую не нужен
+        self.duplicates_view.blockSignals(True)
+        for group in groups[:DUPLICATE_GROUPS]:
+            item = QTreeWidgetItem(self.duplicates_view, [
+                f"{len(group.paths)} копии по {self.proxy_model.format_size(group.size)}",
+                f"лишние {self.proxy_model.format_size(group.wasted)}"])
+            for item_path in group.paths:
+                child = QTreeWidgetItem(item, [item_path, self.proxy_model.format_size(group.disk_size)])
+                child.setData(0, Qt.UserRole, item_path)
+                child.setCheckState(0, Qt.Unchecked)
+        self.duplicates_view.blockSignals(False)
+        self.select_copies_button.setEnabled(bool(groups))
+
+    def duplicate_groups(self):
+        return top_level_groups(self.duplicates_view)
+
+    def select_duplicate_copies(self):
+        # В каждой группе остаётся первая копия, остальные отмечаются к удалению
+        self.duplicates_view.blockSignals(True)
+        for _, children in self.duplicate_groups():
+            for i, child in enumerate(children):
+                child.setCheckState(0, Qt.Checked if i else Qt.Unchecked)
+        self.duplicates_view.blockSignals(False)
         self.update_selection_count()
 
+    def checked_duplicates(self):
+        return checked_paths(self.duplicates_view)
+
+    def all_copies_checked(self):
+        return any(
+            children and all(child.checkState(0) == Qt.Checked for child in children)
+            for _, children in self.duplicate_groups()
+        )
+
+    def prune_duplicates(self):
+        for group, children in list(self.duplicate_groups()):
+            for child in children:
+                if not os.path.lexists(child.data(0, Qt.UserRole)):
+                    group.removeChild(child)
+            if group.childCount() < 2:
+                self.duplicates_view.takeTopLevelItem(
+                    self.duplicates_view.indexOfTopLevelItem(group))
+
+    def show_largest(self, path, files, dirs):
+        if path != self.drive_path:
+            return
+        for group, items in ((self.largest_files, files), (self.largest_dirs, dirs)):
+            group.takeChildren()
+            group.setText(1, "")
+            for size, item_path in items:
+                child = QTreeWidgetItem(group, [item_path, self.proxy_model.format_size(size)])
+                child.setData(0, Qt.UserRole, item_path)
+            group.setExpanded(True)
+        # Дерево диска уже посчитано поиском: карта строится по нему же
+        self.proxy_model.calculator.build_treemap(self.drive_path)
+
+    def show_treemap(self, path, tree):
+        if path == self.drive_path:
+            self.treemap.set_tree(tree)
+
+    def prune_largest(self):
+        for group in (self.largest_files, self.largest_dirs):
+            for i in reversed(range(group.childCount())):
+                if not os.path.lexists(group.child(i).data(0, Qt.UserRole)):
+                    group.removeChild(group.child(i))
+
+    def reveal_largest_item(self, item):
+        path = item.data(0, Qt.UserRole)
+        if path:
+            self.reveal_path(path)
+
+    def reveal_path(self, path):
+        index = self.proxy_model.to_view(self.file_model.index(path))
+        if index.isValid():
+            self.ui.treeView.scrollTo(index)
+            self.ui.treeView.setCurrentIndex(index)
+
     def update_selection_count(self):
         selected = self.get_unique_selected_files()
         self.ui.label.setText(f"Выбрано элементов: {len(selected)}")
@@ -84,10 +311,10 @@ class DiskCleanupDialog(QDialog):
     def get_unique_selected_files(self):
         selected = self.ui.treeView.selectionModel().selectedIndexes()
         return {
-            self.proxy_model.mapToSource(index).data(QFileSystemModel.FilePathRole)
+            self.proxy_model.from_view(index).data(QFileSystemModel.FilePathRole)
             for index in selected
             if index.column() == 0
-        }
+        } | self.checked_duplicates() | checked_paths(self.cleanup_view)
 
     def delete_selected(self):
         selected_files = self.get_unique_selected_files()
@@ -95,18 +322,28 @@ class DiskCleanupDialog(QDialog):
             QMessageBox.warning(self, "Ошибка", "Ничего не выбрано для удаления")
             return
 
+        if self.all_copies_checked():
+            reply = QMessageBox.question(
+                self, "Подтверждение",
+                "В некоторых группах дубликатов отмечены все копии. Удалить их все?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                return
+
         total_size = self.calculate_total_size(selected_files)
 
         if not self.confirm_deletion(len(selected_files), total_size):
             return
 
-        deleted_count, errors = self.perform_deletion(selected_files)
-        self.handle_deletion_result(deleted_count, errors)
+        self.perform_deletion(selected_files)
 
     def calculate_total_size(self, files):
+        # Размеры кандидатов на очистку уже посчитаны обходом
+        candidates = self.candidate_sizes()
         return sum(
+            candidates[f] if f in candidates else
             os.path.getsize(f) if os.path.isfile(f) else
-            self.proxy_model.size_cache.get(f, 0)
+            max(self.proxy_model.size_cache.get(f, 0), 0)
             for f in files
         )
 
@@ -121,31 +358,54 @@ class DiskCleanupDialog(QDialog):
         return reply == QMessageBox.Yes
 
     def perform_deletion(self, files):
-        errors = []
-        deleted_count = 0
-
-        for file_path in files:
-            try:
-                if os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
-                else:
-                    os.remove(file_path)
-                deleted_count += 1
-            except Exception as e:
-                errors.append(f"{file_path}: {str(e)}")
-
-        return deleted_count, errors
-
-    def handle_deletion_result(self, deleted_count, errors):
+        # Удаление идёт в фоне; итоги приходят сигналами DeleteService
+        if not self.deleter.start(files):
+            QMessageBox.warning(self, "Ошибка", "Предыдущее удаление ещё не завершено")
+            return
+        self.deleted_count = 0
+        self.ui.pushButton.setEnabled(False)
+        self.delete_progress = QProgressDialog("Удаление...", "Отмена", 0, 0, self)
+        self.delete_progress.setWindowTitle("Удаление")
+        self.delete_progress.setMinimumDuration(0)
+        self.delete_progress.canceled.connect(self.deleter.cancel)
+        self.delete_progress.show()
+
+    def on_delete_progress(self, files, disk_size):
+        if self.delete_progress is not None:
+            self.delete_progress.setLabelText(
+                f"Удалено файлов: {files}, освобождено {self.proxy_model.format_size(disk_size)}")
+
+    def on_path_deleted(self, path, disk_size, complete):
+        self.proxy_model.forget_deleted(path, disk_size, complete)
+        if complete:
+            self.deleted_count += 1
+
+    def on_delete_finished(self, files, disk_size, errors, cancelled):
+        if self.delete_progress is not None:
+            self.delete_progress.canceled.disconnect(self.deleter.cancel)
+            self.delete_progress.close()
+            self.delete_progress = None
+        self.handle_deletion_result(self.deleted_count, errors, disk_size, cancelled)
+
+    def handle_deletion_result(self, deleted_count, errors, disk_size, cancelled):
         if errors:
             self.show_errors(errors)
 
-        if deleted_count > 0:
-            self.file_model.setRootPath(self.drive_path)
-            QMessageBox.information(
-                self, "Готово",
-                f"Успешно удалено {deleted_count} элементов")
-            self.update_selection_count()
+        if deleted_count > 0 or disk_size > 0:
+            self.prune_largest()
+            self.prune_cleanup()
+            self.prune_duplicates()
+            self.proxy_model.calculator.build_treemap(self.drive_path)
+            freed = self.proxy_model.format_size(disk_size)
+            if cancelled:
+                QMessageBox.information(
+                    self, "Готово",
+                    f"Удаление отменено. Удалено {deleted_count} элементов, освобождено {freed}")
+            else:
+                QMessageBox.information(
+                    self, "Готово",
+                    f"Успешно удалено {deleted_count} элементов, освобождено {freed}")
+        self.update_selection_count()
 
     def show_errors(self, errors):
         error_msg = "\n".join(errors[:10])
@@ -153,11 +413,21 @@ class DiskCleanupDialog(QDialog):
             error_msg += f"\n\n...и ещё {len(errors)-10} ошибок"
         QMessageBox.critical(self, "Ошибки", f"Не удалось удалить:\n{error_msg}")
 
-    def safe_stop_calculator(self):
-        if hasattr(self.proxy_model, 'calculator'):
-            self.proxy_model.calculator.stop(500)
+    def release_calculator(self):
+        # Поток обхода общий с главным окном: он не останавливается, только прерывается
+        # поиск самых больших и отключаются сигналы этого окна
+        calculator = self.proxy_model.running_calculator()
+        if calculator is not None:
+            calculator.cancel_largest()
+            worker = calculator.worker
+            worker.largest_found.disconnect(self.show_largest)
+            worker.cleanup_found.disconnect(self.show_cleanup)
+            worker.treemap_ready.disconnect(self.show_treemap)
+        self.proxy_model.release_calculator()
 
     def closeEvent(self, event):
-        self.safe_stop_calculator()
+        self.deleter.stop(1.0)
+        self.duplicate_finder.stop(1.0)
+        self.release_calculator()
         self.dialog_finished.emit()
         super().closeEvent(event)
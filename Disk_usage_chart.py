@@ -0,0 +1,32 @@
+from PySide6.QtCore import Qt
+from PySide6.QtCharts import QChart, QChartView, QPieSeries
+from PySide6.QtGui import QPainter, QColor
+from Mount_usage import usage_color
+
+
+class DiskUsageChart(QChartView):
+    def __init__(self, mount_usage, parent=None):
+        super().__init__(parent)
+        self.mount_usage = mount_usage
+        self.chart = QChart()
+        self.chart.setTitle("Использование дисков")
+        self.setChart(self.chart)
+        self.setRenderHint(QPainter.Antialiasing)
+        self.series = QPieSeries()
+        self.chart.addSeries(self.series)
+        self.chart.legend().setVisible(True)
+
+    def update_chart(self, drives):
+        self.series.clear()
+
+        for drive in drives:
+            usage = self.mount_usage.get(drive)
+            if usage is None or not usage.total:
+                continue
+
+            label = f"{drive} ({usage.percent}%)"
+            if usage.stale:
+                label += " — нет ответа"
+            slice_ = self.series.append(label, usage.percent)
+            slice_.setColor(QColor(Qt.gray) if usage.stale else usage_color(usage.percent))
+            slice_.setLabelVisible(True)
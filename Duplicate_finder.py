@@ -0,0 +1,209 @@
+import hashlib
+import mmap
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtCore import QObject, Signal, QTimer
+from Scan_engine import allocated_size, scan_tree
+
+# Второй этап читает столько байт с начала и с конца файла; файл не больше двух таких
+# кусков прочитан целиком, и третий этап ему не нужен
+PARTIAL_BYTES = 64 * 1024
+# Полный хеш считается по отображённому в память файлу кусками: между ними проверяется отмена
+FULL_CHUNK = 16 * 1024 * 1024
+
+# wasted — сколько места освободится, если оставить одну копию
+DuplicateGroup = namedtuple('DuplicateGroup', ['size', 'disk_size', 'wasted', 'paths'])
+
+
+class SizeGroups:
+    # Первый этап: on_file для scan_tree, файлы группируются по размеру. Для размера,
+    # встреченного один раз, хранится один кортеж, список заводится со второго файла.
+    # Жёсткие ссылки на уже засчитанный inode scan_tree сюда не передаёт
+    def __init__(self, min_size=1):
+        self.min_size = min_size
+        self.files = 0
+        self._first = {}
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def on_file(self, entry, st):
+        size = st.st_size
+        if size < self.min_size:
+            return
+        item = (entry.path, allocated_size(st))
+        with self._lock:
+            self.files += 1
+            group = self._groups.get(size)
+            if group is not None:
+                group.append(item)
+                return
+            first = self._first.setdefault(size, item)
+            if first is not item:
+                self._groups[size] = [first, item]
+
+    def candidates(self):
+        return self._groups
+
+
+def partial_hash(path, size):
+    with open(path, 'rb') as f:
+        digest = hashlib.blake2b(f.read(PARTIAL_BYTES), digest_size=16)
+        if size > 2 * PARTIAL_BYTES:
+            f.seek(-PARTIAL_BYTES, os.SEEK_END)
+        digest.update(f.read(PARTIAL_BYTES))
+    return digest.digest()
+
+
+def full_hash(path, should_stop):
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return digest.digest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, 'madvise'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, size, FULL_CHUNK):
+                    if should_stop():
+                        return None
+                    # hashlib отпускает GIL на больших буферах: потоки хешируют параллельно
+                    digest.update(view[offset:offset + FULL_CHUNK])
+            finally:
+                view.release()
+    return digest.digest()
+
+
+def regroup(executor, groups, digest_of, should_stop):
+    # groups: {ключ: [(путь, занято на диске)]}. Ключ дополняется хешем, группы из одного
+    # файла отбрасываются. Файлы, которые не удалось прочитать, выпадают из выдачи
+    def task(key, item):
+        if should_stop():
+            return None
+        try:
+            return digest_of(item[0], key[0])
+        except (OSError, ValueError):
+            return None
+
+    items = [(key, item) for key, files in groups.items() for item in files]
+    result = {}
+    for (key, item), digest in zip(items, executor.map(lambda ki: task(*ki), items)):
+        if digest is not None:
+            result.setdefault(key + (digest,), []).append(item)
+    return {key: files for key, files in result.items() if len(files) > 1}
+
+
+def find_duplicates(candidates, workers=4, should_stop=None, progress=None):
+    # candidates: {размер: [(путь, занято на диске)]} из SizeGroups.
+    # Каждый этап оставляет следующему только файлы, у которых ещё есть пара.
+    # progress(этап, число файлов на этапе) вызывается перед вторым и третьим этапом
+    if should_stop is None:
+        should_stop = lambda: False
+    groups = {(size,): files for size, files in candidates.items() if len(files) > 1}
+
+    with ThreadPoolExecutor(workers) as executor:
+        if progress is not None:
+            progress(2, sum(len(files) for files in groups.values()))
+        groups = regroup(executor, groups, partial_hash, should_stop)
+
+        small = {key: files for key, files in groups.items() if key[0] <= 2 * PARTIAL_BYTES}
+        large = {key: files for key, files in groups.items() if key[0] > 2 * PARTIAL_BYTES}
+        if progress is not None:
+            progress(3, sum(len(files) for files in large.values()))
+        large = regroup(executor, large, lambda path, size: full_hash(path, should_stop),
+                        should_stop)
+
+    if should_stop():
+        return []
+    result = []
+    for key, files in list(small.items()) + list(large.items()):
+        disk_size = max(disk for _, disk in files)
+        result.append(DuplicateGroup(key[0], disk_size, disk_size * (len(files) - 1),
+                                     sorted(path for path, _ in files)))
+    result.sort(key=lambda group: group.wasted, reverse=True)
+    return result
+
+
+class DuplicateService(QObject):
+    # Поиск в фоновом потоке, независимо от ThreadCalculator: хеширование может идти
+    # минутами и не должно задерживать размеры каталогов. Как и у DeleteService,
+    # состояние забирается таймером и сигналы испускаются в потоке интерфейса
+    progress = Signal(str)
+    finished = Signal(str, list, bool)
+
+    def __init__(self, workers=None, min_size=1, cross_devices=False, parent=None):
+        super().__init__(parent)
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.min_size = min_size
+        self.cross_devices = cross_devices
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = None
+        self._result = None
+
+        self._collect_timer = QTimer(self)
+        self._collect_timer.setInterval(200)
+        self._collect_timer.timeout.connect(self.collect)
+
+    def is_running(self):
+        return self._thread is not None
+
+    def start(self, path):
+        if self.is_running():
+            return False
+        self._cancel.clear()
+        self._status = None
+        self._result = None
+        self._thread = threading.Thread(target=self._run, args=(path,), daemon=True)
+        self._thread.start()
+        self._collect_timer.start()
+        return True
+
+    def cancel(self):
+        self._cancel.set()
+
+    def stop(self, timeout=None):
+        self.cancel()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _set_status(self, text):
+        with self._lock:
+            self._status = text
+
+    def _run(self, path):
+        groups = []
+        try:
+            sizes = SizeGroups(self.min_size)
+            self._set_status("Этап 1 из 3: поиск файлов одного размера...")
+            tree = scan_tree(path, should_stop=self._cancel.is_set, workers=self.workers,
+                             on_file=sizes.on_file, cross_devices=self.cross_devices)
+            if tree.complete:
+                stages = {
+                    2: "Этап 2 из 3: сравнение начала и конца {} файлов...",
+                    3: "Этап 3 из 3: полное сравнение {} файлов...",
+                }
+                groups = find_duplicates(
+                    sizes.candidates(), self.workers, self._cancel.is_set,
+                    lambda stage, count: self._set_status(stages[stage].format(count)))
+        except Exception as e:
+            print(f"Ошибка при поиске дубликатов в {path}: {str(e)}")
+        with self._lock:
+            self._result = (path, groups, self._cancel.is_set())
+
+    def collect(self):
+        with self._lock:
+            status = self._status
+            self._status = None
+            result = self._result
+
+        if status is not None:
+            self.progress.emit(status)
+        if result is not None:
+            self._collect_timer.stop()
+            self._thread = None
+            self.finished.emit(*result)
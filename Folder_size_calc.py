@@ -1,40 +1,480 @@
 import os
-from PySide6.QtCore import QObject, Signal, QDir
+import sqlite3
+from PySide6.QtCore import QObject, Signal, QDir, Qt
+from Scan_engine import (ScanTree, scan_tree, refresh_directory, split_complete, ScanProgress,
+                         is_under)
+from Fs_watcher import FsWatcher
+from Top_items import TopItems, largest_dirs
+from Compact_tree import CompactTree
+from Scan_snapshot import save_snapshot, list_snapshots, diff_trees
+from Process_scan import ProcessScanPool
+from Scan_metrics import ScanMetrics
+from Cleanup_rules import CleanupCandidates
+
+SNAPSHOT_DIFF_LIMIT = 100
 
 class Folder_size_calc(QObject):
-    calculated = Signal(str, str)
+    calculated = Signal(str, 'qint64', 'qint64')
+    # Каталоги, исчезнувшие из посчитанных деревьев: их размеры и размеры внутри больше не верны
+    removed = Signal(list)
+    progress = Signal(str, str)
+    largest_found = Signal(str, list, list)
+    cleanup_found = Signal(str, list)
+    snapshot_saved = Signal(str, str)
+    snapshot_compared = Signal(str, str, list)
+    snapshot_failed = Signal(str, str)
+    treemap_ready = Signal(str, object)
+    resume = Signal()
 
-    def __init__(self):
+    def __init__(self, workers=1, index=None, live=True, scheduler=None, cross_devices=False,
+                 backend='threads'):
         super().__init__()
+        self.workers = workers
+        self.cross_devices = cross_devices
+        self.backend = backend
+        self.pool = None
+        self.index = index
+        self.live = live
+        self.scheduler = scheduler
+        self.watcher = None
         self._active = True
-        self._current_path = None
+        self._trees = []
+        # Корни деревьев, за частью каталогов которых inotify не следит (лимит исчерпан)
+        self._unwatched = set()
+        self._partial = {}
+        self._aliases = {}
+        # Замеры всех обходов этого потока, читаются панелью в строке состояния
+        self.metrics = ScanMetrics()
+        # Меняется из потока интерфейса: поиск самых больших, начатый раньше, прерывается
+        self._largest_generation = 0
+        self.resume.connect(self.process_next, Qt.QueuedConnection)
+
+    def process_next(self):
+        if not self._active:
+            return
+        path = self.scheduler.take()
+        self.metrics.set_gauge('calculator_queue', self.scheduler.pending_count())
+        if path is None:
+            return
+        completed = False
+        try:
+            completed = self.calculate_size(path)
+        finally:
+            self.scheduler.finish(completed)
+        # Между задачами поток успевает обработать события inotify и таймеры
+        self.resume.emit()
+
+    def should_stop(self):
+        return not self._active or (self.scheduler is not None and self.scheduler.should_yield())
 
     def calculate_size(self, path):
         if not self._active or not path:
-            return
+            return False
 
-        self._current_path = path
         try:
-            total_size = 0
-
             real_path = os.path.realpath(path) if os.path.islink(path) else path
+            if real_path != path:
+                self._aliases.setdefault(os.path.normpath(real_path), set()).add(path)
+
+            sizes = self.find_sizes(real_path)
+            tree = None
+            if sizes is None:
+                known = self.load_index(path, real_path)
+                grafted = []
+                tree = self.scan(
+                    real_path,
+                    should_stop=self.should_stop,
+                    known=known,
+                    reuse=lambda p: self.reuse_partial(p, grafted),
+                    progress=ScanProgress(
+                        lambda size, disk_size, files: self.report_progress(path, disk_size, files)),
+                    links=self.partial_links(real_path))
+                if grafted:
+                    self._trees = [t for t in self._trees if t.root_path not in grafted]
 
-            for dirpath, _, filenames in os.walk(real_path):
-                if not self._active or self._current_path != path:
-                    return
-                for f in filenames:
-                    try:
-                        fp = os.path.join(dirpath, f)
-                        if not os.path.islink(fp):
-                            total_size += os.path.getsize(fp)
-                    except (OSError, PermissionError):
-                        continue
-
-            if self._active and self._current_path == path:
-                self.calculated.emit(path, self.format_size(total_size))
+                if not tree.complete:
+                    self.keep_partial(tree)
+                    return False
+                self.add_tree(tree)
+                self.save_index(tree)
+                sizes = (tree.root.disk_size, tree.root.raw_disk, tree.root.files)
+
+            if self._active:
+                self.metrics.mark_first_result()
+                self.calculated.emit(path, sizes[0], sizes[1])
+            # Наблюдение ставится на каждый каталог отдельно и не задерживает размер
+            if tree is not None:
+                self.watch_tree(tree)
+            return True
         except Exception as e:
             print(f"Ошибка при расчете размера для {path}: {str(e)}")
-            self.calculated.emit(path, "Ошибка")
+            self.calculated.emit(path, -1, -1)
+            return True
+
+    def scan(self, path, should_stop=None, known=None, reuse=None, progress=None, links=None):
+        if self.backend == 'processes' and self.pool is None:
+            try:
+                self.pool = ProcessScanPool(self.workers)
+            except OSError as e:
+                print(f"Пул процессов недоступен, обход в потоках: {str(e)}")
+                self.backend = 'threads'
+
+        if self.backend == 'processes':
+            index_path = self.index.path if self.index is not None else None
+            return self.pool.scan_tree(path, should_stop, known, reuse, progress, links,
+                                       self.cross_devices, index_path, self.metrics)
+        return scan_tree(path, should_stop, self.workers, known, reuse, progress,
+                         links=links, cross_devices=self.cross_devices, metrics=self.metrics)
+
+    def find_largest(self, path, n):
+        # Один обход даёт и самые большие файлы/каталоги, и кандидатов на очистку по правилам,
+        # и дерево для размеров строк. on_file в другой процесс не передать,
+        # поэтому здесь всегда потоки
+        if not self._active or not path:
+            return
+        generation = self._largest_generation
+        try:
+            top_files = TopItems(n)
+            cleanup = CleanupCandidates()
+
+            def on_file(entry, st):
+                top_files.on_file(entry, st)
+                cleanup.on_file(entry, st)
+
+            tree = scan_tree(
+                path,
+                should_stop=lambda: not self._active or self._largest_generation != generation,
+                workers=self.workers,
+                progress=ScanProgress(
+                    lambda size, disk_size, files: self.report_progress(path, disk_size, files)),
+                on_file=on_file,
+                cross_devices=self.cross_devices,
+                metrics=self.metrics)
+            if not tree.complete:
+                return
+            self.add_tree(tree)
+            self.save_index(tree)
+            self.emit_size(tree.root_path, tree.root)
+            self.largest_found.emit(path, top_files.items(), largest_dirs(tree, n))
+            self.cleanup_found.emit(path, cleanup.groups(tree))
+            self.watch_tree(tree)
+        except Exception as e:
+            print(f"Ошибка при поиске самых больших элементов в {path}: {str(e)}")
+
+    def cancel_largest(self):
+        self._largest_generation += 1
+
+    def forget_trees(self):
+        # Посчитанное без отслеживания изменений могло устареть: всё считается заново
+        self._trees = []
+        self._partial.clear()
+
+    def current_tree(self, path):
+        # Посчитанное дерево актуально, только пока за ним следит inotify;
+        # иначе корень обходится заново
+        node = self.find_node(path) if self.is_watched(path) else None
+        if node is not None:
+            return ScanTree(path, node)
+        tree = self.scan(
+            path,
+            should_stop=lambda: not self._active,
+            progress=ScanProgress(
+                lambda size, disk_size, files: self.report_progress(path, disk_size, files)))
+        if not tree.complete:
+            return None
+        self.add_tree(tree)
+        self.save_index(tree)
+        self.emit_size(tree.root_path, tree.root)
+        self.watch_tree(tree)
+        return tree
+
+    def save_snapshot(self, path):
+        if not self._active or not path:
+            return
+        try:
+            tree = self.current_tree(os.path.realpath(path))
+            if tree is not None:
+                self.snapshot_saved.emit(path, save_snapshot(tree))
+        except (OSError, ValueError) as e:
+            print(f"Ошибка при сохранении снимка {path}: {str(e)}")
+            self.snapshot_failed.emit(path, str(e))
+
+    def compare_snapshot(self, path):
+        # Текущее состояние сравнивается с последним сохранённым снимком того же корня
+        if not self._active or not path:
+            return
+        try:
+            real_path = os.path.realpath(path)
+            snapshots = list_snapshots(real_path)
+            if not snapshots:
+                self.snapshot_failed.emit(path, "Для этого каталога ещё нет снимков")
+                return
+            old = CompactTree.load(snapshots[-1])
+            tree = self.current_tree(real_path)
+            if tree is None:
+                return
+            entries = diff_trees(old, CompactTree.from_scan_tree(tree), SNAPSHOT_DIFF_LIMIT)
+            self.snapshot_compared.emit(path, snapshots[-1], entries)
+        except (OSError, ValueError, EOFError) as e:
+            print(f"Ошибка при сравнении со снимком {path}: {str(e)}")
+            self.snapshot_failed.emit(path, str(e))
+
+    def build_treemap(self, path):
+        # Карта строится по снимку дерева в массивах: его можно отдать в поток интерфейса,
+        # пока обход продолжает менять свои DirNode
+        if not self._active or not path:
+            return
+        try:
+            # Карта показывает последний обход, даже если за ним не следит inotify:
+            # заново обходить ради неё весь диск слишком дорого
+            real_path = os.path.realpath(path)
+            tree = self.find_tree(real_path)
+            if isinstance(tree, CompactTree) and tree.find(real_path) is not None:
+                self.treemap_ready.emit(path, tree.subtree(tree.find(real_path)))
+                return
+            node = self.find_node(real_path)
+            tree = ScanTree(real_path, node) if node is not None else self.current_tree(real_path)
+            if tree is not None:
+                self.treemap_ready.emit(path, CompactTree.from_scan_tree(tree))
+        except OSError as e:
+            print(f"Ошибка при построении карты {path}: {str(e)}")
+
+    def report_progress(self, path, disk_size, files):
+        if self._active:
+            self.progress.emit(path, f"≈ {self.format_size(disk_size)} ({files} файлов)...")
+
+    def reuse_partial(self, path, grafted):
+        tree = self._partial.pop(path, None)
+        if tree is None:
+            return None
+        grafted.append(tree.root_path)
+        return tree.root
+
+    def partial_links(self, path):
+        # Прерванный обход того же корня уже засчитал часть жёстких ссылок:
+        # его поддеревья будут подставлены, поэтому учёт продолжается в том же HardLinks
+        for partial_path, tree in self._partial.items():
+            if partial_path == path or is_under(partial_path, path):
+                return tree.links
+        return None
+
+    def keep_partial(self, tree):
+        # Прерванный обход не выбрасывается: законченные поддеревья сразу отвечают
+        # на запросы и подставляются в следующий обход того же корня
+        for subtree in split_complete(tree):
+            self.add_tree(subtree)
+            self._partial[subtree.root_path] = subtree
+            self.save_index(subtree)
+            self.watch_tree(subtree)
+
+    def load_index(self, path, real_path):
+        if self.index is None:
+            return None
+        try:
+            # Сначала показываем размер из прошлого запуска, затем уточняем
+            cached = self.index.cached_size(real_path)
+            if cached is not None:
+                self.metrics.mark_first_result()
+                self.calculated.emit(path, cached[1], cached[1])
+            return self.index.load(real_path)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Индекс размеров недоступен: {str(e)}")
+            self.index = None
+            return None
+
+    def save_index(self, tree):
+        if self.index is None:
+            return
+        try:
+            self.index.save(tree)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Не удалось сохранить индекс размеров: {str(e)}")
+
+    def find_node(self, path):
+        # Узел DirNode только у деревьев, за которыми следит inotify
+        for tree in self._trees:
+            if isinstance(tree, ScanTree) and tree.contains(path):
+                node = tree.find(path)
+                if node is not None:
+                    return node
+        return None
+
+    def find_sizes(self, path):
+        # (занято, занято со всеми жёсткими ссылками, файлов) по любому посчитанному дереву
+        for tree in self._trees:
+            if not tree.contains(path):
+                continue
+            node = tree.find(path)
+            if node is None:
+                continue
+            if isinstance(tree, CompactTree):
+                return tree.disk_size[node], tree.raw_disk_of(node), tree.files[node]
+            return node.disk_size, node.raw_disk, node.files
+        return None
+
+    def find_tree(self, path):
+        for tree in self._trees:
+            if tree.contains(path):
+                return tree
+        return None
+
+    def add_tree(self, tree):
+        # Уже просчитанные поддеревья нового корня больше не нужны
+        self._trees = [t for t in self._trees if not tree.contains(t.root_path)]
+        self._trees.append(tree)
+        for path in [p for p in self._partial if tree.contains(p) and p != tree.root_path]:
+            del self._partial[path]
+        self._unwatched.discard(tree.root_path)
+
+    def is_watched(self, path):
+        # Дереву можно верить без перечитывания, только если inotify следит за всеми его каталогами
+        tree = self.find_tree(path)
+        return (self.watcher is not None and tree is not None
+                and tree.root_path not in self._unwatched)
+
+    def fully_watched(self):
+        return self.watcher is not None and not any(
+            tree.root_path in self._unwatched for tree in self._trees)
+
+    def watch_tree(self, tree, node=None):
+        if not self.live:
+            self.compact_tree(tree)
+            return
+        if self.watcher is None:
+            try:
+                self.watcher = FsWatcher(parent=self)
+            except OSError as e:
+                print(f"Отслеживание изменений недоступно: {str(e)}")
+                self.live = False
+                self.compact_tree(tree)
+                return
+            self.watcher.changed.connect(self.apply_changes)
+            self.watcher.overflowed.connect(self.resync_trees)
+
+        for path, _ in tree.walk(node):
+            if not self.watcher.watch(path) and self.watcher.exhausted:
+                # Уже поставленное наблюдение бесполезно: дерево всё равно не актуально.
+                # Освобождённые наблюдения достанутся следующим деревьям
+                self.watcher.unwatch_tree(tree.root_path)
+                self.compact_tree(tree)
+                return
+
+    def compact_tree(self, tree):
+        # Дерево без inotify уже не меняется на месте: вместо DirNode на каждый каталог
+        # оно хранится в массивах CompactTree. Такие деревья и бывают самыми большими —
+        # на них заканчивается лимит наблюдений
+        # Прерванные обходы остаются в DirNode: их поддеревья подставляются в следующий обход
+        self._unwatched.add(tree.root_path)
+        if tree in self._trees and tree.root_path not in self._partial:
+            self._trees[self._trees.index(tree)] = CompactTree.from_scan_tree(tree)
+
+    def apply_changes(self, paths, gone):
+        affected = {}
+        added_roots = []
+        removed_paths = []
+
+        # Удалённый или перемещённый каталог отцепляется целиком; если на его месте уже
+        # создан новый, его найдёт перечитывание родителя ниже
+        for path in gone:
+            tree = self.find_tree(path)
+            node = tree.find(path) if isinstance(tree, ScanTree) else None
+            if node is None:
+                continue
+            removed_paths.append(path)
+            if node is tree.root:
+                self._trees.remove(tree)
+                continue
+            parent = node.parent
+            node.detach()
+            for changed in tree.add_delta(parent, -node.size, -node.disk_size, -node.files,
+                                          -node.raw_disk):
+                affected[id(changed)] = (tree, changed)
+
+        for path in paths:
+            tree = self.find_tree(path)
+            node = tree.find(path) if isinstance(tree, ScanTree) else None
+            if node is None:
+                continue
+
+            nodes, added, removed = refresh_directory(tree, node)
+            for removed_path in removed:
+                self.watcher.unwatch_tree(removed_path)
+            removed_paths.extend(removed)
+            if node is tree.root and tree.root_path in removed:
+                self._trees.remove(tree)
+                continue
+            for added_path in added:
+                subtree = tree.find(added_path)
+                self.watch_tree(tree, subtree)
+                added_roots.append((tree, subtree))
+            for changed in nodes:
+                affected[id(changed)] = (tree, changed)
+
+        if removed_paths:
+            self.removed.emit(removed_paths)
+        for tree, node in added_roots:
+            if node.parent is not None:
+                self.emit_size(tree.path_of(node), node)
+        for tree, node in affected.values():
+            if node.parent is not None or node is tree.root:
+                self.emit_size(tree.path_of(node), node)
+
+    def forget_deleted(self, path):
+        # С inotify дерево поправят события. Без него родитель удалённого перечитывается
+        # сразу: refresh_directory уберёт исчезнувший каталог и пересчитает файлы, а
+        # оставшийся после отмены каталог отцепляется и будет обойден заново
+        if self.is_watched(path) or not self._active:
+            return
+        path = os.path.normpath(path)
+        tree = self.find_tree(path)
+        if tree is None:
+            return
+        if isinstance(tree, CompactTree):
+            # Массивы не перестраиваются: каталоги этого дерева будут обойдены заново
+            self._trees.remove(tree)
+            return
+        node = tree.find(path)
+        if node is tree.root:
+            self._trees.remove(tree)
+            return
+        parent = tree.find(os.path.dirname(path))
+        if parent is None:
+            return
+        if node is not None and os.path.isdir(path):
+            tree.add_delta(parent, -node.size, -node.disk_size, -node.files, -node.raw_disk)
+            node.detach()
+        for changed in refresh_directory(tree, parent)[0]:
+            self.emit_size(tree.path_of(changed), changed)
+
+    def resync_trees(self):
+        # Очередь inotify переполнилась: события потеряны, деревья сверяются заново по mtime
+        print("Очередь inotify переполнена, размеры пересчитываются")
+        for tree in [t for t in self._trees if isinstance(t, ScanTree)]:
+            old_sizes = {path: (node.disk_size, node.raw_disk) for path, node in tree.walk()}
+            fresh = self.scan(tree.root_path, known=tree.as_known(), links=tree.links)
+            self._trees.remove(tree)
+            self.watcher.unwatch_tree(tree.root_path)
+            self.add_tree(fresh)
+            self.save_index(fresh)
+            for path, node in fresh.walk():
+                if old_sizes.get(path) != (node.disk_size, node.raw_disk):
+                    self.emit_size(path, node)
+            self.watch_tree(fresh)
+
+    def emit_size(self, path, node):
+        self.calculated.emit(path, node.disk_size, node.raw_disk)
+        for alias in self._aliases.get(path, ()):
+            self.calculated.emit(alias, node.disk_size, node.raw_disk)
+
+    def close_watcher(self):
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
 
     def format_size(self, bytes):
         for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
@@ -45,4 +485,3 @@ class Folder_size_calc(QObject):
 
     def stop(self):
         self._active = False
-        self._current_path = None
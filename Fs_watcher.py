@@ -0,0 +1,166 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+from PySide6.QtCore import QObject, Signal, QSocketNotifier, QThread, QTimer
+
+IN_MODIFY = 0x00000002
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+
+_EVENT = struct.Struct('iIII')
+
+
+class Inotify:
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError(errno.ENOSYS, "libc не найдена")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify не поддерживается")
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class FsWatcher(QObject):
+    # Каталоги с изменениями и отслеживаемые каталоги, которые сами удалены или перемещены
+    changed = Signal(list, list)
+    overflowed = Signal()
+
+    def __init__(self, delay=200, parent=None):
+        super().__init__(parent)
+        self._inotify = Inotify()
+        self._paths = {}
+        self._wds = {}
+        self._dirty = set()
+        self._gone = set()
+        self._exhausted = False
+
+        self._notifier = QSocketNotifier(self._inotify.fd, QSocketNotifier.Read, self)
+        self._notifier.activated.connect(self._read_events)
+
+        # События копятся delay мс и уходят одной пачкой каталогов
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self._flush)
+
+    def watch(self, path):
+        if self._exhausted or path in self._wds:
+            return path in self._wds
+        try:
+            wd = self._inotify.add_watch(path)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                self._exhausted = True
+                print("Достигнут лимит fs.inotify.max_user_watches, "
+                      "часть каталогов не отслеживается")
+            return False
+        self._paths[wd] = path
+        self._wds[path] = wd
+        return True
+
+    @property
+    def exhausted(self):
+        # Лимит inotify исчерпан: новые каталоги больше не отслеживаются
+        return self._exhausted
+
+    def unwatch_tree(self, path):
+        prefix = path.rstrip(os.sep) + os.sep
+        for watched in [p for p in self._wds if p == path or p.startswith(prefix)]:
+            wd = self._wds.pop(watched)
+            self._paths.pop(wd, None)
+            self._inotify.rm_watch(wd)
+
+    def _read_events(self):
+        for wd, mask, name in self._inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                self._dirty.clear()
+                self._gone.clear()
+                self.overflowed.emit()
+                continue
+
+            path = self._paths.get(wd)
+            if path is None:
+                continue
+
+            if mask & IN_IGNORED:
+                self._paths.pop(wd, None)
+                self._wds.pop(path, None)
+                continue
+
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # На том же месте мог появиться новый каталог с тем же именем:
+                # прежний узел дерева ему не подходит
+                self._gone.add(path)
+                self._dirty.add(os.path.dirname(path))
+                self.unwatch_tree(path)
+            else:
+                self._dirty.add(path)
+
+        if (self._dirty or self._gone) and not self._timer.isActive():
+            self._timer.start()
+
+    def _flush(self):
+        paths = sorted(self._dirty)
+        gone = sorted(self._gone)
+        self._dirty.clear()
+        self._gone.clear()
+        if paths or gone:
+            self.changed.emit(paths, gone)
+
+    def close(self):
+        # Нотификатор трогаем только из его потока; после остановки потока достаточно закрыть fd
+        if QThread.currentThread() == self.thread():
+            self._notifier.setEnabled(False)
+            self._timer.stop()
+        self._inotify.close()
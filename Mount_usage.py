@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from PySide6.QtCore import QObject, Signal, QTimer
+from PySide6.QtGui import QColor
+
+MountUsage = namedtuple('MountUsage', ['total', 'used', 'free', 'percent', 'stale'])
+
+
+def read_usage(path):
+    # Те же формулы, что у psutil.disk_usage
+    st = os.statvfs(path)
+    total = st.f_blocks * st.f_frsize
+    free = st.f_bavail * st.f_frsize
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    total_user = used + free
+    percent = round(used / total_user * 100, 1) if total_user else 0.0
+    return MountUsage(total, used, free, percent, False)
+
+
+def usage_color(percent):
+    red = min(255, int(255 * (percent / 100)))
+    green = max(0, int(255 * (1 - percent / 100)))
+    return QColor(red, green, 0)
+
+
+class MountUsageService(QObject):
+    # statvfs выполняется в отдельных потоках, GUI читает только кэш.
+    # Точка монтирования, не ответившая за timeout секунд, помечается устаревшей;
+    # новый запрос к ней не отправляется, пока не вернётся предыдущий.
+    updated = Signal(str)
+
+    def __init__(self, mounts, interval=5000, timeout=2.0, parent=None):
+        super().__init__(parent)
+        self.mounts = list(mounts)
+        self.timeout = timeout
+        self._cache = {}
+        self._results = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+        self._poll_timer = QTimer(self)
+        self._poll_timer.setInterval(interval)
+        self._poll_timer.timeout.connect(self.poll)
+
+        self._collect_timer = QTimer(self)
+        self._collect_timer.setInterval(100)
+        self._collect_timer.timeout.connect(self.collect)
+
+    def start(self):
+        self.poll()
+        self._poll_timer.start()
+        self._collect_timer.start()
+
+    def stop(self):
+        self._poll_timer.stop()
+        self._collect_timer.stop()
+
+    def get(self, mount):
+        return self._cache.get(mount)
+
+    def refresh(self):
+        self.poll()
+
+    def poll(self):
+        now = time.monotonic()
+        with self._lock:
+            for mount in self.mounts:
+                if mount in self._in_flight:
+                    continue
+                self._in_flight[mount] = now
+                threading.Thread(target=self._probe, args=(mount,), daemon=True).start()
+
+    def _probe(self, mount):
+        try:
+            usage = read_usage(mount)
+        except OSError:
+            usage = None
+        with self._lock:
+            self._results[mount] = usage
+            self._in_flight.pop(mount, None)
+
+    def collect(self):
+        now = time.monotonic()
+        with self._lock:
+            results = self._results
+            self._results = {}
+            hung = [m for m, started in self._in_flight.items() if now - started > self.timeout]
+
+        for mount, usage in results.items():
+            if usage is None:
+                self._mark_stale(mount)
+            elif usage != self._cache.get(mount):
+                self._cache[mount] = usage
+                self.updated.emit(mount)
+
+        for mount in hung:
+            self._mark_stale(mount)
+
+    def _mark_stale(self, mount):
+        usage = self._cache.get(mount)
+        if usage is None:
+            usage = MountUsage(0, 0, 0, 0.0, True)
+        elif usage.stale:
+            return
+        self._cache[mount] = usage._replace(stale=True)
+        self.updated.emit(mount)
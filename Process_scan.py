@@ -0,0 +1,277 @@
+import multiprocessing
+import os
+import sqlite3
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from Scan_engine import HardLinks, ScanTree, allocated_size, scan_directory, scan_tree
+from Scan_metrics import ScanMetrics
+from Size_index import SizeIndex
+
+# Поддерево, пересылаемое из процесса одним объектом: узлы в прямом порядке обхода
+# (родитель раньше детей), поля — массивы, имена — одна строка байт через b'\0'
+PackedTree = namedtuple('PackedTree', [
+    'parent', 'names', 'own_size', 'own_disk', 'own_raw_disk', 'own_files', 'own_links',
+    'ino', 'mtime_ns'])
+
+PACKED_TYPES = {
+    'own_size': 'Q',
+    'own_disk': 'Q',
+    'own_raw_disk': 'Q',
+    'own_files': 'Q',
+    'own_links': 'Q',
+    'ino': 'Q',
+    'mtime_ns': 'q',
+}
+
+# Шардов в несколько раз больше процессов, чтобы одно крупное поддерево не держало остальных
+SHARDS_PER_WORKER = 4
+
+_generation = None
+
+
+class ShardLinks(HardLinks):
+    # Дополнительно запоминает засчитанные файлы: если один inode засчитан
+    # в двух процессах, при слиянии он остаётся только у первого шарда.
+    # Обход внутри процесса однопоточный, поэтому массивы пополняются без блокировки.
+    def __init__(self):
+        super().__init__()
+        self.dev = array('Q')
+        self.ino = array('Q')
+        self.size = array('Q')
+        self.disk = array('Q')
+        self.owner = array('I')
+        self._owner_index = {}
+
+    def claim(self, st, path, counted):
+        if not super().claim(st, path, counted):
+            return False
+        owner = self._owner_index.setdefault(path, len(self._owner_index))
+        self.dev.append(st.st_dev)
+        self.ino.append(st.st_ino)
+        self.size.append(st.st_size)
+        self.disk.append(allocated_size(st))
+        self.owner.append(owner)
+        return True
+
+    def export(self):
+        owners = b'\0'.join(os.fsencode(p) for p in self._owner_index)
+        return self.dev, self.ino, self.size, self.disk, self.owner, owners
+
+
+def pack_tree(tree):
+    parent = array('i')
+    names = []
+    fields = {name: array(typecode) for name, typecode in PACKED_TYPES.items()}
+    stack = [(tree.root, -1)]
+    while stack:
+        node, up = stack.pop()
+        index = len(parent)
+        parent.append(up)
+        names.append(os.fsencode(node.name) if up >= 0 else b'')
+        for name, values in fields.items():
+            values.append(getattr(node, name))
+        for child in node.children.values():
+            stack.append((child, index))
+    return PackedTree(parent, b'\0'.join(names), **fields)
+
+
+def unpack_into(node, packed):
+    # Узлы шарда подвешиваются под уже существующий node, который становится корнем шарда
+    names = packed.names.split(b'\0')
+    nodes = []
+    for i, up in enumerate(packed.parent):
+        current = node if up < 0 else nodes[up].add_child(os.fsdecode(names[i]))
+        current.own_size = packed.own_size[i]
+        current.own_disk = packed.own_disk[i]
+        current.own_raw_disk = packed.own_raw_disk[i]
+        current.own_files = packed.own_files[i]
+        current.own_links = packed.own_links[i]
+        current.ino = packed.ino[i]
+        current.mtime_ns = packed.mtime_ns[i]
+        current.scanned = True
+        nodes.append(current)
+
+
+def merge_links(tree, claims):
+    devs, inos, sizes, disks, owners, owner_paths = claims
+    if not devs:
+        return
+    paths = [os.fsdecode(p) for p in owner_paths.split(b'\0')]
+    for dev, ino, size, disk, owner in zip(devs, inos, sizes, disks, owners):
+        path = paths[owner]
+        if not tree.links.claim_key((dev << 64) | ino, path):
+            # Этот файл уже засчитан другому шарду или верхним уровням дерева
+            node = tree.find(path)
+            if node is not None:
+                node.own_size -= size
+                node.own_disk -= disk
+
+
+def _init_worker(generation):
+    global _generation
+    _generation = generation
+
+
+def scan_shard(path, generation, cross_devices, index_path, with_metrics=False):
+    # Выполняется в дочернем процессе. Индекс читается здесь же, чтобы не пересылать known;
+    # замеры возвращаются третьим элементом и сливаются в метрики родителя
+    known = None
+    if index_path is not None:
+        try:
+            known = SizeIndex(index_path).load(path)
+        except (sqlite3.Error, OSError):
+            known = None
+
+    links = ShardLinks()
+    metrics = ScanMetrics() if with_metrics else None
+    tree = scan_tree(path, should_stop=lambda: _generation.value != generation, known=known,
+                     links=links, cross_devices=cross_devices, metrics=metrics)
+    if not tree.complete:
+        return None
+    return pack_tree(tree), links.export(), metrics.export() if metrics is not None else None
+
+
+class ProcessScanPool:
+    # Верхние уровни дерева читаются в вызывающем потоке, пока каталогов не наберётся
+    # на SHARDS_PER_WORKER шардов на процесс; каждый шард обходится в отдельном процессе
+    # и возвращается целиком одним упакованным PackedTree.
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        # forkserver не наследует потоки Qt, а заранее загружает только Process_scan.
+        # Главный модуль дочерний процесс всё же выполняет заново как __mp_main__:
+        # лаунчер disk-analyzer поэтому импортирует PySide6 только под __main__, а при
+        # запуске через python mainwindow.py процессы обхода загрузят и Qt
+        self._context = multiprocessing.get_context('forkserver')
+        self._context.set_forkserver_preload(['Process_scan'])
+        self._generation = self._context.Value('q', 0)
+        self._executor = self.start_executor()
+
+    def start_executor(self):
+        return ProcessPoolExecutor(
+            self.workers, mp_context=self._context, initializer=_init_worker,
+            initargs=(self._generation,))
+
+    def restart(self):
+        # Процесс пула убит (например, при нехватке памяти): исполнитель больше не
+        # принимает задачи, поэтому заменяется новым
+        print("Пул процессов обхода перезапускается")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self.start_executor()
+
+    def cancel(self):
+        # Все шарды, запущенные раньше, останавливаются при следующей проверке
+        with self._generation.get_lock():
+            self._generation.value += 1
+
+    def close(self):
+        self.cancel()
+        self._executor.shutdown(cancel_futures=True)
+
+    def scan_tree(self, root_path, should_stop=None, known=None, reuse=None, progress=None,
+                  links=None, cross_devices=False, index_path=None, metrics=None):
+        # Аргументы как у Scan_engine.scan_tree; known используется для верхних уровней,
+        # шарды берут записи из индекса index_path сами
+        tree = ScanTree(root_path)
+        tree.links = links if links is not None else HardLinks()
+        if not cross_devices:
+            try:
+                tree.dev = os.stat(tree.root_path).st_dev
+            except OSError:
+                pass
+
+        if metrics is not None:
+            metrics.begin_scan()
+        try:
+            self._scan_shards(tree, should_stop, known, reuse, progress, cross_devices,
+                              index_path, metrics)
+        finally:
+            if metrics is not None:
+                metrics.end_scan()
+        tree.aggregate()
+        return tree
+
+    def _scan_shards(self, tree, should_stop, known, reuse, progress, cross_devices, index_path,
+                     metrics):
+        frontier = deque([(tree.root_path, tree.root)])
+        target = self.workers * SHARDS_PER_WORKER
+        while frontier and len(frontier) < target:
+            if should_stop is not None and should_stop():
+                tree.complete = False
+                return
+            path, node = frontier.popleft()
+            frontier.extend(scan_directory(path, node, known, reuse, progress, None,
+                                           tree.links, tree.dev, metrics))
+
+        generation = self._generation.value
+        try:
+            futures = self.submit_shards(frontier, generation, cross_devices, index_path, metrics)
+        except BrokenProcessPool:
+            self.restart()
+            futures = self.submit_shards(frontier, generation, cross_devices, index_path, metrics)
+        # Шарды, которые не вернул процесс, обходятся здесь же в потоке
+        failed = []
+        broken = False
+        timeout = progress.interval if progress is not None else 0.1
+        while futures:
+            if metrics is not None:
+                metrics.set_gauge('pool_pending', len(futures))
+            done, _ = wait(futures, timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, node = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                    if not isinstance(e, BrokenProcessPool):
+                        print(f"Ошибка при обходе {path} в процессе: {str(e)}")
+                    failed.append((path, node))
+                    continue
+                if result is None:
+                    continue
+                packed, claims, shard_metrics = result
+                unpack_into(node, packed)
+                merge_links(tree, claims)
+                if metrics is not None:
+                    metrics.merge(shard_metrics)
+                if progress is not None:
+                    progress.add(sum(packed.own_size), sum(packed.own_disk),
+                                 sum(packed.own_files))
+
+            if progress is not None:
+                progress.maybe_report()
+            if futures and should_stop is not None and should_stop():
+                self.cancel()
+                for future in futures:
+                    future.cancel()
+                tree.complete = False
+                break
+        if metrics is not None:
+            metrics.set_gauge('pool_pending', 0)
+        if broken:
+            self.restart()
+        if failed and tree.complete:
+            tree.complete = self.scan_in_thread(tree, failed, should_stop, known, progress,
+                                                metrics)
+
+    def submit_shards(self, frontier, generation, cross_devices, index_path, metrics):
+        return {
+            self._executor.submit(scan_shard, path, generation, cross_devices, index_path,
+                                  metrics is not None):
+                (path, node)
+            for path, node in frontier
+        }
+
+    def scan_in_thread(self, tree, shards, should_stop, known, progress, metrics):
+        # Как Scan_engine.scan_tree с одним потоком, но в уже существующие узлы шардов
+        stack = list(shards)
+        while stack:
+            if should_stop is not None and should_stop():
+                return False
+            path, node = stack.pop()
+            stack.extend(scan_directory(path, node, known, None, progress, None,
+                                        tree.links, tree.dev, metrics))
+            if progress is not None:
+                progress.maybe_report()
+        return True
@@ -0,0 +1,231 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from Scan_engine import HardLinks, ScanTree, scan_directory, scan_tree
+from Scan_metrics import ScanMetrics
+
+FIELDS = ['path', 'depth', 'size', 'disk_size', 'raw_disk_size', 'files']
+DIFF_FIELDS = ['path', 'old_size', 'new_size', 'delta', 'status']
+
+
+class JsonLinesWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, record):
+        self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+class CsvWriter:
+    def __init__(self, stream, fields=FIELDS):
+        self.stream = stream
+        self.fields = fields
+        self.writer = csv.writer(stream)
+        self.writer.writerow(fields)
+
+    def write(self, record):
+        self.writer.writerow([record[f] for f in self.fields])
+
+
+WRITERS = {
+    'json': JsonLinesWriter,
+    'csv': CsvWriter,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='disk-analyzer scan',
+        description="Подсчёт размеров каталогов без графического интерфейса")
+    parser.add_argument('paths', nargs='+', metavar='PATH')
+    parser.add_argument('--depth', type=int, default=1,
+                        help="глубина вывода относительно PATH (0 — только сам PATH)")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='json',
+                        help="json — по объекту JSON на строку, csv — таблица с заголовком")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="число потоков (или процессов) обхода")
+    parser.add_argument('--backend', choices=['threads', 'processes'], default='threads',
+                        help="processes — обход поддеревьев в отдельных процессах, в обход GIL")
+    parser.add_argument('--index', action='store_true',
+                        help="использовать индекс размеров в ~/.cache для повторных запусков")
+    parser.add_argument('--cross-devices', action='store_true',
+                        help="заходить в другие файловые системы (точки монтирования внутри PATH)")
+    parser.add_argument('--snapshot', action='store_true',
+                        help="сохранить снимок для последующего disk-analyzer diff")
+    parser.add_argument('--scan-file', metavar='FILE',
+                        help="сохранить дерево каталогов PATH в FILE для «Открыть скан» в окне программы")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="записать замеры обхода в FILE: .json — JSON, иначе формат Prometheus")
+    return parser
+
+
+def build_diff_parser():
+    parser = argparse.ArgumentParser(
+        prog='disk-analyzer diff',
+        description="Какие каталоги выросли или уменьшились между двумя снимками")
+    parser.add_argument('old', metavar='OLD',
+                        help="файл снимка или каталог (тогда сравниваются два его последних снимка)")
+    parser.add_argument('new', metavar='NEW', nargs='?',
+                        help="файл снимка; по умолчанию — последний снимок того же корня")
+    parser.add_argument('--limit', type=int, default=20,
+                        help="сколько самых выросших и самых уменьшившихся каталогов вывести (0 — все)")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='json')
+    return parser
+
+
+def node_records(tree, node, base_depth, max_depth):
+    stack = [(tree.path_of(node), node, base_depth)]
+    while stack:
+        path, node, depth = stack.pop()
+        yield {
+            'path': path,
+            'depth': depth,
+            'size': node.size,
+            'disk_size': node.disk_size,
+            'raw_disk_size': node.raw_disk,
+            'files': node.files,
+        }
+        if depth < max_depth:
+            for name, child in sorted(node.children.items(), reverse=True):
+                stack.append((os.path.join(path, name), child, depth + 1))
+
+
+def scan_path(path, args, writer, index=None, pool=None, metrics=None):
+    real_path = os.path.realpath(path)
+    if not os.path.isdir(real_path):
+        print(f"Не каталог: {path}", file=sys.stderr)
+        return False
+
+    known = index.load(real_path) if index is not None else None
+    tree = ScanTree(real_path)
+    tree.links = HardLinks()
+    if not args.cross_devices:
+        tree.dev = os.stat(real_path).st_dev
+    root = tree.root
+
+    # Каждый подкаталог первого уровня считается отдельно и выводится сразу по готовности;
+    # жёсткие ссылки учитываются по всему PATH
+    for child_path, child in scan_directory(real_path, root, known, links=tree.links,
+                                            dev=tree.dev, metrics=metrics):
+        if pool is not None:
+            subtree = pool.scan_tree(child_path, known=known, links=tree.links,
+                                     cross_devices=args.cross_devices,
+                                     index_path=index.path if index is not None else None,
+                                     metrics=metrics)
+        else:
+            subtree = scan_tree(child_path, workers=args.workers, known=known, links=tree.links,
+                                cross_devices=args.cross_devices, metrics=metrics)
+        root.attach(child.name, subtree.root)
+        if args.depth >= 1:
+            if metrics is not None:
+                metrics.mark_first_result()
+            for record in node_records(tree, subtree.root, 1, args.depth):
+                writer.write(record)
+            writer.stream.flush()
+
+    tree.aggregate()
+    if metrics is not None:
+        metrics.mark_first_result()
+    writer.write(next(node_records(tree, root, 0, 0)))
+    writer.stream.flush()
+
+    if index is not None:
+        index.save(tree)
+    if args.snapshot:
+        from Scan_snapshot import save_snapshot
+        print(f"Снимок сохранён: {save_snapshot(tree)}", file=sys.stderr)
+    if args.scan_file:
+        from Compact_tree import CompactTree
+        from Scan_file import save_scan
+        compact = CompactTree.from_scan_tree(tree)
+        compact.created_ns = time.time_ns()
+        try:
+            save_scan(compact, args.scan_file)
+        except OSError as e:
+            print(f"Ошибка при сохранении скана в {args.scan_file}: {str(e)}", file=sys.stderr)
+            return False
+        print(f"Скан сохранён: {args.scan_file}", file=sys.stderr)
+    return True
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.scan_file and len(args.paths) > 1:
+        parser.error("--scan-file сохраняет один PATH")
+    writer = WRITERS[args.format](sys.stdout)
+
+    index = None
+    if args.index:
+        from Size_index import SizeIndex
+        index = SizeIndex()
+
+    pool = None
+    if args.backend == 'processes':
+        from Process_scan import ProcessScanPool
+        pool = ProcessScanPool(args.workers)
+
+    metrics = ScanMetrics() if args.metrics else None
+
+    ok = True
+    try:
+        for path in args.paths:
+            ok = scan_path(path, args, writer, index, pool, metrics) and ok
+    except KeyboardInterrupt:
+        return 130
+    except BrokenPipeError:
+        return 1
+    finally:
+        if pool is not None:
+            pool.close()
+        if metrics is not None:
+            try:
+                metrics.write(args.metrics)
+            except OSError as e:
+                print(f"Ошибка при записи метрик в {args.metrics}: {str(e)}", file=sys.stderr)
+    return 0 if ok else 1
+
+
+def resolve_snapshots(old, new):
+    from Scan_snapshot import list_snapshots
+    if os.path.isdir(old):
+        snapshots = list_snapshots(os.path.realpath(old))
+        if len(snapshots) < 2:
+            raise ValueError(f"Для {old} нужно хотя бы два снимка (disk-analyzer scan --snapshot)")
+        return snapshots[-2], snapshots[-1]
+    if new is None:
+        from Compact_tree import CompactTree
+        snapshots = list_snapshots(CompactTree.load(old).root_path)
+        if not snapshots:
+            raise ValueError(f"Нет снимков для сравнения с {old}")
+        new = snapshots[-1]
+    return old, new
+
+
+def diff_main(argv=None):
+    from Compact_tree import CompactTree
+    from Scan_snapshot import diff_trees
+
+    args = build_diff_parser().parse_args(argv)
+    try:
+        old_path, new_path = resolve_snapshots(args.old, args.new)
+        old, new = CompactTree.load(old_path), CompactTree.load(new_path)
+        if args.format == 'csv':
+            writer = CsvWriter(sys.stdout, DIFF_FIELDS)
+        else:
+            writer = JsonLinesWriter(sys.stdout)
+        for entry in diff_trees(old, new, args.limit or None):
+            writer.write(entry._asdict())
+    except BrokenPipeError:
+        return 1
+    except (OSError, ValueError, EOFError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
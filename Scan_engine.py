@@ -0,0 +1,538 @@
+import os
+import threading
+import time
+from collections import deque
+
+# С метриками замеряется каждый STAT_SAMPLE-й stat файла в каталоге (и всегда первый):
+# два вызова perf_counter на каждый файл заметно замедляют многопоточный обход
+STAT_SAMPLE = 8
+
+
+class DirNode:
+    __slots__ = ('name', 'parent', 'children', 'own_size', 'own_disk', 'own_files',
+                 'own_raw_disk', 'own_links', 'size', 'disk_size', 'files', 'raw_disk',
+                 'ino', 'mtime_ns', 'scanned')
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.children = {}
+        self.own_size = 0
+        self.own_disk = 0
+        self.own_files = 0
+        # own_raw_disk считает каждую жёсткую ссылку, own_disk — каждый inode один раз
+        self.own_raw_disk = 0
+        self.own_links = 0
+        self.size = 0
+        self.disk_size = 0
+        self.files = 0
+        self.raw_disk = 0
+        self.ino = 0
+        self.mtime_ns = 0
+        self.scanned = False
+
+    def add_child(self, name):
+        child = DirNode(name, self)
+        self.children[name] = child
+        return child
+
+    def attach(self, name, child):
+        child.name = name
+        child.parent = self
+        self.children[name] = child
+
+    def detach(self):
+        if self.parent is not None:
+            self.parent.children.pop(self.name, None)
+            self.parent = None
+
+
+class ScanTree:
+    def __init__(self, root_path, root=None):
+        self.root_path = os.path.normpath(root_path)
+        self.root = root or DirNode(self.root_path)
+        self.complete = True
+        # Общие для всех обходов этого дерева: учёт жёстких ссылок и устройство корня
+        self.links = None
+        self.dev = None
+        if self.root_path.endswith(os.sep):
+            self._prefix = self.root_path
+        else:
+            self._prefix = self.root_path + os.sep
+
+    def contains(self, path):
+        path = os.path.normpath(path)
+        return path == self.root_path or path.startswith(self._prefix)
+
+    def find(self, path):
+        path = os.path.normpath(path)
+        if path == self.root_path:
+            return self.root
+        if not path.startswith(self._prefix):
+            return None
+
+        node = self.root
+        for part in path[len(self._prefix):].split(os.sep):
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def path_of(self, node):
+        parts = []
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        parts.reverse()
+        return os.path.join(self.root_path, *parts)
+
+    def walk(self, node=None):
+        node = node or self.root
+        stack = [(self.path_of(node), node)]
+        while stack:
+            path, node = stack.pop()
+            yield path, node
+            for name, child in node.children.items():
+                stack.append((os.path.join(path, name), child))
+
+    def as_known(self):
+        # Формат аргумента known для scan_tree: повторный обход сверяет каталоги по mtime
+        return {
+            path: (node.ino, node.mtime_ns, node.own_size, node.own_disk, node.own_files,
+                   node.own_links, list(node.children))
+            for path, node in self.walk()
+        }
+
+    def add_delta(self, node, size, disk_size, files=0, raw_disk=None):
+        if raw_disk is None:
+            raw_disk = disk_size
+        affected = []
+        while node is not None:
+            node.size += size
+            node.disk_size += disk_size
+            node.files += files
+            node.raw_disk += raw_disk
+            affected.append(node)
+            node = node.parent
+        return affected
+
+    def aggregate(self):
+        # Обход в обратном порядке: дети всегда суммируются раньше родителя
+        order = [self.root]
+        for node in order:
+            order.extend(node.children.values())
+        for node in reversed(order):
+            node.size = node.own_size
+            node.disk_size = node.own_disk
+            node.files = node.own_files
+            node.raw_disk = node.own_raw_disk
+            for child in node.children.values():
+                node.size += child.size
+                node.disk_size += child.disk_size
+                node.files += child.files
+                node.raw_disk += child.raw_disk
+
+
+def is_under(path, root):
+    root = root.rstrip(os.sep)
+    return path.startswith(root + os.sep)
+
+
+def allocated_size(st):
+    # st_blocks всегда в единицах по 512 байт, независимо от размера блока ФС
+    if hasattr(st, 'st_blocks'):
+        return st.st_blocks * 512
+    return st.st_size
+
+
+class HardLinks:
+    # Файл с несколькими жёсткими ссылками засчитывается одному каталогу за дерево.
+    # Запоминаются только inode с st_nlink > 1, ключ — одно целое из (st_dev, st_ino):
+    # обычные файлы память не расходуют вовсе. Владелец — путь каталога, поэтому
+    # повторный обход того же каталога снова засчитывает ему его файлы.
+    def __init__(self):
+        self._owners = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._owners)
+
+    def claim(self, st, path, counted):
+        # counted — ключи, уже встреченные при текущем чтении каталога path:
+        # две ссылки на один файл в одном каталоге — всё равно один файл
+        key = (st.st_dev << 64) | st.st_ino
+        if key in counted:
+            return False
+        counted.add(key)
+        return self.claim_key(key, path)
+
+    def claim_key(self, key, path):
+        with self._lock:
+            return self._owners.setdefault(key, path) == path
+
+
+class ScanProgress:
+    # Копит промежуточные итоги обхода и отдаёт их callback не чаще раза в interval секунд;
+    # callback всегда вызывается в потоке, запустившем scan_tree
+    def __init__(self, callback, interval=0.1):
+        self.callback = callback
+        self.interval = interval
+        self.size = 0
+        self.disk_size = 0
+        self.files = 0
+        self._lock = threading.Lock()
+        self._next_report = time.monotonic() + interval
+
+    def add(self, size, disk_size, files):
+        with self._lock:
+            self.size += size
+            self.disk_size += disk_size
+            self.files += files
+
+    def maybe_report(self):
+        now = time.monotonic()
+        if now < self._next_report:
+            return
+        with self._lock:
+            if now < self._next_report:
+                return
+            self._next_report = now + self.interval
+            totals = self.size, self.disk_size, self.files
+        self.callback(*totals)
+
+
+def scan_directory(path, node, known=None, reuse=None, progress=None, on_file=None,
+                   links=None, dev=None, metrics=None):
+    # reuse(путь) может вернуть готовый узел из прерванного ранее обхода:
+    # он подвешивается вместо пустого, и в это поддерево обход не спускается
+    subdirs = list_directory(path, node, known, on_file, links, dev, metrics)
+    node.scanned = True
+    if progress is not None:
+        progress.add(node.own_size, node.own_disk, node.own_files)
+    if reuse is None:
+        return subdirs
+
+    pending = []
+    for child_path, child in subdirs:
+        done = reuse(child_path)
+        if done is None:
+            pending.append((child_path, child))
+        else:
+            node.attach(child.name, done)
+            if progress is not None:
+                progress.add(done.size, done.disk_size, done.files)
+    return pending
+
+
+def list_directory(path, node, known=None, on_file=None, links=None, dev=None, metrics=None):
+    # on_file(entry, st) вызывается для каждого файла; ему нужны все файлы,
+    # поэтому каталоги из known в этом случае всё равно перечитываются.
+    # links — учёт жёстких ссылок, dev — не спускаться в каталоги с другим st_dev
+    # (точки монтирования, /proc и т. п.), metrics — ScanMetrics для замеров stat
+    subdirs = []
+    if known is not None:
+        # mtime снимается до чтения каталога: изменение во время обхода даст пересчёт в следующий раз
+        try:
+            st = os.stat(path, follow_symlinks=False)
+        except OSError as e:
+            if metrics is not None:
+                metrics.add_error(e)
+            node.detach()
+            return subdirs
+        node.ino = st.st_ino
+        node.mtime_ns = st.st_mtime_ns
+
+        record = known.get(path) if on_file is None else None
+        # Каталог с жёсткими ссылками перечитывается: его inode нужно занести в links
+        if (record is not None and record[0] == node.ino and record[1] == node.mtime_ns
+                and (links is None or record[5] == 0)):
+            # Каталог не менялся: свои файлы берутся из индекса, проверяются только подкаталоги
+            node.own_size = record[2]
+            node.own_disk = record[3]
+            node.own_raw_disk = record[3]
+            node.own_files = record[4]
+            for name in record[6]:
+                subdirs.append((os.path.join(path, name), node.add_child(name)))
+            if metrics is not None:
+                metrics.add_cached_directory()
+            return subdirs
+
+    try:
+        entries = os.scandir(path)
+    except OSError as e:
+        if metrics is not None:
+            metrics.add_error(e)
+        return subdirs
+
+    # Замеряется только stat файлов: это основная доля системных вызовов обхода
+    stat_times = [] if metrics is not None else None
+    stat_dev = None
+    counted = set()
+    try:
+        with entries:
+            for entry in entries:
+                # is_symlink/is_dir берутся из d_type, stat делается один раз на запись
+                try:
+                    if entry.is_symlink():
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if dev is None or entry.stat(follow_symlinks=False).st_dev == dev:
+                            subdirs.append((entry.path, node.add_child(entry.name)))
+                        continue
+                    if stat_times is None or node.own_files % STAT_SAMPLE:
+                        st = entry.stat(follow_symlinks=False)
+                    else:
+                        started = time.perf_counter()
+                        st = entry.stat(follow_symlinks=False)
+                        stat_times.append(time.perf_counter() - started)
+                        stat_dev = st.st_dev
+                except OSError as e:
+                    if metrics is not None:
+                        metrics.add_error(e)
+                    continue
+                disk = allocated_size(st)
+                node.own_raw_disk += disk
+                node.own_files += 1
+                if links is not None and st.st_nlink > 1:
+                    node.own_links += 1
+                    if not links.claim(st, path, counted):
+                        continue
+                node.own_size += st.st_size
+                node.own_disk += disk
+                if on_file is not None:
+                    on_file(entry, st)
+    except OSError as e:
+        # readdir может отказать посреди каталога (например, /proc/*/map_files):
+        # остаётся то, что успели прочитать
+        if metrics is not None:
+            metrics.add_error(e)
+
+    if metrics is not None:
+        metrics.add_directory(node.own_files + len(subdirs), stat_dev, stat_times)
+    return subdirs
+
+
+class WorkStealingScan:
+    # У каждого потока своя очередь: свои задачи берутся с конца (обход в глубину),
+    # чужие крадутся с начала, где лежат самые крупные ещё не начатые поддеревья.
+    def __init__(self, workers, should_stop=None, known=None, reuse=None, progress=None,
+                 on_file=None, links=None, dev=None, metrics=None):
+        self.workers = max(1, workers)
+        self.should_stop = should_stop
+        self.known = known
+        self.reuse = reuse
+        self.progress = progress
+        self.on_file = on_file
+        self.links = links
+        self.dev = dev
+        self.metrics = metrics
+        self._queues = [deque() for _ in range(self.workers)]
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._idle = 0
+        self._stopped = False
+        # Первое исключение рабочего потока: остальные останавливаются, run поднимает его
+        self._error = None
+
+    def run(self, tree):
+        self._queues[0].append((tree.root_path, tree.root))
+        self._pending = 1
+
+        threads = [
+            threading.Thread(target=self._work, args=(i,), daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in threads:
+            t.start()
+        # Промежуточные итоги отдаёт только вызывающий поток, рабочие лишь копят суммы
+        timeout = self.progress.interval if self.progress is not None else None
+        for t in threads:
+            while t.is_alive():
+                t.join(timeout)
+                if self.progress is not None:
+                    self.progress.maybe_report()
+
+        if self._error is not None:
+            raise self._error
+        return not self._stopped
+
+    def _next_task(self, index):
+        try:
+            return self._queues[index].pop()
+        except IndexError:
+            pass
+        for offset in range(1, self.workers):
+            try:
+                return self._queues[(index + offset) % self.workers].popleft()
+            except IndexError:
+                continue
+        return None
+
+    def _work(self, index):
+        own = self._queues[index]
+        while True:
+            task = self._next_task(index)
+            if task is None:
+                with self._cond:
+                    if self._pending == 0 or self._stopped:
+                        return
+                    self._idle += 1
+                    self._cond.wait(0.05)
+                    self._idle -= 1
+                continue
+
+            if self._stopped or (self.should_stop is not None and self.should_stop()):
+                with self._cond:
+                    self._stopped = True
+                    self._cond.notify_all()
+                return
+
+            try:
+                subdirs = scan_directory(task[0], task[1], self.known, self.reuse, self.progress,
+                                         self.on_file, self.links, self.dev, self.metrics)
+            except Exception as e:
+                # Без этого _pending не дойдёт до нуля и остальные потоки будут ждать вечно
+                with self._cond:
+                    if self._error is None:
+                        self._error = e
+                    self._stopped = True
+                    self._cond.notify_all()
+                return
+            # Счётчик увеличивается до публикации задач, чтобы он не дошёл до нуля раньше времени
+            with self._cond:
+                self._pending += len(subdirs) - 1
+                wake = self._idle and (subdirs or self._pending == 0)
+                pending = self._pending
+            if self.metrics is not None:
+                self.metrics.set_gauge('scan_queue', pending)
+            own.extend(subdirs)
+            if wake:
+                with self._cond:
+                    self._cond.notify_all()
+
+
+def scan_tree(root_path, should_stop=None, workers=1, known=None, reuse=None, progress=None,
+              on_file=None, links=None, cross_devices=False, metrics=None):
+    # known: {путь: (ino, mtime_ns, own_size, own_disk, own_files, own_links,
+    # [имена подкаталогов])} из прошлого обхода; None отключает инкрементальный режим.
+    # links — HardLinks, общий с уже посчитанными частями того же дерева (иначе новый).
+    # cross_devices=False — не выходить за пределы файловой системы корня.
+    # metrics — ScanMetrics, в который обход сдаёт замеры.
+    # При остановке через should_stop возвращается неполное дерево с complete = False,
+    # законченные поддеревья из него достаёт split_complete.
+    tree = ScanTree(root_path)
+    tree.links = links if links is not None else HardLinks()
+    if not cross_devices:
+        try:
+            tree.dev = os.stat(tree.root_path).st_dev
+        except OSError:
+            pass
+    links, dev = tree.links, tree.dev
+
+    if metrics is not None:
+        metrics.begin_scan()
+    try:
+        if workers > 1:
+            tree.complete = WorkStealingScan(workers, should_stop, known, reuse, progress,
+                                             on_file, links, dev, metrics).run(tree)
+        else:
+            stack = [(tree.root_path, tree.root)]
+            while stack:
+                if should_stop is not None and should_stop():
+                    tree.complete = False
+                    break
+                path, node = stack.pop()
+                stack.extend(scan_directory(path, node, known, reuse, progress, on_file, links,
+                                            dev, metrics))
+                if metrics is not None:
+                    metrics.set_gauge('scan_queue', len(stack))
+                if progress is not None:
+                    progress.maybe_report()
+    finally:
+        if metrics is not None:
+            metrics.end_scan()
+
+    tree.aggregate()
+    return tree
+
+
+def split_complete(tree):
+    # Поддерево закончено, если прочитаны все его каталоги; возвращаются максимальные такие
+    order = [tree.root]
+    for node in order:
+        order.extend(node.children.values())
+
+    complete = set()
+    for node in reversed(order):
+        if node.scanned and all(id(c) in complete for c in node.children.values()):
+            complete.add(id(node))
+
+    if id(tree.root) in complete:
+        return [tree]
+
+    subtrees = []
+    for node in order:
+        if id(node) in complete and id(node.parent) not in complete:
+            path = tree.path_of(node)
+            node.detach()
+            node.name = path
+            subtree = ScanTree(path, node)
+            subtree.links = tree.links
+            subtree.dev = tree.dev
+            subtree.aggregate()
+            subtrees.append(subtree)
+    return subtrees
+
+
+def refresh_directory(tree, node):
+    # Пересчитывает собственные файлы одного каталога, досканирует новые подкаталоги,
+    # убирает исчезнувшие и переносит разницу на всех предков.
+    # Возвращает (затронутые узлы, пути новых поддеревьев, пути удалённых поддеревьев).
+    path = tree.path_of(node)
+    old_size = node.size
+    old_disk = node.disk_size
+    old_files = node.files
+    old_raw = node.raw_disk
+
+    fresh = DirNode(node.name)
+    if not os.path.isdir(path) or os.path.islink(path):
+        parent = node.parent
+        node.detach()
+        if parent is None:
+            return [], [], [path]
+        return tree.add_delta(parent, -old_size, -old_disk, -old_files, -old_raw), [], [path]
+
+    subdirs = scan_directory(path, fresh, known={}, links=tree.links, dev=tree.dev)
+    node.own_size = fresh.own_size
+    node.own_disk = fresh.own_disk
+    node.own_files = fresh.own_files
+    node.own_raw_disk = fresh.own_raw_disk
+    node.own_links = fresh.own_links
+    node.ino = fresh.ino
+    node.mtime_ns = fresh.mtime_ns
+
+    added = []
+    removed = []
+    for name in list(node.children):
+        if name not in fresh.children:
+            node.children[name].detach()
+            removed.append(os.path.join(path, name))
+    for child_path, child in subdirs:
+        if child.name not in node.children:
+            subtree = scan_tree(child_path, links=tree.links, cross_devices=tree.dev is None)
+            node.attach(child.name, subtree.root)
+            added.append(child_path)
+
+    size = node.own_size + sum(c.size for c in node.children.values())
+    disk_size = node.own_disk + sum(c.disk_size for c in node.children.values())
+    files = node.own_files + sum(c.files for c in node.children.values())
+    raw_disk = node.own_raw_disk + sum(c.raw_disk for c in node.children.values())
+    node.size = size
+    node.disk_size = disk_size
+    node.files = files
+    node.raw_disk = raw_disk
+    affected = [node]
+    if node.parent is not None:
+        affected += tree.add_delta(node.parent, size - old_size, disk_size - old_disk,
+                                   files - old_files, raw_disk - old_raw)
+    return affected, added, removed
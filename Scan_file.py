@@ -0,0 +1,155 @@
+import mmap
+import os
+import struct
+from array import array
+from collections import namedtuple
+
+SCAN_MAGIC = b'DASCAN01'
+SCAN_SUFFIX = '.dscan'
+# Заголовок: число записей, длина пула имён, длина пути корня, время скана,
+# смещения таблицы записей и пула имён от начала файла
+SCAN_HEADER = struct.Struct('<QQIqQQ')
+# Запись каталога фиксированной длины. Записи лежат в порядке обхода в ширину, поэтому дети
+# любого каталога идут подряд: ребёнок row — запись first_child + row, без поиска
+SCAN_RECORD = struct.Struct('<QQQqQiIIH2x')
+ScanRecord = namedtuple('ScanRecord', ['size', 'disk_size', 'files', 'mtime_ns', 'name_start',
+                                       'parent', 'first_child', 'child_count', 'name_len'])
+# Поля parent, first_child, child_count внутри записи
+SCAN_LINKS = struct.Struct('<iII')
+LINKS_OFFSET = 40
+# Записей в одном write при сохранении
+WRITE_CHUNK = 65536
+
+
+def aligned(offset):
+    return (offset + 7) & ~7
+
+
+def save_scan(compact, path):
+    # Узлы CompactTree переупорядочиваются в ширину; пул имён пишется как есть.
+    # order[k] — узел CompactTree для записи k, parents[k] — номер записи родителя
+    root = os.fsencode(compact.root_path)
+    count = len(compact)
+    records_offset = aligned(len(SCAN_MAGIC) + SCAN_HEADER.size + len(root))
+    names_offset = records_offset + count * SCAN_RECORD.size
+    order = array('I', [0] if count else [])
+    parents = array('i', [-1] if count else [])
+    chunk = bytearray(WRITE_CHUNK * SCAN_RECORD.size)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(SCAN_MAGIC)
+        f.write(SCAN_HEADER.pack(count, len(compact.names), len(root), compact.created_ns,
+                                 records_offset, names_offset))
+        f.write(root)
+        f.write(bytes(records_offset - f.tell()))
+
+        k = 0
+        filled = 0
+        while k < count:
+            node = order[k]
+            first = len(order)
+            for child in compact.children(node):
+                order.append(child)
+                parents.append(k)
+            SCAN_RECORD.pack_into(
+                chunk, filled * SCAN_RECORD.size,
+                compact.size[node], compact.disk_size[node], compact.files[node],
+                compact.mtime_ns[node], compact.name_start[node], parents[k],
+                first, len(order) - first, compact.name_len[node])
+            filled += 1
+            k += 1
+            if filled == WRITE_CHUNK or k == count:
+                f.write(memoryview(chunk)[:filled * SCAN_RECORD.size])
+                filled = 0
+        f.write(compact.names)
+    os.replace(tmp_path, path)
+
+
+class ScanFile:
+    # Скан, отображённый в память: запись читается из файла при обращении,
+    # объекты на каталоги не создаются. Номер записи корня — 0
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_header()
+        except ValueError:
+            self._map.close()
+            raise
+
+    def _read_header(self):
+        data = self._map
+        start = len(SCAN_MAGIC)
+        if len(data) < start + SCAN_HEADER.size or data[:start] != SCAN_MAGIC:
+            raise ValueError(f"Не файл скана: {self.path}")
+        (self.count, names_len, root_len, self.created_ns, self.records_offset,
+         self.names_offset) = SCAN_HEADER.unpack_from(data, start)
+        root_start = start + SCAN_HEADER.size
+        self.root_path = os.fsdecode(data[root_start:root_start + root_len])
+        if (self.names_offset != self.records_offset + self.count * SCAN_RECORD.size
+                or len(data) < self.names_offset + names_len):
+            raise ValueError(f"Файл скана обрезан: {self.path}")
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._map.close()
+
+    def record(self, index):
+        return ScanRecord._make(SCAN_RECORD.unpack_from(
+            self._map, self.records_offset + index * SCAN_RECORD.size))
+
+    def links(self, index):
+        # (родитель, первый ребёнок, число детей) без распаковки остальных полей
+        return SCAN_LINKS.unpack_from(
+            self._map, self.records_offset + index * SCAN_RECORD.size + LINKS_OFFSET)
+
+    def raw_name(self, index):
+        record = self.record(index)
+        start = self.names_offset + record.name_start
+        return self._map[start:start + record.name_len]
+
+    def name(self, index):
+        return self.root_path if index == 0 else os.fsdecode(self.raw_name(index))
+
+    def row(self, index):
+        # Место записи среди детей её родителя
+        parent = self.links(index)[0]
+        return 0 if parent < 0 else index - self.links(parent)[1]
+
+    def path_of(self, index):
+        parts = []
+        while index > 0:
+            parts.append(os.fsdecode(self.raw_name(index)))
+            index = self.links(index)[0]
+        parts.reverse()
+        return os.path.join(self.root_path, *parts)
+
+    def find(self, path):
+        # Дети отсортированы по имени, поэтому каждый уровень — двоичный поиск
+        path = os.path.normpath(path)
+        if not self.count:
+            return None
+        if path == self.root_path:
+            return 0
+        prefix = self.root_path if self.root_path.endswith(os.sep) else self.root_path + os.sep
+        if not path.startswith(prefix):
+            return None
+
+        index = 0
+        for part in path[len(prefix):].split(os.sep):
+            _, first, count = self.links(index)
+            low, high = first, first + count
+            while low < high:
+                middle = (low + high) // 2
+                if os.fsdecode(self.raw_name(middle)) < part:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == first + count or os.fsdecode(self.raw_name(low)) != part:
+                return None
+            index = low
+        return index
@@ -0,0 +1,233 @@
+import time
+from array import array
+from PySide6.QtCore import Qt, QAbstractItemModel, QModelIndex
+from PySide6.QtWidgets import (QDialog, QFileIconProvider, QLabel, QTreeView, QVBoxLayout,
+                               QHBoxLayout)
+from Size_proxy_model import SIZE_ROLE, size_filter_box
+
+HEADERS = ["Имя", "Занято", "Файлов", "Изменён"]
+# Колонка -> поле записи, по которому сортируются дети
+SORT_FIELDS = {1: 'disk_size', 2: 'files', 3: 'mtime_ns'}
+# Строка, которой нет в порядке родителя (отфильтрована по размеру)
+MISSING = 0xFFFFFFFF
+
+
+class ScanFileModel(QAbstractItemModel):
+    # Модель для QTreeView поверх скана в памяти вместо QFileSystemModel и DriveInfoProxyModel.
+    # internalId индекса — номер записи ScanFile, поэтому строка и родитель берутся из записи,
+    # без словарей на каждый каталог. Пока порядок — по имени, как в файле, и фильтра нет,
+    # ребёнок row — запись first_child + row. Иначе порядок детей строится при первом
+    # обращении к ним, то есть только для каталогов, которые раскрыло представление
+    def __init__(self, scan, parent=None):
+        super().__init__(parent)
+        self.scan = scan
+        self.sort_column = 0
+        self.sort_order = Qt.AscendingOrder
+        self.min_size = 0
+        # запись родителя -> (записи детей по строкам, строка по смещению от first_child)
+        self._orders = {}
+        self._icon = QFileIconProvider().icon(QFileIconProvider.Folder)
+
+    def natural(self):
+        return self.sort_column <= 0 and self.sort_order == Qt.AscendingOrder and not self.min_size
+
+    def order(self, record):
+        if self.natural():
+            return None
+        found = self._orders.get(record)
+        if found is None:
+            found = self._orders[record] = self.build_order(record)
+        return found
+
+    def build_order(self, record):
+        _, first, count = self.scan.links(record)
+        children = range(first, first + count)
+        if self.min_size:
+            children = [c for c in children if self.scan.record(c).disk_size >= self.min_size]
+        reverse = self.sort_order == Qt.DescendingOrder
+        field = SORT_FIELDS.get(self.sort_column)
+        if field is not None:
+            keys = {c: getattr(self.scan.record(c), field) for c in children}
+            children = sorted(children, key=keys.__getitem__, reverse=reverse)
+        elif reverse:
+            children = list(reversed(children))
+        rows = array('I', children)
+        row_of = array('I', [MISSING]) * count
+        for row, child in enumerate(rows):
+            row_of[child - first] = row
+        return rows, row_of
+
+    def record_of(self, index):
+        return index.internalId() if index.isValid() else None
+
+    def row_of(self, record):
+        if record == 0:
+            return 0
+        parent = self.scan.links(record)[0]
+        first = self.scan.links(parent)[1]
+        order = self.order(parent)
+        if order is None:
+            return record - first
+        row = order[1][record - first]
+        return None if row == MISSING else row
+
+    def visible_row(self, record):
+        # Строка записи или None, если она сама или кто-то из предков отфильтрован
+        row = self.row_of(record)
+        parent = self.scan.links(record)[0]
+        while row is not None and parent > 0:
+            if self.row_of(parent) is None:
+                return None
+            parent = self.scan.links(parent)[0]
+        return row
+
+    # --- QAbstractItemModel
+
+    def index(self, row, column, parent=QModelIndex()):
+        if row < 0 or column < 0 or column >= len(HEADERS):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, 0) if row == 0 and len(self.scan) else QModelIndex()
+        record = parent.internalId()
+        order = self.order(record)
+        if order is None:
+            _, first, count = self.scan.links(record)
+            return self.createIndex(row, column, first + row) if row < count else QModelIndex()
+        rows = order[0]
+        return self.createIndex(row, column, rows[row]) if row < len(rows) else QModelIndex()
+
+    def parent(self, index):
+        record = self.record_of(index)
+        if not record:
+            return QModelIndex()
+        parent = self.scan.links(record)[0]
+        row = self.row_of(parent)
+        return QModelIndex() if row is None else self.createIndex(row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return 1 if len(self.scan) else 0
+        if parent.column() > 0:
+            return 0
+        order = self.order(parent.internalId())
+        return self.scan.links(parent.internalId())[2] if order is None else len(order[0])
+
+    def hasChildren(self, parent=QModelIndex()):
+        # Без построения порядка: стрелка раскрытия по числу детей в записи
+        if not parent.isValid():
+            return len(self.scan) > 0
+        return parent.column() == 0 and self.scan.links(parent.internalId())[2] > 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record = index.internalId()
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return self.scan.name(record)
+            values = self.scan.record(record)
+            if column == 1:
+                return self.format_size(values.disk_size)
+            if column == 2:
+                return f"{values.files:,}".replace(',', ' ')
+            if values.mtime_ns:
+                return time.strftime('%d.%m.%Y %H:%M', time.localtime(values.mtime_ns / 1e9))
+            return ""
+        if role == Qt.DecorationRole and column == 0:
+            return self._icon
+        if role == Qt.ToolTipRole and column == 1:
+            return f"Размер файлов: {self.format_size(self.scan.record(record).size)}"
+        if role == Qt.TextAlignmentRole and column in (1, 2):
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role == SIZE_ROLE:
+            return self.scan.record(record).disk_size
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.relayout(lambda: self.set_order(column, order))
+
+    def set_order(self, column, order):
+        self.sort_column = column
+        self.sort_order = order
+
+    def set_min_size(self, min_size):
+        self.relayout(lambda: setattr(self, 'min_size', min_size))
+
+    def relayout(self, change):
+        # Запись индекса не меняется, меняется только её строка у родителя
+        self.layoutAboutToBeChanged.emit()
+        change()
+        self._orders.clear()
+        for index in self.persistentIndexList():
+            record = index.internalId()
+            row = self.visible_row(record)
+            self.changePersistentIndex(
+                index, QModelIndex() if row is None else self.createIndex(row, index.column(), record))
+        self.layoutChanged.emit()
+
+    def path(self, index):
+        return self.scan.path_of(index.internalId())
+
+    def format_size(self, bytes):
+        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+            if bytes < 1024:
+                return f"{bytes:.1f} {unit}"
+            bytes /= 1024
+        return f"{bytes:.1f} PB"
+
+
+class ScanFileDialog(QDialog):
+    # Просмотр сохранённого скана (disk-analyzer scan --scan-file), например снятого на
+    # другой машине. Файл отображается в память и читается по мере прокрутки дерева
+    def __init__(self, scan, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.scan = scan
+        self.setWindowTitle(f"Скан {self.scan.root_path}")
+        self.resize(900, 600)
+
+        self.model = ScanFileModel(self.scan, self)
+        layout = QVBoxLayout(self)
+        header = QHBoxLayout()
+        taken = time.strftime('%d.%m.%Y %H:%M:%S', time.localtime(self.scan.created_ns / 1e9))
+        total = self.model.format_size(self.scan.record(0).disk_size) if len(self.scan) else "—"
+        count = f"{len(self.scan):,}".replace(',', ' ')
+        header.addWidget(QLabel(f"Снят {taken}, каталогов: {count}, занято: {total}"))
+        header.addStretch()
+        self.size_filter = size_filter_box(self.model)
+        header.addWidget(self.size_filter)
+        layout.addLayout(header)
+
+        self.view = QTreeView()
+        # Высота строк не запрашивается у модели для каждой строки
+        self.view.setUniformRowHeights(True)
+        self.view.setModel(self.model)
+        self.view.setColumnWidth(0, 400)
+        self.view.setColumnWidth(1, 120)
+        self.view.setSortingEnabled(True)
+        self.view.sortByColumn(1, Qt.DescendingOrder)
+        self.view.expand(self.model.index(0, 0))
+        self.view.clicked.connect(self.show_path)
+        layout.addWidget(self.view)
+
+        self.path_label = QLabel(self.scan.root_path)
+        self.path_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        layout.addWidget(self.path_label)
+
+    def show_path(self, index):
+        self.path_label.setText(self.model.path(index))
+
+    def closeEvent(self, event):
+        # Представление отключается до закрытия отображения: после него записи не читаются
+        self.view.setModel(None)
+        self.scan.close()
+        super().closeEvent(event)
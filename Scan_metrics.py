@@ -0,0 +1,223 @@
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+
+# Верхние границы корзин задержки stat в секундах, как le у гистограмм Prometheus
+STAT_BUCKETS = (1e-6, 2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3,
+                1e-2, 5e-2, 1e-1, 1.0)
+PREFIX = 'diskanalyzer'
+
+
+def mount_points():
+    # st_dev -> точка монтирования по /proc/self/mountinfo (поля: major:minor и путь)
+    mounts = {}
+    try:
+        with open('/proc/self/mountinfo') as f:
+            for line in f:
+                fields = line.split()
+                major, minor = fields[2].split(':')
+                path = re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), fields[4])
+                mounts[os.makedev(int(major), int(minor))] = path
+    except (OSError, ValueError, IndexError):
+        pass
+    return mounts
+
+
+class ScanMetrics:
+    # Счётчики обхода для панели в окне и выгрузки для мониторинга. list_directory копит
+    # задержки stat по каталогу и сдаёт их одним add_directory, поэтому блокировка
+    # берётся раз на каталог, а не на файл. Без объекта метрик обход ничего не замеряет
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_result = None
+        self.entries = 0
+        self.dirs = 0
+        self.cached_dirs = 0
+        self.permission_errors = 0
+        self.other_errors = 0
+        self.scan_seconds = 0.0
+        self.stat_buckets = {}
+        self.stat_sum = {}
+        self.gauges = {}
+        self._scans = 0
+        self._scan_started = 0.0
+        self._lock = threading.Lock()
+
+    def add_directory(self, entries, dev=None, stat_times=()):
+        with self._lock:
+            self.dirs += 1
+            self.entries += entries
+            if stat_times:
+                buckets = self.stat_buckets.get(dev)
+                if buckets is None:
+                    buckets = self.stat_buckets[dev] = [0] * (len(STAT_BUCKETS) + 1)
+                    self.stat_sum[dev] = 0.0
+                for seconds in stat_times:
+                    buckets[bisect_left(STAT_BUCKETS, seconds)] += 1
+                self.stat_sum[dev] += sum(stat_times)
+
+    def add_cached_directory(self):
+        # Каталог не менялся с прошлого обхода и взят из индекса без чтения
+        with self._lock:
+            self.cached_dirs += 1
+
+    def add_error(self, error):
+        with self._lock:
+            if isinstance(error, PermissionError):
+                self.permission_errors += 1
+            else:
+                self.other_errors += 1
+
+    def set_gauge(self, name, value):
+        # Текущее значение и максимум за всё время: глубина очередей и т. п.
+        with self._lock:
+            _, peak = self.gauges.get(name, (0, 0))
+            self.gauges[name] = (value, max(peak, value))
+
+    def mark_first_result(self):
+        if self.first_result is None:
+            self.first_result = time.monotonic() - self.started
+
+    def begin_scan(self):
+        # Вложенные и параллельные обходы считаются одним отрезком времени
+        with self._lock:
+            if self._scans == 0:
+                self._scan_started = time.monotonic()
+            self._scans += 1
+
+    def end_scan(self):
+        with self._lock:
+            self._scans -= 1
+            if self._scans == 0:
+                self.scan_seconds += time.monotonic() - self._scan_started
+
+    def busy_seconds(self):
+        if self._scans:
+            return self.scan_seconds + time.monotonic() - self._scan_started
+        return self.scan_seconds
+
+    def export(self):
+        # Для передачи из процесса обхода: только простые типы, без блокировки
+        with self._lock:
+            return (self.entries, self.dirs, self.cached_dirs, self.permission_errors,
+                    self.other_errors, {dev: list(b) for dev, b in self.stat_buckets.items()},
+                    dict(self.stat_sum))
+
+    def merge(self, exported):
+        entries, dirs, cached_dirs, permission_errors, other_errors, buckets, sums = exported
+        with self._lock:
+            self.entries += entries
+            self.dirs += dirs
+            self.cached_dirs += cached_dirs
+            self.permission_errors += permission_errors
+            self.other_errors += other_errors
+            for dev, counts in buckets.items():
+                own = self.stat_buckets.setdefault(dev, [0] * (len(STAT_BUCKETS) + 1))
+                for i, count in enumerate(counts):
+                    own[i] += count
+                self.stat_sum[dev] = self.stat_sum.get(dev, 0.0) + sums[dev]
+
+    def snapshot(self):
+        busy = self.busy_seconds()
+        mounts = mount_points()
+        with self._lock:
+            latency = {}
+            for dev, counts in self.stat_buckets.items():
+                label = mounts.get(dev, f"{os.major(dev)}:{os.minor(dev)}") if dev is not None else ""
+                latency[label] = {
+                    'count': sum(counts),
+                    'sum_seconds': self.stat_sum[dev],
+                    'buckets': list(counts),
+                }
+            return {
+                'uptime_seconds': time.monotonic() - self.started,
+                'scan_seconds': busy,
+                'entries': self.entries,
+                'dirs': self.dirs,
+                'cached_dirs': self.cached_dirs,
+                'entries_per_second': self.entries / busy if busy else 0.0,
+                'permission_errors': self.permission_errors,
+                'other_errors': self.other_errors,
+                'first_result_seconds': self.first_result,
+                'queues': {name: {'depth': value, 'max': peak}
+                           for name, (value, peak) in self.gauges.items()},
+                'stat_latency': latency,
+            }
+
+    def to_json(self):
+        data = self.snapshot()
+        data['stat_buckets_le'] = list(STAT_BUCKETS) + ['+Inf']
+        return json.dumps(data, ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        data = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{PREFIX}_{name}{labels} {value}")
+
+        metric('entries_total', 'counter', "Записей прочитано при обходе",
+               [('', data['entries'])])
+        metric('directories_total', 'counter', "Каталогов прочитано", [('', data['dirs'])])
+        metric('cached_directories_total', 'counter', "Каталогов взято из индекса без чтения",
+               [('', data['cached_dirs'])])
+        metric('scan_seconds_total', 'counter', "Время, занятое обходами",
+               [('', data['scan_seconds'])])
+        metric('entries_per_second', 'gauge', "Средняя скорость обхода",
+               [('', data['entries_per_second'])])
+        metric('errors_total', 'counter', "Ошибки чтения каталогов и stat",
+               [('{kind="permission"}', data['permission_errors']),
+                ('{kind="other"}', data['other_errors'])])
+        if data['first_result_seconds'] is not None:
+            metric('first_result_seconds', 'gauge', "Время до первого результата от запуска",
+                   [('', data['first_result_seconds'])])
+        if data['queues']:
+            metric('queue_depth', 'gauge', "Глубина очереди",
+                   [(f'{{queue="{name}"}}', q['depth']) for name, q in data['queues'].items()])
+            metric('queue_depth_max', 'gauge', "Наибольшая глубина очереди",
+                   [(f'{{queue="{name}"}}', q['max']) for name, q in data['queues'].items()])
+
+        samples = []
+        for mount, latency in data['stat_latency'].items():
+            label = mount.replace('\\', '\\\\').replace('"', '\\"')
+            cumulative = 0
+            for bound, count in zip(list(STAT_BUCKETS) + ['+Inf'], latency['buckets']):
+                cumulative += count
+                samples.append((f'_bucket{{mount="{label}",le="{bound}"}}', cumulative))
+            samples.append((f'_sum{{mount="{label}"}}', latency['sum_seconds']))
+            samples.append((f'_count{{mount="{label}"}}', latency['count']))
+        if samples:
+            lines.append(f"# HELP {PREFIX}_stat_seconds "
+                         "Задержка stat по точкам монтирования (выборка, см. Scan_engine.STAT_SAMPLE)")
+            lines.append(f"# TYPE {PREFIX}_stat_seconds histogram")
+            lines.extend(f"{PREFIX}_stat_seconds{suffix} {value}" for suffix, value in samples)
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        # .json — JSON, иначе текстовый формат Prometheus (для textfile collector).
+        # Файл подменяется целиком, чтобы сборщик не прочитал его наполовину записанным
+        text = self.to_json() if path.endswith('.json') else self.to_prometheus()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+def percentile(buckets, fraction):
+    # Верхняя граница корзины, в которую попадает доля fraction замеров
+    total = sum(buckets)
+    if not total:
+        return None
+    target = fraction * total
+    cumulative = 0
+    for bound, count in zip(STAT_BUCKETS, buckets):
+        cumulative += count
+        if cumulative >= target:
+            return bound
+    return float('inf')
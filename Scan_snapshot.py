@@ -0,0 +1,114 @@
+import heapq
+import os
+import time
+from collections import namedtuple
+from operator import itemgetter
+from urllib.parse import quote, unquote
+from Compact_tree import CompactTree
+
+SNAPSHOT_SUFFIX = '.snap'
+
+DiffEntry = namedtuple('DiffEntry', ['path', 'old_size', 'new_size', 'delta', 'status'])
+
+
+def default_snapshot_dir():
+    data_dir = os.environ.get('XDG_DATA_HOME') or os.path.join(
+        os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(data_dir, 'disk-analyzer', 'snapshots')
+
+
+def snapshot_name(root_path, created_ns):
+    # Корень кодируется целиком, чтобы /a_b и /a/b не смешивались. Микросекунды
+    # фиксированной ширины: снимки одной секунды не затирают друг друга и сортируются
+    seconds, ns = divmod(created_ns, 10 ** 9)
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(seconds))
+    return f"{quote(root_path, safe='')}@{stamp}.{ns // 1000:06d}{SNAPSHOT_SUFFIX}"
+
+
+def save_snapshot(tree, directory=None):
+    directory = directory or default_snapshot_dir()
+    os.makedirs(directory, exist_ok=True)
+    compact = tree if isinstance(tree, CompactTree) else CompactTree.from_scan_tree(tree)
+    compact.created_ns = time.time_ns()
+    path = os.path.join(directory, snapshot_name(compact.root_path, compact.created_ns))
+    while os.path.exists(path):
+        # Часы с грубым шагом: следующая микросекунда
+        compact.created_ns += 1000
+        path = os.path.join(directory, snapshot_name(compact.root_path, compact.created_ns))
+    compact.save(path)
+    return path
+
+
+def list_snapshots(root_path, directory=None):
+    # Снимки корня от старых к новым (метка времени в имени сортируется как строка)
+    directory = directory or default_snapshot_dir()
+    root_path = os.path.normpath(root_path)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    found = []
+    for name in names:
+        root, sep, rest = name.rpartition('@')
+        if sep and rest.endswith(SNAPSHOT_SUFFIX) and unquote(root) == root_path:
+            found.append(os.path.join(directory, name))
+    return sorted(found)
+
+
+def child_names(tree, index):
+    # Имя -> индекс для детей узла; срезы берутся из пула напрямую, без вызовов на ребёнка
+    names = tree.names
+    name_start = tree.name_start
+    name_len = tree.name_len
+    end = tree.end
+    result = {}
+    child = index + 1
+    stop = end[index]
+    while child < stop:
+        start = name_start[child]
+        result[names[start:start + name_len[child]]] = child
+        child = end[child]
+    return result
+
+
+def diff_trees(old, new, limit=None):
+    # Оба дерева обходятся одновременно от корня, дети сопоставляются по имени через
+    # словарь, поэтому время линейно по числу узлов. Для добавленного или удалённого
+    # каталога выводится только он сам, без содержимого.
+    if old.root_path != new.root_path:
+        raise ValueError(f"Снимки разных каталогов: {old.root_path} и {new.root_path}")
+    changes = []
+    old_disk = old.disk_size
+    new_disk = new.disk_size
+    if len(old) and len(new):
+        stack = [(0, 0)]
+        while stack:
+            o, n = stack.pop()
+            if old_disk[o] != new_disk[n]:
+                changes.append((new_disk[n] - old_disk[o], new, n, old_disk[o], new_disk[n],
+                                'changed'))
+            if new.end[n] == n + 1 and old.end[o] == o + 1:
+                continue
+            old_children = child_names(old, o)
+            for name, c in child_names(new, n).items():
+                match = old_children.pop(name, None)
+                if match is None:
+                    if new_disk[c]:
+                        changes.append((new_disk[c], new, c, 0, new_disk[c], 'added'))
+                else:
+                    stack.append((match, c))
+            for c in old_children.values():
+                if old_disk[c]:
+                    changes.append((-old_disk[c], old, c, old_disk[c], 0, 'removed'))
+
+    key = itemgetter(0)
+    if limit is None:
+        changes.sort(key=key, reverse=True)
+    else:
+        # Пути собираются только для того, что будет показано
+        grown = heapq.nlargest(limit, (c for c in changes if c[0] > 0), key=key)
+        shrunk = heapq.nsmallest(limit, (c for c in changes if c[0] < 0), key=key)
+        changes = grown + shrunk[::-1]
+
+    return [DiffEntry(tree.path_of(index), old_size, new_size, delta, status)
+            for delta, tree, index, old_size, new_size, status in changes]
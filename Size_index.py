@@ -0,0 +1,95 @@
+import os
+import sqlite3
+
+SCHEMA_VERSION = 3
+
+
+def default_index_path():
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'disk-analyzer', 'index.sqlite')
+
+
+def subtree_range(root_path):
+    # Все пути внутри root_path лежат в полуинтервале [prefix, upper):
+    # '0' следует за '/' в порядке сравнения строк
+    prefix = root_path if root_path.endswith(os.sep) else root_path + os.sep
+    upper = prefix[:-1] + chr(ord(os.sep) + 1)
+    return prefix, upper
+
+
+class SizeIndex:
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        self._conn = None
+
+    def connection(self):
+        # Соединение открывается в том потоке, который им пользуется
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            # Индекс — это кэш: при смене формата он просто строится заново
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                with self._conn:
+                    self._conn.execute("DROP TABLE IF EXISTS dirs")
+                    self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dirs ("
+                " path TEXT PRIMARY KEY,"
+                " ino INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " own_size INTEGER NOT NULL,"
+                " own_disk INTEGER NOT NULL,"
+                " own_files INTEGER NOT NULL,"
+                " own_links INTEGER NOT NULL"
+                ") WITHOUT ROWID")
+        return self._conn
+
+    def _select_subtree(self, columns, root_path):
+        prefix, upper = subtree_range(root_path)
+        return self.connection().execute(
+            f"SELECT {columns} FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+            (root_path, prefix, upper))
+
+    def cached_size(self, root_path):
+        root_path = os.path.normpath(root_path)
+        if self.connection().execute(
+                "SELECT 1 FROM dirs WHERE path = ?", (root_path,)).fetchone() is None:
+            return None
+        size, disk_size = self._select_subtree("SUM(own_size), SUM(own_disk)", root_path).fetchone()
+        return size or 0, disk_size or 0
+
+    def load(self, root_path):
+        root_path = os.path.normpath(root_path)
+        known = {}
+        columns = "path, ino, mtime_ns, own_size, own_disk, own_files, own_links"
+        for path, *record in self._select_subtree(columns, root_path):
+            known[path] = (*record, [])
+
+        for path in known:
+            if path != root_path:
+                parent = known.get(os.path.dirname(path))
+                if parent is not None:
+                    parent[6].append(os.path.basename(path))
+        return known
+
+    def save(self, tree):
+        records = (
+            (path, node.ino, node.mtime_ns, node.own_size, node.own_disk, node.own_files,
+             node.own_links)
+            for path, node in tree.walk()
+        )
+        prefix, upper = subtree_range(tree.root_path)
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                "DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                (tree.root_path, prefix, upper))
+            conn.executemany("INSERT INTO dirs VALUES (?, ?, ?, ?, ?, ?, ?)", records)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,885 @@
+import os
+import threading
+from collections import namedtuple
+from PySide6.QtCore import (Qt, QTimer, QObject, QAbstractItemModel, QSortFilterProxyModel,
+                            QModelIndex, QPersistentModelIndex, QItemSelection,
+                            QItemSelectionModel, QDir, Signal)
+from PySide6.QtWidgets import QComboBox
+from Scan_engine import is_under, allocated_size
+
+# Результаты копятся один кадр и уходят в представление одним dataChanged на родителя
+FRAME_INTERVAL = 16
+# Порядок и фильтр по размеру обновляются реже: это проход по всем строкам родителя
+REFILTER_INTERVAL = 500
+# Столько индексов строк SizeOrderModel в QFileSystemModel хранится между перестройками
+SOURCE_CACHE = 2000
+
+# Занятое место в байтах для сортировки и фильтра; -1, пока оно неизвестно
+SIZE_ROLE = Qt.UserRole + 1
+
+SIZE_FILTERS = [
+    ("Все элементы", 0),
+    ("Больше 1 MB", 1024 ** 2),
+    ("Больше 10 MB", 10 * 1024 ** 2),
+    ("Больше 100 MB", 100 * 1024 ** 2),
+    ("Больше 1 GB", 1024 ** 3),
+    ("Больше 10 GB", 10 * 1024 ** 3),
+]
+
+
+def size_filter_box(model, parent=None):
+    box = QComboBox(parent)
+    for text, min_size in SIZE_FILTERS:
+        box.addItem(text, min_size)
+    box.currentIndexChanged.connect(lambda i: model.set_min_size(box.itemData(i)))
+    return box
+
+
+# Строки каталога так, как их покажет QFileSystemModel, по имени. sizes — занятое место
+# файлов, у каталогов -1 (их размер считает поток обхода); rows — номер строки по имени
+Listing = namedtuple('Listing', ['names', 'dirs', 'sizes', 'rows'])
+
+
+def child_path(parent, name):
+    # Пути QFileSystemModel всегда через "/", в том числе на Windows
+    return parent + name if parent.endswith('/') else parent + '/' + name
+
+
+def list_sizes(path, hidden=False):
+    # Фильтр QFileSystemModel по умолчанию: без скрытых и «системных» записей —
+    # сокетов, каналов, устройств и битых ссылок
+    found = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if not hidden and entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir():
+                        found.append((entry.name, True, -1))
+                    elif entry.is_file():
+                        found.append((entry.name, False,
+                                      allocated_size(entry.stat(follow_symlinks=False))))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    # При равных размерах строки остаются в порядке имён
+    found.sort(key=lambda item: item[0].casefold())
+    names = [item[0] for item in found]
+    return Listing(names, [item[1] for item in found], [item[2] for item in found],
+                   {name: row for row, name in enumerate(names)})
+
+
+class DirectoryLister(QObject):
+    # Списки каталогов с занятым местом файлов читаются в отдельных потоках: stat каждого
+    # файла на GUI-потоке замораживал окно на больших и сетевых каталогах.
+    # Готовые списки забирает таймер и сообщает о них одним сигналом listed.
+    listed = Signal(list)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.hidden = False
+        self._cache = {}
+        self._results = {}
+        self._in_flight = set()
+        self._again = set()
+        self._lock = threading.Lock()
+
+        self._collect_timer = QTimer(self)
+        self._collect_timer.setInterval(FRAME_INTERVAL)
+        self._collect_timer.timeout.connect(self.collect)
+
+    def get(self, path):
+        return self._cache.get(path)
+
+    def request(self, path):
+        # Каталог, который уже читается, прочитается ещё раз: он мог измениться после начала
+        with self._lock:
+            if path in self._in_flight:
+                self._again.add(path)
+                return
+            self._in_flight.add(path)
+        threading.Thread(target=self._list, args=(path, self.hidden), daemon=True).start()
+        if not self._collect_timer.isActive():
+            self._collect_timer.start()
+
+    def busy(self):
+        with self._lock:
+            return bool(self._in_flight or self._results)
+
+    def paths(self):
+        return list(self._cache)
+
+    def forget(self, path):
+        for cached in [p for p in self._cache if p == path or is_under(p, path)]:
+            del self._cache[cached]
+
+    def clear(self):
+        self._cache.clear()
+
+    def _list(self, path, hidden):
+        listing = list_sizes(path, hidden)
+        with self._lock:
+            self._results[path] = listing
+            self._in_flight.discard(path)
+
+    def collect(self):
+        with self._lock:
+            results = self._results
+            self._results = {}
+            again = self._again & results.keys()
+            self._again -= again
+            if not self._in_flight and not again:
+                self._collect_timer.stop()
+
+        self._cache.update(results)
+        for path in again:
+            self.request(path)
+        if results:
+            self.listed.emit(list(results))
+
+
+class SizeOrderModel(QAbstractItemModel):
+    # Строки каталогов в порядке занятого места. Представление показывает эту модель
+    # только при сортировке по колонке размера. Строки и размеры файлов берутся из списков
+    # DirectoryLister, размеры каталогов — из кэша SizeProxyModel, так что порядок и фильтр
+    # строятся на Python без вызовов Qt на строку. Ячейки показывает SizeProxyModel.
+    # flags не переопределён и остаётся в C++: QTreeView при раскладке спрашивает флаги
+    # у каждой строки дважды.
+    # internalId индекса — номер узла его родителя. Узел — каталог по пути, узел 0 —
+    # верхний уровень QFileSystemModel, его строки хранят полные пути
+    def __init__(self, sizes, order=Qt.DescendingOrder):
+        super().__init__(sizes)
+        self.sizes = sizes
+        self.files = sizes.sourceModel()
+        self.sort_order = order
+        self._paths = [""]
+        self._nodes = {"": 0}
+        self._built = {}
+        self._keys = {}
+        self._sources = {}
+        self._saved = []
+        self._columns = self.files.columnCount()
+        self._top = self.top_listing()
+        self._connections = [
+            (sizes.dataChanged, self.source_data_changed),
+            (sizes.modelAboutToBeReset, self.beginResetModel),
+            (sizes.modelReset, self.source_reset),
+        ]
+        for signal, slot in self._connections:
+            signal.connect(slot)
+
+    def detach(self):
+        # Представление вернулось к SizeProxyModel: порядок по размеру больше не нужен
+        for signal, slot in self._connections:
+            signal.disconnect(slot)
+        self.deleteLater()
+
+    def top_listing(self):
+        # Верхний уровень — корень ФС или список дисков: несколько строк, они читаются у модели
+        files = self.files
+        indexes = [files.index(row, 0) for row in range(files.rowCount())]
+        names = [files.filePath(index) for index in indexes]
+        return Listing(names, [files.isDir(index) for index in indexes], [-1] * len(names),
+                       {name: row for row, name in enumerate(names)})
+
+    def listing(self, node):
+        return self._top if not node else self.sizes.lister.get(self._paths[node])
+
+    def node(self, path):
+        node = self._nodes.get(path)
+        if node is None:
+            node = self._nodes[path] = len(self._paths)
+            self._paths.append(path)
+        return node
+
+    def child_path(self, node, name):
+        return name if not node else child_path(self._paths[node], name)
+
+    def build(self, node):
+        # (список каталога, номера его строк в порядке размера, позиция каждой строки
+        # здесь или -1, если её скрыл фильтр по размеру)
+        listing = self.listing(node)
+        if listing is None:
+            return None
+        cache = self.sizes.size_cache
+        keys = list(listing.sizes)
+        for row, is_dir in enumerate(listing.dirs):
+            if is_dir:
+                keys[row] = cache.get(self.child_path(node, listing.names[row]), -1)
+        # Сортировка устойчивая: при равных размерах остаётся порядок по имени
+        rows = sorted(range(len(keys)), key=keys.__getitem__,
+                      reverse=self.sort_order == Qt.DescendingOrder)
+        min_size = self.sizes.min_size
+        if min_size:
+            accepts = self.sizes.accepts
+            rows = [row for row in rows if keys[row] < 0 or keys[row] >= min_size
+                    or accepts(self.child_path(node, listing.names[row]), keys[row])]
+        positions = [-1] * len(keys)
+        for position, row in enumerate(rows):
+            positions[row] = position
+        return listing, rows, positions
+
+    def rows(self, node):
+        # Строки узла строятся при первом обращении; None, пока список каталога не прочитан
+        built = self._built.get(node)
+        if built is None:
+            built = self.build(node)
+            if built is not None:
+                self._built[node] = built
+        return built
+
+    def path(self, index):
+        node = index.internalId()
+        listing, rows, _ = self._built[node]
+        return self.child_path(node, listing.names[rows[index.row()]])
+
+    def view_index(self, path, column=0):
+        # Индекс строки по пути; недействителен, если строка или кто-то из предков скрыт
+        # или их каталог ещё не прочитан
+        if path in self._top.rows:
+            node, name = 0, path
+        else:
+            parent = os.path.dirname(path)
+            if parent == path or not self.view_index(parent).isValid():
+                return QModelIndex()
+            node, name = self.node(parent), os.path.basename(path)
+        built = self.rows(node)
+        row = built[0].rows.get(name) if built is not None else None
+        if row is None or built[2][row] < 0:
+            return QModelIndex()
+        return self.createIndex(built[2][row], column, node)
+
+    def parent_key(self, parent):
+        # (узел, число строк) родителя. Представление запрашивает строки одного родителя
+        # подряд: ключ запоминается до перестройки. QModelIndex хешируется по значению,
+        # так что сам индекс служит ключом словаря
+        key = self._keys.get(parent)
+        if key is None:
+            if parent.column() > 0:
+                return 0, 0
+            node = self.node(self.path(parent)) if parent.isValid() else 0
+            built = self.rows(node)
+            if built is None:
+                return node, 0
+            key = self._keys[parent] = node, len(built[1])
+        return key
+
+    def index(self, row, column, parent=QModelIndex()):
+        # Вызывается на каждую строку при раскладке, поэтому без лишних вызовов Qt
+        node, count = self._keys.get(parent) or self.parent_key(parent)
+        if 0 <= row < count and 0 <= column < self._columns:
+            return self.createIndex(row, column, node)
+        return QModelIndex()
+
+    def parent(self, child=None):
+        if child is None:
+            return QObject.parent(self)
+        if not child.isValid() or not child.internalId():
+            return QModelIndex()
+        return self.view_index(self._paths[child.internalId()])
+
+    def hasChildren(self, parent=QModelIndex()):
+        # Тоже вызывается на каждую строку: у недействительного индекса строка -1
+        row = parent.row()
+        if row < 0:
+            return True
+        node = parent.internalId()
+        try:
+            listing, rows, _ = self._built[node]
+            row = rows[row]
+        except (KeyError, IndexError):
+            return False
+        if not listing.dirs[row] or parent.column() > 0:
+            return False
+        # Пока каталог не прочитан, стрелка раскрытия остаётся
+        child = self._built.get(self._nodes.get(self.child_path(node, listing.names[row])))
+        return child is None or bool(child[1])
+
+    def rowCount(self, parent=QModelIndex()):
+        return self.parent_key(parent)[1]
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.column() > 0 else self._columns
+
+    def canFetchMore(self, parent):
+        if not parent.isValid() or parent.column() > 0:
+            return False
+        return self.rows(self.node(self.path(parent))) is None
+
+    def fetchMore(self, parent):
+        if self.canFetchMore(parent):
+            self.sizes.lister.request(self.path(parent))
+
+    def source_index(self, index):
+        # QFileSystemModel.index(path) ищет строку перебором детей каталога, на большом
+        # каталоге это сотни микросекунд: индексы показанных строк запоминаются до
+        # следующей перестройки
+        key = index.internalId(), index.row()
+        source = self._sources.get(key)
+        if source is None:
+            if len(self._sources) >= SOURCE_CACHE:
+                self._sources.clear()
+            source = self._sources[key] = QPersistentModelIndex(
+                self.sizes.mapFromSource(self.files.index(self.path(index))))
+        return source.sibling(source.row(), index.column())
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        return self.sizes.data(self.source_index(index), role)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        return self.sizes.headerData(section, orientation, role)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sizes.sort(column, order)
+
+    def set_order(self, order):
+        # Размеры уже собраны: меняется только порядок
+        self.sort_order = order
+        self.rebuild(list(self._built))
+
+    def refilter(self):
+        self.rebuild(list(self._built))
+
+    def resort(self, paths):
+        # Пересобираются только каталоги, у детей которых изменился размер
+        self.rebuild([node for node in map(self._nodes.get, paths) if node in self._built])
+
+    def listed(self, paths):
+        # Прочитанный впервые каталог получает строки, прочитанный заново — пересобирается
+        if "" in paths:
+            self._top = self.top_listing()
+        nodes = [node for node in map(self._nodes.get, paths) if node is not None]
+        relisted = [node for node in nodes if node in self._built]
+        for node in [node for node in nodes if node not in self._built]:
+            parent = self.view_index(self._paths[node])
+            built = self.build(node)
+            if built is None:
+                continue
+            if parent.isValid() and built[1]:
+                self.beginInsertRows(parent, 0, len(built[1]) - 1)
+                self._built[node] = built
+                self._keys.clear()
+                self._sources.clear()
+                self.endInsertRows()
+            else:
+                self._built[node] = built
+        self.rebuild(relisted)
+
+    # --- изменения
+
+    def rebuild(self, nodes):
+        if not nodes:
+            return
+        self.begin_layout()
+        for node in nodes:
+            built = self.build(node)
+            if built is not None:
+                self._built[node] = built
+        self.end_layout()
+
+    def begin_layout(self):
+        # Сохранённые индексы переносятся по путям: строки встают на новые места
+        self.layoutAboutToBeChanged.emit()
+        self._saved.append([(index, self.path(index)) for index in self.persistentIndexList()])
+
+    def end_layout(self):
+        self._keys = {}
+        self._sources.clear()
+        saved = self._saved.pop()
+        self.changePersistentIndexList(
+            [index for index, _ in saved],
+            [self.view_index(path, index.column()) for index, path in saved])
+        self.layoutChanged.emit()
+
+    def source_data_changed(self, top_left, bottom_right, roles=()):
+        # Строки источника идут в другом порядке: изменения передаются по именам строк
+        sizes = self.sizes
+        files = self.files
+        parent = top_left.parent()
+        node = 0
+        if parent.isValid():
+            path = files.filePath(sizes.mapToSource(parent))
+            node = self._nodes.get(path)
+            if node not in self._built or not self.view_index(path).isValid():
+                return
+        listing, _, positions = self.rows(node)
+        name_of = files.fileName if node else files.filePath
+        changed = []
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            found = listing.rows.get(name_of(sizes.mapToSource(sizes.index(row, 0, parent))))
+            if found is not None and positions[found] >= 0:
+                changed.append(positions[found])
+        if changed:
+            self.dataChanged.emit(self.createIndex(min(changed), top_left.column(), node),
+                                  self.createIndex(max(changed), bottom_right.column(), node),
+                                  roles)
+
+    def shows(self, path):
+        return self._nodes.get(path) in self._built
+
+    def relist(self):
+        for node in self._built:
+            if node:
+                self.sizes.lister.request(self._paths[node])
+
+    def source_reset(self):
+        self._built.clear()
+        self._keys = {}
+        self._sources.clear()
+        self._top = self.top_listing()
+        self.endResetModel()
+
+
+class SizeProxyModel(QSortFilterProxyModel):
+    # Общая часть моделей главного окна и окна очистки: колонка 1 показывает размер
+    # каталога, который считает ThreadCalculator. Подкласс задаёт self.drives до вызова __init__.
+    # Поток обхода общий для всех моделей (shared_calculator) и вместе с модулями обхода
+    # загружается при первом обращении к self.calculator, а не при создании окна.
+    #
+    # Строки отображает и фильтрует QSortFilterProxyModel, в C++; по имени, типу и дате
+    # сортирует сам QFileSystemModel. Для сортировки по размеру представление переключается
+    # на SizeOrderModel (show_in), когда прочитаны списки показанных каталогов. Индексы
+    # представления переводятся в индексы QFileSystemModel через to_view и from_view.
+    # Занятое место файлов приходит из DirectoryLister: каталог читается в фоне, как только
+    # QFileSystemModel его загрузил, и к сортировке список обычно уже готов.
+    # Модель подключилась к новому потоку обхода: первому или запущенному после остановки
+    calculator_started = Signal(object)
+    # Изменилось выделение в представлении, какая бы модель в нём ни была
+    selection_changed = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._calculator = None
+        self.size_cache = {}
+        self.raw_cache = {}
+        self.progress_cache = {}
+        self.lister = DirectoryLister(self)
+        self.lister.listed.connect(self.listed)
+        # Каталоги, файлы которых фильтр показал без размера: список ещё читался
+        self._unknown = set()
+        self._parent_listings = None
+        self.min_size = 0
+        self.view = None
+        self.size_order = None
+        self._waiting = None
+        self._switching = False
+        self._stale = set()
+        self._relist = set()
+        self._changed = set()
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(FRAME_INTERVAL)
+        self._flush_timer.timeout.connect(self.flush_changes)
+        self._refilter_timer = QTimer(self)
+        self._refilter_timer.setSingleShot(True)
+        self._refilter_timer.setInterval(REFILTER_INTERVAL)
+        self._refilter_timer.timeout.connect(self.refilter_stale)
+
+    def setSourceModel(self, model):
+        super().setSourceModel(model)
+        self.lister.hidden = bool(model.filter() & QDir.Hidden)
+        model.directoryLoaded.connect(self.lister.request)
+        model.rowsInserted.connect(self.source_rows_changed)
+        model.rowsRemoved.connect(self.source_rows_changed)
+        model.modelReset.connect(self.lister.clear)
+
+    @property
+    def calculator(self):
+        if self._calculator is None or self._calculator.isFinished():
+            from ThreadCalculator import shared_calculator
+            self._calculator = shared_calculator()
+            self._calculator.worker.calculated.connect(self.update_size)
+            self._calculator.worker.progress.connect(self.update_progress)
+            self._calculator.worker.removed.connect(self.forget_sizes)
+            self.calculator_started.emit(self._calculator)
+        return self._calculator
+
+    def running_calculator(self):
+        # Без запуска потока: None, если размеры ещё ни разу не запрашивались
+        if self._calculator is None or self._calculator.isFinished():
+            return None
+        return self._calculator
+
+    def release_calculator(self):
+        # Общий поток продолжает работать на другие модели, эта больше не получает размеры
+        if self._calculator is not None:
+            self._calculator.worker.calculated.disconnect(self.update_size)
+            self._calculator.worker.progress.disconnect(self.update_progress)
+            self._calculator.worker.removed.disconnect(self.forget_sizes)
+            self._calculator = None
+
+    def clear_sizes(self):
+        self.size_cache.clear()
+        self.raw_cache.clear()
+        self.progress_cache.clear()
+        self.lister.clear()
+        if self.size_order is not None:
+            self.size_order.relist()
+        self.refilter()
+
+    # --- представление
+
+    def show_in(self, view):
+        self.view = view
+        view.setModel(self)
+        self.connect_selection()
+
+    def view_model(self):
+        return self if self.size_order is None else self.size_order
+
+    def to_view(self, source_index):
+        if self.size_order is None:
+            return self.mapFromSource(source_index)
+        if not source_index.isValid():
+            return QModelIndex()
+        return self.size_order.view_index(self.sourceModel().filePath(source_index),
+                                          source_index.column())
+
+    def from_view(self, index):
+        if self.size_order is not None and index.model() is self.size_order:
+            return self.sourceModel().index(self.size_order.path(index), index.column())
+        return self.mapToSource(index)
+
+    def connect_selection(self):
+        self.view.selectionModel().selectionChanged.connect(self.selection_changed)
+
+    def switch_view(self, model):
+        # Раскрытые каталоги, корень, выделение и ширины колонок переносятся по путям
+        view = self.view
+        files = self.sourceModel()
+        old = view.model()
+        path_of = lambda index: files.filePath(self.from_view(index))
+        expanded = [path_of(index) for index in old.persistentIndexList()
+                    if index.column() == 0 and view.isExpanded(index)]
+        selected = [path_of(index) for index in view.selectionModel().selectedRows()]
+        current = view.currentIndex()
+        current = path_of(current) if current.isValid() else None
+        root = view.rootIndex()
+        root = self.from_view(root) if root.isValid() else QModelIndex()
+        header = view.header().saveState()
+
+        if model is self and self.size_order is not None:
+            self.size_order.detach()
+        self.size_order = None if model is self else model
+        # Пока показан порядок по размеру, фильтр здесь пропускает все строки: через них
+        # SizeOrderModel берёт данные ячеек. Строки перестраиваются, пока этой модели
+        # нет в представлении
+        if self.min_size and model is self:
+            self.refilter()
+        self._switching = True
+        try:
+            # Корень от прежней модели не должен попасть в новую
+            view.setRootIndex(QModelIndex())
+            view.setModel(model)
+            view.header().restoreState(header)
+        finally:
+            self._switching = False
+        if self.min_size and model is not self:
+            self.refilter()
+
+        view.setRootIndex(self.to_view(root))
+        for path in expanded:
+            view.expand(self.to_view(files.index(path)))
+        selection = QItemSelection()
+        for path in selected:
+            index = self.to_view(files.index(path))
+            if index.isValid():
+                selection.select(index, index)
+        view.selectionModel().select(
+            selection, QItemSelectionModel.Select | QItemSelectionModel.Rows)
+        if current is not None:
+            index = self.to_view(files.index(current))
+            view.selectionModel().setCurrentIndex(index, QItemSelectionModel.NoUpdate)
+            view.scrollTo(index)
+        self.connect_selection()
+        self.selection_changed.emit()
+
+    # --- сортировка и фильтр
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # Представление вызывает sort и при смене модели в switch_view — такие вызовы,
+        # как и повтор от QTreeView.sortByColumn, пропускаются
+        if self._switching:
+            return
+        if column == 1:
+            if self.view is None:
+                return
+            if self.size_order is None:
+                self.wait_listings(order)
+            elif self.size_order.sort_order != order:
+                self.size_order.set_order(order)
+            return
+        self._waiting = None
+        self.sourceModel().sort(column, order)
+        if self.size_order is not None:
+            self.switch_view(self)
+
+    def wait_listings(self, order):
+        # Представление переключается, когда прочитаны корень с предками и раскрытые
+        # каталоги: иначе их строки пропали бы из дерева до конца чтения
+        view = self.view
+        files = self.sourceModel()
+        paths = [files.filePath(self.mapToSource(index)) for index in self.persistentIndexList()
+                 if index.column() == 0 and view.isExpanded(index)]
+        root = view.rootIndex()
+        path = files.filePath(self.mapToSource(root)) if root.isValid() else ""
+        while path:
+            paths.append(path)
+            up = os.path.dirname(path)
+            path = up if up != path else ""
+        self._waiting = order, paths
+        for path in paths:
+            if self.lister.get(path) is None:
+                self.lister.request(path)
+        self.switch_when_listed()
+
+    def switch_when_listed(self):
+        order, paths = self._waiting
+        if all(self.lister.get(path) is not None for path in paths):
+            self._waiting = None
+            self.switch_view(SizeOrderModel(self, order))
+
+    def listed(self, paths):
+        if self.size_order is not None:
+            self.size_order.listed(paths)
+        elif self._waiting is not None:
+            self.switch_when_listed()
+        if self.min_size and self.size_order is None and self._unknown.intersection(paths):
+            self.refilter()
+
+    def busy(self):
+        # Списки каталогов ещё читаются или представление ждёт их для сортировки
+        return self.lister.busy() or self._waiting is not None
+
+    def source_rows_changed(self, parent, first, last):
+        self.relist(self.sourceModel().filePath(parent))
+
+    def relist(self, path, inside=False):
+        # Прочитанные списки каталога (и каталогов внутри) устарели: они перечитываются
+        # с задержкой, как и порядок. Пустой путь — верхний уровень QFileSystemModel
+        if not path:
+            paths = {path}
+        elif inside:
+            paths = {p for p in self.lister.paths() if p == path or is_under(p, path)}
+        else:
+            paths = {path} if self.lister.get(path) is not None else set()
+        if paths - self._relist:
+            self._relist |= paths
+            if not self._refilter_timer.isActive():
+                self._refilter_timer.start()
+
+    def set_min_size(self, min_size):
+        self.min_size = min_size
+        self.refilter()
+
+    def refilter(self):
+        # Пока показан порядок по размеру, строки отбирает SizeOrderModel.
+        # Пока QSortFilterProxyModel перестраивает строки, путь и список каждого родителя
+        # запоминаются: фильтр спрашивает строки одного родителя подряд
+        self._stale.clear()
+        if self.size_order is not None:
+            self.size_order.refilter()
+            return
+        self._unknown.clear()
+        self._parent_listings = {}
+        try:
+            self.invalidateRowsFilter()
+        finally:
+            self._parent_listings = None
+
+    def refilter_stale(self):
+        relist, self._relist = self._relist, set()
+        for path in relist:
+            if not path:
+                if self.size_order is not None:
+                    self.size_order.listed([path])
+            elif self.min_size or self.size_order is not None and self.size_order.shows(path):
+                self.lister.request(path)
+            else:
+                self.lister.forget(path)
+        if not self._stale:
+            return
+        if self.size_order is not None:
+            paths, self._stale = self._stale, set()
+            self.size_order.resort(paths)
+        elif self.min_size:
+            self.refilter()
+
+    def parent_listing(self, source_parent):
+        found = None
+        if self._parent_listings is not None:
+            found = self._parent_listings.get(source_parent.internalId())
+        if found is None:
+            path = self.sourceModel().filePath(source_parent)
+            listing = self.lister.get(path)
+            if listing is None and path not in self._unknown:
+                self._unknown.add(path)
+                self.lister.request(path)
+            found = path, listing
+            if self._parent_listings is not None:
+                self._parent_listings[source_parent.internalId()] = found
+        return found
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self.min_size or self.size_order is not None:
+            return True
+        model = self.sourceModel()
+        if not source_parent.isValid():
+            path = model.filePath(model.index(source_row, 0))
+            return self.accepts(path, self.size_cache.get(path, -1))
+        parent, listing = self.parent_listing(source_parent)
+        name = model.fileName(model.index(source_row, 0, source_parent))
+        path = child_path(parent, name)
+        size = self.size_cache.get(path)
+        if size is None:
+            row = listing.rows.get(name) if listing is not None else None
+            size = -1 if row is None else listing.sizes[row]
+        return self.accepts(path, size)
+
+    def accepts(self, path, size):
+        # Каталог с ещё неизвестным размером остаётся видимым, пока размер считается,
+        # файл — пока читается список его каталога.
+        # Диски и путь к ним не скрываются: размер каталога над точкой монтирования
+        # посчитан без неё
+        if size < 0 or size >= self.min_size:
+            return True
+        return any(drive == path or is_under(drive, path) for drive in self.drives)
+
+    def directory_size(self, source_index, path):
+        # Тип берётся из кэша QFileSystemModel, без обращения к диску
+        model = self.sourceModel()
+        if not model.isDir(source_index) and not model.fileInfo(source_index).isSymLink():
+            return None
+        if path in self.size_cache:
+            return self.format_usage(path)
+        self.calculator.add_task(path)
+        return self.progress_cache.get(path, "Вычисление...")
+
+    def path_size(self, path):
+        # Занятое место: у каталогов — посчитанное потоком обхода, у файлов — из списка
+        # их каталога. Пока оно неизвестно, -1
+        size = self.size_cache.get(path)
+        if size is not None:
+            return size
+        listing = self.lister.get(os.path.dirname(path))
+        row = listing.rows.get(os.path.basename(path)) if listing is not None else None
+        return -1 if row is None else listing.sizes[row]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == SIZE_ROLE:
+            return self.path_size(self.sourceModel().filePath(self.mapToSource(index)))
+        return super().data(index, role)
+
+    def cancel_branch(self, index):
+        path = self.sourceModel().filePath(self.from_view(index))
+        calculator = self.running_calculator()
+        if path and calculator is not None:
+            calculator.cancel_branch(path)
+
+    def update_progress(self, path, text):
+        if path in self.size_cache:
+            return
+        self.progress_cache[path] = text
+        self.mark_changed(path)
+
+    def update_size(self, path, disk_size, raw_disk):
+        self.progress_cache.pop(path, None)
+        if (self.size_cache.get(path) == disk_size
+                and self.raw_cache.get(path, disk_size) == raw_disk):
+            return
+        self.size_cache[path] = disk_size
+        if raw_disk > disk_size:
+            self.raw_cache[path] = raw_disk
+        else:
+            self.raw_cache.pop(path, None)
+        self.mark_changed(path)
+        if self.min_size or self.size_order is not None:
+            self._stale.add(os.path.dirname(path))
+            if not self._refilter_timer.isActive():
+                self._refilter_timer.start()
+
+    def forget_sizes(self, paths):
+        # Каталоги исчезли с диска (или заменены новыми): их размеры и размеры внутри
+        # запрашиваются заново, если строки ещё показаны
+        for path in paths:
+            for cache in (self.size_cache, self.raw_cache, self.progress_cache):
+                for cached in [p for p in cache if p == path or is_under(p, path)]:
+                    del cache[cached]
+            self.relist(path, inside=True)
+            self.mark_changed(path)
+
+    def forget_deleted(self, path, disk_size, complete):
+        # Освобождённое место вычитается из уже посчитанных предков без пересчёта с нуля.
+        # Размеры внутри удалённого больше не верны и будут запрошены заново
+        for cached in [p for p in self.size_cache if is_under(p, path)]:
+            del self.size_cache[cached]
+            self.raw_cache.pop(cached, None)
+        for cached in [p for p in self.progress_cache if p == path or is_under(p, path)]:
+            del self.progress_cache[cached]
+        self.relist(path, inside=True)
+        self.relist(os.path.dirname(path))
+        parent = path
+        if complete:
+            self.size_cache.pop(path, None)
+            self.raw_cache.pop(path, None)
+            parent = os.path.dirname(path)
+
+        while True:
+            size = self.size_cache.get(parent)
+            if size is not None and size >= 0:
+                raw_disk = self.raw_cache.get(parent, size)
+                self.update_size(parent, max(size - disk_size, 0), max(raw_disk - disk_size, 0))
+            up = os.path.dirname(parent)
+            if up == parent:
+                break
+            parent = up
+        calculator = self.running_calculator()
+        if calculator is not None:
+            calculator.forget_deleted(path)
+
+    def mark_changed(self, path):
+        self._changed.add(path)
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def flush_changes(self):
+        # Строки одного родителя объединяются в диапазон от первой до последней изменившейся
+        ranges = {}
+        model = self.sourceModel()
+        for path in self._changed:
+            index = self.mapFromSource(model.index(path, 1))
+            if not index.isValid():
+                continue
+            key = os.path.dirname(path)
+            row = index.row()
+            if key in ranges:
+                first, last, parent = ranges[key]
+                ranges[key] = (min(first, row), max(last, row), parent)
+            else:
+                ranges[key] = (row, row, index.parent())
+        self._changed.clear()
+
+        for first, last, parent in ranges.values():
+            self.dataChanged.emit(self.index(first, 1, parent), self.index(last, 1, parent),
+                                  [Qt.DisplayRole, SIZE_ROLE])
+
+    def format_usage(self, path):
+        # Жёсткие ссылки засчитываются один раз; сумма по всем ссылкам — в скобках
+        disk_size = self.size_cache[path]
+        if disk_size < 0:
+            return "Ошибка"
+        size = self.format_size(disk_size)
+        if path in self.raw_cache:
+            size += f" (со ссылками {self.format_size(self.raw_cache[path])})"
+        return size
+
+    def format_size(self, bytes):
+        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+            if bytes < 1024:
+                return f"{bytes:.1f} {unit}"
+            bytes /= 1024
+        return f"{bytes:.1f} PB"
@@ -0,0 +1,66 @@
+import os
+import time
+from PySide6.QtWidgets import QDialog, QLabel, QTreeWidget, QTreeWidgetItem, QVBoxLayout
+from PySide6.QtGui import QColor
+from Compact_tree import SNAPSHOT_HEADER, SNAPSHOT_MAGIC
+
+STATUS_TEXT = {
+    'changed': "",
+    'added': "новый",
+    'removed': "удалён",
+}
+
+
+def snapshot_time(snapshot_path):
+    with open(snapshot_path, 'rb') as f:
+        f.seek(len(SNAPSHOT_MAGIC))
+        created_ns = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))[3]
+    return time.strftime('%d.%m.%Y %H:%M:%S', time.localtime(created_ns / 1e9))
+
+
+class SnapshotDiffDialog(QDialog):
+    def __init__(self, path, snapshot_path, entries, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Изменения в {path}")
+        self.resize(800, 500)
+
+        grown = sum(e.delta for e in entries if e.delta > 0)
+        shrunk = -sum(e.delta for e in entries if e.delta < 0)
+        try:
+            taken = snapshot_time(snapshot_path)
+        except OSError:
+            taken = os.path.basename(snapshot_path)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(
+            f"Снимок от {taken}. Выросло: +{self.format_size(grown)}, "
+            f"уменьшилось: −{self.format_size(shrunk)}"))
+
+        self.view = QTreeWidget()
+        self.view.setHeaderLabels(["Каталог", "Было", "Стало", "Изменение", ""])
+        self.view.setRootIsDecorated(False)
+        self.view.setColumnWidth(0, 420)
+        layout.addWidget(self.view)
+
+        if not entries:
+            self.view.addTopLevelItem(QTreeWidgetItem(["Изменений нет"]))
+
+        # Сначала самые выросшие, в конце — самые уменьшившиеся
+        for entry in entries:
+            sign = "+" if entry.delta > 0 else "−"
+            item = QTreeWidgetItem([
+                entry.path,
+                self.format_size(entry.old_size),
+                self.format_size(entry.new_size),
+                sign + self.format_size(abs(entry.delta)),
+                STATUS_TEXT[entry.status],
+            ])
+            item.setForeground(3, QColor(200, 0, 0) if entry.delta > 0 else QColor(0, 140, 0))
+            self.view.addTopLevelItem(item)
+
+    def format_size(self, bytes):
+        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+            if bytes < 1024:
+                return f"{bytes:.1f} {unit}"
+            bytes /= 1024
+        return f"{bytes:.1f} PB"
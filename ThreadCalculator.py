@@ -1,22 +1,184 @@
-from PySide6.QtCore import QThread, Signal
+import heapq
+import itertools
+import os
+import threading
+from PySide6.QtCore import QThread, Signal, Qt
 from Folder_size_calc import Folder_size_calc
+from Size_index import SizeIndex
+from Scan_engine import is_under
 
-class ThreadCalculator(QThread):
-    task_added = Signal(str)
 
+class TaskScheduler:
+    # Очередь путей без повторов: больший приоритет берётся первым.
+    # По умолчанию приоритет растёт с каждым запросом, поэтому строки, которые
+    # представление запросило при последней перерисовке (видимые), идут раньше остальных.
     def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = []
+        self._pending = {}
+        self._counter = itertools.count()
+        self._running = None
+        self._running_priority = 0
+        self._preempt = False
+        self._cancel_running = False
+        self._idle = True
+
+    def add(self, path, priority=None):
+        with self._lock:
+            if priority is None:
+                priority = next(self._counter)
+            if path == self._running:
+                return False
+
+            current = self._pending.get(path)
+            if current is not None and current >= priority:
+                return False
+            if current is None and self._running is not None:
+                # Новый путь вытесняет текущий обход; сделанное при этом не теряется
+                self._preempt = True
+
+            self._pending[path] = priority
+            heapq.heappush(self._heap, (-priority, path))
+            if len(self._heap) > 4 * len(self._pending) + 64:
+                self._heap = [(-p, q) for q, p in self._pending.items()]
+                heapq.heapify(self._heap)
+
+            if self._idle:
+                self._idle = False
+                return True
+            return False
+
+    def take(self):
+        with self._lock:
+            while self._heap:
+                priority, path = heapq.heappop(self._heap)
+                if self._pending.get(path) != -priority:
+                    continue
+                del self._pending[path]
+                self._running = path
+                self._running_priority = -priority
+                self._preempt = False
+                self._cancel_running = False
+                return path
+            self._running = None
+            self._idle = True
+            return None
+
+    def finish(self, completed):
+        with self._lock:
+            path = self._running
+            self._running = None
+            if not completed and not self._cancel_running and path not in self._pending:
+                self._pending[path] = self._running_priority
+                heapq.heappush(self._heap, (-self._running_priority, path))
+
+    def should_yield(self):
+        return self._preempt or self._cancel_running
+
+    def cancel_under(self, root):
+        with self._lock:
+            for path in [p for p in self._pending if is_under(p, root)]:
+                del self._pending[path]
+            if self._running is not None and is_under(self._running, root):
+                self._cancel_running = True
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._heap.clear()
+            if self._running is not None:
+                self._cancel_running = True
+
+    def pending_count(self):
+        return len(self._pending)
+
+
+class ThreadCalculator(QThread):
+    task_added = Signal()
+    largest_requested = Signal(str, int)
+    snapshot_requested = Signal(str)
+    compare_requested = Signal(str)
+    treemap_requested = Signal(str)
+    deleted = Signal(str)
+    reset_requested = Signal()
+
+    def __init__(self, workers=None, use_index=True, live=True, cross_devices=False,
+                 backend=None):
         super().__init__()
-        self.worker = Folder_size_calc()
+        # На многоядерных машинах разбор метаданных упирается в GIL: обход в процессах
+        if backend is None:
+            backend = 'processes' if (os.cpu_count() or 1) >= 4 else 'threads'
+        if workers is None:
+            workers = min(4, os.cpu_count() or 1)
+        self.scheduler = TaskScheduler()
+        self.worker = Folder_size_calc(workers, SizeIndex() if use_index else None, live,
+                                       self.scheduler, cross_devices, backend)
         self.worker.moveToThread(self)
-        self.task_added.connect(self.worker.calculate_size)
+        self.task_added.connect(self.worker.process_next)
+        self.largest_requested.connect(self.worker.find_largest)
+        self.snapshot_requested.connect(self.worker.save_snapshot)
+        self.compare_requested.connect(self.worker.compare_snapshot)
+        self.treemap_requested.connect(self.worker.build_treemap)
+        self.deleted.connect(self.worker.forget_deleted)
+        self.reset_requested.connect(self.worker.forget_trees)
+        # finished испускается ещё в рабочем потоке: там и закрываем его inotify и таймеры
+        self.finished.connect(self.worker.close_watcher, Qt.DirectConnection)
+        self.finished.connect(self.worker.close_pool, Qt.DirectConnection)
         self.start()
 
-    def add_task(self, path):
-        self.task_added.emit(path)
+    def add_task(self, path, priority=None):
+        if self.scheduler.add(path, priority):
+            self.task_added.emit()
+
+    def find_largest(self, path, n=50):
+        self.largest_requested.emit(path, n)
+
+    def save_snapshot(self, path):
+        self.snapshot_requested.emit(path)
+
+    def compare_snapshot(self, path):
+        self.compare_requested.emit(path)
+
+    def build_treemap(self, path):
+        self.treemap_requested.emit(path)
+
+    def forget_deleted(self, path):
+        self.scheduler.cancel_under(path)
+        self.deleted.emit(path)
+
+    def cancel_branch(self, path):
+        self.scheduler.cancel_under(path)
+
+    def cancel_largest(self):
+        self.worker.cancel_largest()
+
+    def reset(self):
+        self.scheduler.clear()
+        self.reset_requested.emit()
+
+    def is_live(self):
+        # Без наблюдения за каждым каталогом посчитанное может устареть незаметно
+        return self.isRunning() and self.worker.fully_watched()
 
     def stop(self, timeout=None):
+        self.scheduler.clear()
         self.worker.stop()
         self.quit()
         if not self.wait(timeout if timeout is not None else 1000):
             self.terminate()
+            self.wait()
+        self.worker.close_watcher()
+        self.worker.close_pool()
+
+
+_shared = None
+
 
+def shared_calculator():
+    # Один поток обхода на всё приложение: модели главного окна и окна очистки
+    # берут размеры из общего кэша деревьев. Запускается при первом запросе
+    # и заново — если прежний уже остановлен
+    global _shared
+    if _shared is None or _shared.isFinished():
+        _shared = ThreadCalculator()
+    return _shared
@@ -0,0 +1,45 @@
+import heapq
+import threading
+from Scan_engine import allocated_size
+
+
+class TopItems:
+    # Ограниченная min-куча: в памяти не больше n элементов при любом размере дерева,
+    # в корне лежит наименьший из отобранных, и он же порог для новых кандидатов
+    def __init__(self, n):
+        self.n = n
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def threshold(self):
+        return self._heap[0][0] if len(self._heap) >= self.n else -1
+
+    def add(self, size, path):
+        # Быстрая проверка без блокировки отсекает почти все файлы
+        if size <= self.threshold():
+            return
+        with self._lock:
+            if len(self._heap) < self.n:
+                heapq.heappush(self._heap, (size, path))
+            elif size > self._heap[0][0]:
+                heapq.heapreplace(self._heap, (size, path))
+
+    def on_file(self, entry, st):
+        size = allocated_size(st)
+        if size > self.threshold():
+            self.add(size, entry.path)
+
+    def items(self):
+        return sorted(self._heap, reverse=True)
+
+
+def largest_dirs(tree, n):
+    # Сам корень не показывается; из цепочки вложенных каталогов одного размера
+    # в выдачу попадает только самый глубокий
+    top = TopItems(n)
+    for path, node in tree.walk():
+        if node is not tree.root and node.disk_size > top.threshold():
+            if any(c.disk_size == node.disk_size for c in node.children.values()):
+                continue
+            top.add(node.disk_size, path)
+    return top.items()
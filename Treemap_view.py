@@ -0,0 +1,359 @@
+from collections import OrderedDict
+from operator import itemgetter
+from PySide6.QtCore import Qt, Signal, QRectF, QTimer
+from PySide6.QtGui import QColor, QPainter, QPixmap, QPen
+from PySide6.QtWidgets import QWidget, QToolTip
+
+# Прямоугольники меньше MIN_AREA пикселей не рисуются по отдельности: хвост мелких детей
+# каталога сливается в один блок «прочее». В каталог меньше MIN_NEST по стороне не заходим
+MIN_AREA = 6
+MIN_NEST = 8
+# Прямоугольников в одной раскладке не больше MAX_ITEMS: уровни раскладываются по очереди
+# сверху вниз, и на чём закончился запас, то рисуется сплошным блоком
+MAX_ITEMS = 20000
+# Полоса под подпись каталога и отступ детей от его границы
+HEADER = 16
+PADDING = 2
+LABEL_MIN_WIDTH = 60
+# Раскладки и картинки последних уровней приближения: возврат наверх не пересчитывает
+LAYOUT_CACHE = 8
+RESIZE_DELAY = 150
+
+DIRECTORY, FILES, REST = range(3)
+
+DEPTH_COLORS = [QColor(c) for c in (
+    '#5b8ff9', '#5ad8a6', '#f6bd16', '#e8684a', '#6dc8ec', '#9270ca', '#ff9d4d', '#269a99')]
+FILES_COLOR = QColor('#c8c8c8')
+REST_COLOR = QColor('#8c8c8c')
+BORDER_COLOR = QColor(40, 40, 40)
+
+
+def squarify(sizes, x, y, width, height):
+    # Squarified treemap (Bruls, Huizing, van Wijk): sizes по убыванию и уже в пикселях,
+    # их сумма равна width * height. Строка растёт, пока худшее соотношение сторон
+    # в ней уменьшается
+    rects = []
+    i = 0
+    count = len(sizes)
+    while i < count:
+        short = min(width, height)
+        if short <= 0:
+            rects.extend((x, y, 0, 0) for _ in range(i, count))
+            break
+        short2 = short * short
+        total = sizes[i]
+        worst = max(short2 / total, total / short2)
+        j = i + 1
+        while j < count:
+            grown = total + sizes[j]
+            grown2 = grown * grown
+            ratio = max(short2 * sizes[i] / grown2, grown2 / (short2 * sizes[j]))
+            if ratio > worst:
+                break
+            total, worst = grown, ratio
+            j += 1
+
+        if width >= height:
+            column = total / height
+            top = y
+            for k in range(i, j):
+                side = sizes[k] / column
+                rects.append((x, top, column, side))
+                top += side
+            x += column
+            width -= column
+        else:
+            row = total / width
+            left = x
+            for k in range(i, j):
+                side = sizes[k] / row
+                rects.append((left, y, side, row))
+                left += side
+            y += row
+            height -= row
+        i = j
+    return rects
+
+
+class TreemapLayout:
+    # Раскладка поддерева root у CompactTree в прямоугольник width x height.
+    # Элементы лежат в прямом порядке обхода, как узлы CompactTree: потомки элемента i
+    # занимают отрезок (i, end[i]), поэтому поиск под курсором спускается по детям.
+    def __init__(self, tree, root, width, height):
+        self.tree = tree
+        self.root = root
+        self.x = []
+        self.y = []
+        self.width = []
+        self.height = []
+        self.node = []
+        self.kind = []
+        self.color = []
+        self.end = []
+        self.build(width, height)
+
+    def __len__(self):
+        return len(self.node)
+
+    def add(self, x, y, width, height, node, kind, depth):
+        self.x.append(x)
+        self.y.append(y)
+        self.width.append(width)
+        self.height.append(height)
+        self.node.append(node)
+        self.kind.append(kind)
+        # Номер цвета: уровень вложенности для каталогов, отдельные цвета для файлов и «прочего»
+        self.color.append(depth % len(DEPTH_COLORS) if kind == DIRECTORY else -kind)
+        self.end.append(len(self.node))
+        return len(self.node) - 1
+
+    def build(self, width, height):
+        # Раскладка идёт в ширину, чтобы запас MAX_ITEMS тратился на верхние уровни,
+        # а затем элементы переписываются в прямом порядке обхода
+        placed = [(0, 0, width, height, self.root, DIRECTORY, 0)]
+        children = {}
+        head = 0
+        while head < len(placed):
+            laid = self.place(placed[head], MAX_ITEMS - len(placed))
+            if laid:
+                children[head] = (len(placed), len(placed) + len(laid))
+                placed.extend(laid)
+            head += 1
+
+        stack = [0]
+        while stack:
+            item = stack.pop()
+            if item < 0:
+                # Все потомки элемента уже переписаны: закрываем его отрезок
+                self.end[-item - 1] = len(self.node)
+                continue
+            added = self.add(*placed[item])
+            first, last = children.get(item, (0, 0))
+            if first < last:
+                stack.append(-added - 1)
+                stack.extend(range(last - 1, first - 1, -1))
+
+    def place(self, placed, budget):
+        # Дети каталога в его прямоугольнике, не больше budget штук вместе с «прочим»
+        x, y, w, h, node, kind, depth = placed
+        tree = self.tree
+        disk_size = tree.disk_size
+        if kind != DIRECTORY or w < MIN_NEST or h < MIN_NEST or budget < 2:
+            return []
+
+        header = HEADER if h > 2 * HEADER and w > LABEL_MIN_WIDTH else PADDING
+        inner_w = w - 2 * PADDING
+        inner_h = h - header - PADDING
+        if inner_w <= 0 or inner_h <= 0:
+            return []
+
+        children = [(disk_size[c], c, DIRECTORY) for c in tree.children(node) if disk_size[c]]
+        own = disk_size[node] - sum(size for size, _, _ in children)
+        if own > 0:
+            children.append((own, node, FILES))
+        total = disk_size[node]
+        if not children or total <= 0:
+            return []
+        children.sort(key=itemgetter(0), reverse=True)
+
+        scale = inner_w * inner_h / total
+        shown = len(children)
+        while shown and children[shown - 1][0] * scale < MIN_AREA:
+            shown -= 1
+        if shown > budget or (shown < len(children) and shown == budget):
+            shown = budget - 1
+        if shown < len(children):
+            rest = sum(size for size, _, _ in children[shown:])
+            children = children[:shown] + [(rest, node, REST)]
+
+        rects = squarify([size * scale for size, _, _ in children],
+                         x + PADDING, y + header, inner_w, inner_h)
+        return [(cx, cy, cw, ch, child, child_kind, depth + 1)
+                for (_, child, child_kind), (cx, cy, cw, ch) in zip(children, rects)]
+
+    def item_at(self, x, y):
+        if not self.node or not self.contains(0, x, y):
+            return None
+        item = 0
+        while True:
+            child = item + 1
+            end = self.end[item]
+            while child < end and not self.contains(child, x, y):
+                child = self.end[child]
+            if child >= end:
+                return item
+            item = child
+
+    def contains(self, item, x, y):
+        left = self.x[item]
+        top = self.y[item]
+        return left <= x < left + self.width[item] and top <= y < top + self.height[item]
+
+    def rect(self, item):
+        return QRectF(self.x[item], self.y[item], self.width[item], self.height[item])
+
+    def render(self, size, ratio, font_metrics):
+        pixmap = QPixmap(size * ratio)
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(Qt.white)
+        painter = QPainter(pixmap)
+        painter.setPen(QPen(BORDER_COLOR, 0))
+
+        # Один drawRects на цвет вместо вызова на каждый прямоугольник
+        rects = list(map(QRectF, self.x, self.y, self.width, self.height))
+        for color in set(self.color):
+            painter.setBrush(FILES_COLOR if color == -FILES else
+                             REST_COLOR if color == -REST else DEPTH_COLORS[color])
+            painter.drawRects([rect for rect, c in zip(rects, self.color) if c == color])
+
+        painter.setPen(Qt.black)
+        for item, (kind, width, height) in enumerate(zip(self.kind, self.width, self.height)):
+            if kind == DIRECTORY and width > LABEL_MIN_WIDTH and height > 2 * HEADER:
+                label = QRectF(self.x[item] + PADDING, self.y[item], width - 2 * PADDING, HEADER)
+                text = font_metrics.elidedText(self.label(item), Qt.ElideMiddle, int(label.width()))
+                painter.drawText(label, Qt.AlignLeft | Qt.AlignVCenter, text)
+        painter.end()
+        return pixmap
+
+    def label(self, item):
+        node = self.node[item]
+        name = self.tree.name(node) if node else self.tree.root_path
+        return f"{name} — {format_size(self.tree.disk_size[node])}"
+
+    def describe(self, item):
+        node = self.node[item]
+        path = self.tree.path_of(node)
+        kind = self.kind[item]
+        if kind == FILES:
+            children = sum(self.tree.disk_size[c] for c in self.tree.children(node))
+            return f"Файлы в {path}\n{format_size(self.tree.disk_size[node] - children)}"
+        if kind == REST:
+            return f"Мелкие элементы в {path}"
+        return f"{path}\n{format_size(self.tree.disk_size[node])}"
+
+
+class TreemapWidget(QWidget):
+    # Карта занятого места по дереву обхода (CompactTree). Щелчок приближает каталог
+    # под курсором, правая кнопка или Backspace — на уровень выше.
+    path_activated = Signal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tree = None
+        self.root = 0
+        self._layouts = OrderedDict()
+        self._hovered = None
+        self._last = None
+        self._resize_timer = QTimer(self)
+        self._resize_timer.setSingleShot(True)
+        self._resize_timer.setInterval(RESIZE_DELAY)
+        self._resize_timer.timeout.connect(self.update)
+        self.setMouseTracking(True)
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.setMinimumSize(200, 150)
+
+    def set_tree(self, tree, path=None):
+        self.tree = tree
+        self._layouts.clear()
+        self._last = None
+        root = tree.find(path) if path is not None else None
+        self.set_root(root or 0)
+
+    def set_root(self, root):
+        self.root = root
+        self._hovered = None
+        self.update()
+
+    def current_path(self):
+        return self.tree.path_of(self.root) if self.tree is not None else None
+
+    def layout(self):
+        key = (self.root, self.width(), self.height())
+        cached = self._layouts.get(key)
+        if cached is None:
+            layout = TreemapLayout(self.tree, self.root, self.width(), self.height())
+            cached = (layout, layout.render(self.size(), self.devicePixelRatioF(),
+                                            self.fontMetrics()))
+            self._layouts[key] = cached
+            if len(self._layouts) > LAYOUT_CACHE:
+                self._layouts.popitem(last=False)
+        else:
+            self._layouts.move_to_end(key)
+        self._last = cached
+        return cached
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        if self.tree is None or not len(self.tree):
+            painter.drawText(self.rect(), Qt.AlignCenter, "Выберите каталог и постройте карту")
+            return
+        if self._resize_timer.isActive() and self._last is not None:
+            # Пока окно тянут, растягивается старая картинка; раскладка — после остановки
+            painter.drawPixmap(self.rect(), self._last[1])
+            return
+
+        layout, pixmap = self.layout()
+        painter.drawPixmap(0, 0, pixmap)
+        if self._hovered is not None and self._hovered < len(layout):
+            painter.setPen(QPen(Qt.black, 2))
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRect(layout.rect(self._hovered))
+
+    def resizeEvent(self, event):
+        self._resize_timer.start()
+        super().resizeEvent(event)
+
+    def item_at(self, pos):
+        if self.tree is None or self._resize_timer.isActive():
+            return None, None
+        layout = self.layout()[0]
+        return layout, layout.item_at(pos.x(), pos.y())
+
+    def mouseMoveEvent(self, event):
+        layout, item = self.item_at(event.position())
+        if item != self._hovered:
+            self._hovered = item
+            self.update()
+        if item is not None:
+            QToolTip.showText(event.globalPosition().toPoint(), layout.describe(item), self)
+        else:
+            QToolTip.hideText()
+
+    def leaveEvent(self, event):
+        self._hovered = None
+        self.update()
+        super().leaveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.RightButton:
+            self.zoom_out()
+            return
+        if event.button() != Qt.LeftButton:
+            return
+        layout, item = self.item_at(event.position())
+        if item is None:
+            return
+        node = layout.node[item]
+        self.path_activated.emit(self.tree.path_of(node))
+        if node != self.root:
+            self.set_root(node)
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Backspace:
+            self.zoom_out()
+        else:
+            super().keyPressEvent(event)
+
+    def zoom_out(self):
+        if self.tree is None or self.root == 0:
+            return
+        self.set_root(self.tree.parent[self.root])
+        self.path_activated.emit(self.tree.path_of(self.root))
+
+
+def format_size(bytes):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if bytes < 1024:
+            return f"{bytes:.1f} {unit}"
+        bytes /= 1024
+    return f"{bytes:.1f} PB"
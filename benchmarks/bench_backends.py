@@ -0,0 +1,71 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Process_scan import ProcessScanPool
+from Scan_engine import scan_tree
+from synthetic_tree import make_tree
+
+
+def best_of(repeat, scan):
+    best = None
+    tree = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tree = scan()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обход в потоках и в процессах")
+    parser.add_argument('--files', type=int, default=1000000,
+                        help="число файлов в синтетическом дереве")
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--path', help="существующий каталог вместо синтетического дерева")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path
+        if path is None:
+            path = os.path.join(tmp, 'tree')
+            dirs = sum(args.fanout ** level for level in range(args.depth + 1))
+            files_per_dir = -(-args.files // dirs)
+            print(f"Создание дерева: {dirs} каталогов по {files_per_dir} файлов...")
+            dirs, files = make_tree(path, args.depth, args.fanout, files_per_dir, file_size=0)
+            print(f"Дерево: {dirs} каталогов, {files} файлов")
+
+        # Первый проход прогревает кэш inode, чтобы сравнивался разбор, а не диск
+        scan_tree(path, workers=args.workers)
+        results = []
+        threads, tree = best_of(args.repeat, lambda: scan_tree(path, workers=args.workers))
+        results.append(("потоки", threads, tree))
+
+        pool = ProcessScanPool(args.workers)
+        try:
+            pool.scan_tree(path)
+            processes, tree = best_of(args.repeat, lambda: pool.scan_tree(path))
+            results.append(("процессы", processes, tree))
+        finally:
+            pool.close()
+
+        expected = results[0][2].root.files
+        for name, elapsed, tree in results:
+            if tree.root.files != expected:
+                print(f"Число файлов расходится: {tree.root.files} != {expected}")
+                sys.exit(1)
+            print(f"{name:9s} ({args.workers}): {elapsed * 1000:9.1f} мс  "
+                  f"{tree.root.files / elapsed:12.0f} файлов/с  "
+                  f"ускорение {threads / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import fnmatch
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Cleanup_rules import DEFAULT_RULES, CleanupMatcher
+
+
+def make_names(count):
+    # В основном обычные файлы, изредка — подходящие под правила
+    rng = random.Random(1)
+    extensions = ['.py', '.txt', '.so', '.json', '.png', '.h', '.c', '', '.log', '.o', '.log.1']
+    return [f"file{rng.randrange(10**6)}{rng.choice(extensions)}" if rng.random() > 0.01
+            else rng.choice(['core', 'core.1234', 'vgcore.77', 'a.core'])
+            for _ in range(count)]
+
+
+def per_rule_loop(rules, names):
+    # Для сравнения: каждый шаблон каждого правила проверяется на каждом имени
+    found = 0
+    for name in names:
+        for rule in rules:
+            if any(fnmatch.fnmatchcase(name, pattern) for pattern in rule.files):
+                found += 1
+                break
+    return found
+
+
+def compiled(rules, names):
+    match = CleanupMatcher(rules).match_file
+    return sum(1 for name in names if match(name) is not None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Правила очистки: цикл по шаблонам и CleanupMatcher")
+    parser.add_argument('--names', type=int, default=1000000)
+    args = parser.parse_args()
+
+    names = make_names(args.names)
+    for title, func in (("цикл по правилам", per_rule_loop), ("CleanupMatcher", compiled)):
+        start = time.perf_counter()
+        found = func(DEFAULT_RULES, names)
+        elapsed = time.perf_counter() - start
+        print(f"{title:>17}: {elapsed:.2f} с, {len(names) / elapsed:,.0f} имён/с, совпадений {found}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from Delete_engine import DeleteCounter, delete_path
+from synthetic_tree import make_tree
+
+
+def delete_with_engine(path, workers):
+    counter = DeleteCounter()
+    errors = []
+    stop = threading.Event()
+    with ThreadPoolExecutor(workers) as executor:
+        delete_path(path, executor, counter, stop.is_set, errors)
+    return counter.totals(), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Удаление дерева: shutil.rmtree и Delete_engine")
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--fanout', type=int, default=6)
+    parser.add_argument('--files', type=int, default=30, help="файлов в каждом каталоге")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--dir', help="где создавать деревья (по умолчанию во временном каталоге)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        def fresh_tree(name):
+            root = os.path.join(tmp, name)
+            dirs, files = make_tree(root, args.depth, args.fanout, args.files, file_size=100)
+            return root, files
+
+        root, files = fresh_tree('rmtree')
+        start = time.perf_counter()
+        shutil.rmtree(root)
+        elapsed = time.perf_counter() - start
+        print(f"{'shutil.rmtree':>16}: {elapsed:.2f} с, {files / elapsed:,.0f} файлов/с")
+
+        for workers in args.workers:
+            root, files = fresh_tree(f'engine{workers}')
+            start = time.perf_counter()
+            (deleted, freed), errors = delete_with_engine(root, workers)
+            elapsed = time.perf_counter() - start
+            print(f"{f'потоков: {workers}':>16}: {elapsed:.2f} с, {deleted / elapsed:,.0f} файлов/с, "
+                  f"освобождено {freed} байт, ошибок {len(errors)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Duplicate_finder import SizeGroups, find_duplicates
+from Scan_engine import scan_tree
+
+
+def make_files(root, count, size):
+    # Все файлы одного размера: треть уникальна с первых байт, у трети совпадают начало
+    # и конец (их отсеивает только полный хеш), оставшаяся треть — копии по десять штук
+    rng = random.Random(1)
+    base = rng.randbytes(size)
+    middle = size // 2
+    copy = None
+    for i in range(count):
+        if i % 3 == 0:
+            data = rng.randbytes(size)
+        elif i % 3 == 1:
+            data = base[:middle] + rng.randbytes(16) + base[middle + 16:]
+        else:
+            if i % 30 == 2:
+                copy = rng.randbytes(size)
+            data = copy
+        with open(os.path.join(root, f"f{i}.bin"), 'wb') as f:
+            f.write(data)
+
+
+def naive(root):
+    # Для сравнения: полный хеш каждого файла без отсева
+    groups = {}
+    for entry in os.scandir(root):
+        with open(entry.path, 'rb') as f:
+            groups.setdefault(hashlib.blake2b(f.read()).digest(), []).append(entry.path)
+    return [paths for paths in groups.values() if len(paths) > 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск дубликатов: этапы и полный хеш всех файлов")
+    parser.add_argument('--files', type=int, default=300)
+    parser.add_argument('--size', type=int, default=4 * 1024 * 1024)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--dir', help="где создавать файлы (по умолчанию во временном каталоге)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as root:
+        make_files(root, args.files, args.size)
+        total = args.files * args.size
+
+        start = time.perf_counter()
+        sizes = SizeGroups()
+        scan_tree(root, on_file=sizes.on_file)
+        stages = []
+        groups = find_duplicates(sizes.candidates(), args.workers,
+                                 progress=lambda stage, count: stages.append((stage, count)))
+        elapsed = time.perf_counter() - start
+        for stage, count in stages:
+            print(f"  этап {stage}: {count} файлов")
+        print(f"этапы: {elapsed:.2f} с, групп {len(groups)}, "
+              f"лишних {sum(g.wasted for g in groups) / 2**20:.0f} MB")
+
+        start = time.perf_counter()
+        expected = naive(root)
+        elapsed = time.perf_counter() - start
+        print(f"полный хеш всех файлов: {elapsed:.2f} с ({total / elapsed / 2**20:.0f} MB/с), "
+              f"групп {len(expected)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Compact_tree import CompactTree
+from Scan_engine import ScanTree
+
+# Часть имён повторяется, как в реальных деревьях исходников и пакетов
+COMMON_NAMES = ['src', 'lib', 'tests', '__pycache__', 'node_modules', 'build', 'docs', 'assets']
+
+
+def build_scan_tree(count, fanout):
+    # Дерево из count каталогов в памяти, без обращения к диску
+    tree = ScanTree('/data/scan')
+    queue = [tree.root]
+    made = 1
+    head = 0
+    while made < count:
+        node = queue[head]
+        head += 1
+        for j in range(fanout):
+            if made >= count:
+                break
+            name = COMMON_NAMES[j] if j < len(COMMON_NAMES) and made % 3 else f"dir_{made:09d}"
+            if name in node.children:
+                name = f"dir_{made:09d}"
+            child = node.add_child(name)
+            child.own_size = made * 4096
+            child.own_disk = made * 4096
+            child.own_files = j + 1
+            child.mtime_ns = 1700000000000000000 + made
+            queue.append(child)
+            made += 1
+    tree.aggregate()
+    return tree
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, used
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память на запись: словарь строк, ScanTree и CompactTree")
+    parser.add_argument('--entries', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--fanout', type=int, default=12)
+    args = parser.parse_args()
+
+    for count in args.entries:
+        tree = build_scan_tree(count, args.fanout)
+        # Так размеры хранит size_cache модели: полный путь -> строка с размером.
+        # Пути собираются внутри замера, поэтому их строки тоже учитываются.
+        cache, cache_bytes = measure(
+            lambda: {path: f"{node.disk_size / 1024:.1f} KB" for path, node in tree.walk()})
+        del cache
+        compact, compact_bytes = measure(lambda: CompactTree.from_scan_tree(tree))
+        del tree
+        _, tree_bytes = measure(lambda: build_scan_tree(count, args.fanout))
+
+        print(f"{count} каталогов, байт на запись:")
+        print(f"  словарь строк: {cache_bytes / count:8.1f}")
+        print(f"  ScanTree:      {tree_bytes / count:8.1f}")
+        print(f"  CompactTree:   {compact_bytes / count:8.1f}"
+              f"  (массивы и пул имён {compact.nbytes() / count:.1f})")
+
+        # Проверка, что пути восстанавливаются
+        last = len(compact) - 1
+        assert compact.find(compact.path_of(last)) == last
+        del compact
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from Scan_engine import scan_tree
+from Scan_metrics import STAT_BUCKETS, ScanMetrics, percentile
+from synthetic_tree import make_tree
+
+
+def best_of(path, workers, repeat, with_metrics):
+    best = None
+    metrics = None
+    for _ in range(repeat):
+        metrics = ScanMetrics() if with_metrics else None
+        start = time.perf_counter()
+        scan_tree(path, workers=workers, metrics=metrics)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Цена замеров обхода: scan_tree с ScanMetrics и без")
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=6)
+    parser.add_argument('--files', type=int, default=100)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--path', help="существующий каталог вместо синтетического дерева")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path
+        if path is None:
+            path = os.path.join(tmp, 'tree')
+            dirs, files = make_tree(path, args.depth, args.fanout, args.files)
+            print(f"Дерево: {dirs} каталогов, {files} файлов")
+
+        for workers in args.workers:
+            plain, _ = best_of(path, workers, args.repeat, False)
+            measured, metrics = best_of(path, workers, args.repeat, True)
+            buckets = [0] * (len(STAT_BUCKETS) + 1)
+            for counts in metrics.stat_buckets.values():
+                buckets = [a + b for a, b in zip(buckets, counts)]
+            print(f"потоков: {workers}: без замеров {plain * 1000:8.1f} мс, "
+                  f"с замерами {measured * 1000:8.1f} мс ({(measured / plain - 1) * 100:+.1f}%), "
+                  f"stat p50 ≤ {percentile(buckets, 0.5)}, p99 ≤ {percentile(buckets, 0.99)}")
+
+
+if __name__ == "__main__":
+    main()
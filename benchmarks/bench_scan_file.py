@@ -0,0 +1,142 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Compact_tree import CompactTree
+from Scan_file import save_scan
+
+
+def make_compact(dirs, per_dir):
+    # Корень, dirs каталогов и в каждом per_dir пустых подкаталогов, в прямом порядке
+    # обхода, как после CompactTree.from_scan_tree. Последний каталог втрое шире остальных
+    tree = CompactTree('/synthetic')
+    now = time.time_ns()
+    tree.append(-1, '', 0, 0, 0, 0)
+    for d in range(dirs):
+        width = per_dir * 3 if d == dirs - 1 else per_dir
+        parent = tree.append(0, f"d{d:06d}", 0, 0, 0, 0)
+        for i in range(width):
+            size = (d * 7919 + i * 104729) % 1000000 * 4096
+            child = tree.append(parent, f"s{i:06d}", size, size, 1, now)
+            tree.end[child] = child + 1
+            tree.disk_size[parent] += size
+            tree.files[parent] += 1
+        tree.end[parent] = len(tree)
+        tree.disk_size[0] += tree.disk_size[parent]
+        tree.files[0] += tree.files[parent]
+    tree.end[0] = len(tree)
+    tree.freeze()
+    return tree
+
+
+def rss_mb():
+    # Текущий RSS, включая прочитанные страницы отображённого файла
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0
+
+
+def child_mmap(path):
+    # Окно просмотра скана: открытие, первая отрисовка, раскрытие самого широкого каталога
+    # с сортировкой по размеру и прокрутка в его конец
+    from PySide6.QtCore import QObject, QEvent, QEventLoop, QTimer
+    from PySide6.QtWidgets import QApplication
+    app = QApplication([sys.argv[0]])
+    from Scan_file import ScanFile
+    from Scan_file_dialog import ScanFileDialog
+    base = rss_mb()
+
+    start = time.perf_counter()
+    dialog = ScanFileDialog(ScanFile(path))
+    result = {}
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and 'paint' not in result:
+                result['paint'] = time.perf_counter() - start
+                QTimer.singleShot(0, loop.quit)
+            return False
+
+    # QApplication.quit закрыл бы окно, а с ним и модель
+    loop = QEventLoop()
+    watcher = FirstPaint()
+    app.installEventFilter(watcher)
+    dialog.show()
+    loop.exec()
+
+    # Окно сортирует по занятому месту, первым идёт самый широкий каталог
+    model = dialog.model
+    root = model.index(0, 0)
+    start = time.perf_counter()
+    widest = model.index(0, 0, root)
+    dialog.view.expand(widest)
+    dialog.view.scrollTo(model.index(model.rowCount(widest) - 1, 0, widest))
+    app.processEvents()
+    expanded = time.perf_counter() - start
+    print(f"{result['paint']:.4f} {expanded:.4f} {model.rowCount(widest)} "
+          f"{rss_mb() - base:.1f}", flush=True)
+    os._exit(0)
+
+
+def child_load(path):
+    # Для сравнения: снимок CompactTree читается в память целиком
+    base = rss_mb()
+    start = time.perf_counter()
+    tree = CompactTree.load(path)
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed:.4f} {len(tree)} {rss_mb() - base:.1f}", flush=True)
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Открытие большого скана: отображение в память и чтение снимка целиком")
+    parser.add_argument('--dirs', type=int, default=1000)
+    parser.add_argument('--per-dir', type=int, default=2000,
+                        help="подкаталогов в каждом каталоге; всего записей около dirs * per-dir")
+    parser.add_argument('--child', choices=['mmap', 'load'], help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == 'mmap':
+        child_mmap(args.path)
+    elif args.child == 'load':
+        child_load(args.path)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        tree = make_compact(args.dirs, args.per_dir)
+        print(f"Дерево: {len(tree)} каталогов ({time.perf_counter() - start:.1f} с)")
+        snap_path = os.path.join(tmp, 'tree.snap')
+        scan_path = os.path.join(tmp, 'tree.dscan')
+        tree.save(snap_path)
+        start = time.perf_counter()
+        save_scan(tree, scan_path)
+        print(f"save_scan: {time.perf_counter() - start:.1f} с, "
+              f"{os.path.getsize(scan_path) / 1024 ** 2:.0f} MB (снимок "
+              f"{os.path.getsize(snap_path) / 1024 ** 2:.0f} MB)")
+        del tree
+
+        env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+        command = [sys.executable, os.path.abspath(__file__), '--child']
+        output = subprocess.run(command + ['load', '--path', snap_path], env=env,
+                                capture_output=True, text=True, check=True).stdout.split()
+        print(f"CompactTree.load: {float(output[0]) * 1000:8.1f} мс, "
+              f"+{output[2]} MB RSS")
+        output = subprocess.run(command + ['mmap', '--path', scan_path], env=env,
+                                capture_output=True, text=True, check=True).stdout.split()
+        print(f"ScanFileDialog:   {float(output[0]) * 1000:8.1f} мс до первой отрисовки, "
+              f"раскрытие каталога из {output[2]} строк по размеру {float(output[1]) * 1000:.1f} мс, "
+              f"+{output[3]} MB RSS")
+
+
+if __name__ == "__main__":
+    main()
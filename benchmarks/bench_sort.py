@@ -0,0 +1,113 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import QApplication, QFileSystemModel, QTreeView
+from Size_proxy_model import SizeProxyModel
+
+
+class BenchProxyModel(SizeProxyModel):
+    def __init__(self, parent=None):
+        self.drives = []
+        super().__init__(parent)
+
+
+def make_flat_dir(path, count):
+    os.makedirs(path)
+    for i in range(count):
+        with open(os.path.join(path, f"f{i}"), 'wb') as f:
+            f.write(b'\0' * ((i * 7919) % 5000))
+
+
+def wait_loaded(app, model, proxy, root, count, timeout):
+    start = time.perf_counter()
+    while model.rowCount(root) < count and time.perf_counter() - start < timeout:
+        app.processEvents()
+    # QFileSystemModel ещё дочитывает сведения о файлах в своём потоке,
+    # SizeProxyModel — занятое место файлов в своём
+    for _ in range(50):
+        app.processEvents()
+        time.sleep(0.02)
+    while proxy.busy() and time.perf_counter() - start < timeout:
+        app.processEvents()
+        time.sleep(0.02)
+    return time.perf_counter() - start
+
+
+def timed(app, proxy, action):
+    # Время считается вместе с перераскладкой представления и ожиданием списков каталогов,
+    # которые читаются в фоне
+    start = time.perf_counter()
+    action()
+    app.processEvents()
+    while proxy.busy():
+        app.processEvents()
+        time.sleep(0.001)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сортировка и фильтр по размеру в дереве")
+    parser.add_argument('--files', type=int, default=100000, help="число файлов в каталоге")
+    parser.add_argument('--path', help="существующий каталог вместо синтетического")
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    app = QApplication([])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path
+        if path is None:
+            path = os.path.join(tmp, 'wide')
+            print(f"Создание каталога с {args.files} файлами...")
+            make_flat_dir(path, args.files)
+
+        model = QFileSystemModel()
+        model.setRootPath(path)
+        root = model.index(path)
+        proxy = BenchProxyModel()
+        proxy.setSourceModel(model)
+        view = QTreeView()
+        view.setUniformRowHeights(True)
+        proxy.show_in(view)
+        view.setRootIndex(proxy.to_view(root))
+        view.setSortingEnabled(True)
+        view.sortByColumn(0, Qt.AscendingOrder)
+        view.resize(800, 600)
+        view.show()
+
+        loaded = wait_loaded(app, model, proxy, root, args.files if args.path is None else 1,
+                             args.timeout)
+        rows = model.rowCount(root)
+        print(f"Загружено строк: {rows} за {loaded:.1f} с")
+
+        def cold_size_sort():
+            # Список каталога ещё не прочитан: сортировка ждёт его вместе со stat файлов
+            proxy.lister.clear()
+            view.sortByColumn(1, Qt.DescendingOrder)
+
+        results = [
+            ("по размеру, убывание",
+             timed(app, proxy, lambda: view.sortByColumn(1, Qt.DescendingOrder))),
+            ("по размеру, возрастание",
+             timed(app, proxy, lambda: view.sortByColumn(1, Qt.AscendingOrder))),
+            ("фильтр > 4 KB", timed(app, proxy, lambda: proxy.set_min_size(4000))),
+            ("без фильтра", timed(app, proxy, lambda: proxy.set_min_size(0))),
+            ("по имени", timed(app, proxy, lambda: view.sortByColumn(0, Qt.AscendingOrder))),
+            ("фильтр > 4 KB по имени", timed(app, proxy, lambda: proxy.set_min_size(4000))),
+            ("без фильтра по имени", timed(app, proxy, lambda: proxy.set_min_size(0))),
+            ("по размеру, без списка", timed(app, proxy, cold_size_sort)),
+        ]
+        for name, elapsed in results:
+            print(f"{name:>24}: {elapsed:.3f} с, {rows / elapsed:,.0f} строк/с")
+
+        proxy.calculator.stop()
+
+
+if __name__ == '__main__':
+    main()
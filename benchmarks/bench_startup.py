@@ -0,0 +1,86 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Тяжёлые модули, которых при отложенном запуске не должно быть к первому кадру
+WATCHED_MODULES = ('PySide6.QtCharts', 'psutil', 'ThreadCalculator', 'Disk_cleanup_dialog',
+                   'Process_scan')
+
+
+def thread_count():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('Threads:'):
+                return int(line.split()[1])
+    return 0
+
+
+def child(deferred):
+    # Запуск как в disk-analyzer: импорт, окно, show, цикл событий до первой отрисовки
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    from PySide6.QtCore import QObject, QEvent, QTimer
+    from PySide6.QtWidgets import QApplication
+    qt_imported = time.perf_counter()
+    from mainwindow import MainWindow
+    imported = time.perf_counter()
+
+    app = QApplication([sys.argv[0]])
+    window = MainWindow(deferred=deferred)
+    constructed = time.perf_counter()
+    result = {}
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and not result:
+                result['paint'] = time.perf_counter()
+                result['threads'] = thread_count()
+                result['loaded'] = sorted(m for m in WATCHED_MODULES if m in sys.modules)
+                QTimer.singleShot(0, app.quit)
+            return False
+
+    watcher = FirstPaint()
+    app.installEventFilter(watcher)
+    window.show()
+    app.exec()
+
+    print(f"{qt_imported - started:.4f} {imported - qt_imported:.4f} "
+          f"{constructed - imported:.4f} {result['paint'] - started:.4f} {result['threads']} "
+          f"{' '.join(result['loaded'])}", flush=True)
+    window.close()
+    # Завершение процесса не измеряется
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время запуска окна: импорт и первая отрисовка")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', choices=['eager', 'deferred'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child == 'deferred')
+        return
+
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    for mode in ('eager', 'deferred'):
+        runs = []
+        for _ in range(args.repeat):
+            output = subprocess.run([sys.executable, __file__, '--child', mode], env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            runs.append(output.split())
+        # Медиана по каждому столбцу: на занятой машине разброс отдельных запусков велик
+        qt_import, app_import, construct, paint, threads = (
+            statistics.median(float(run[i]) for run in runs) for i in range(5))
+        print(f"{mode:>8}: импорт Qt {qt_import * 1000:6.1f} мс, модулей окна {app_import * 1000:6.1f} мс, "
+              f"конструктор {construct * 1000:6.1f} мс, первая отрисовка {paint * 1000:6.1f} мс, "
+              f"потоков {threads:.0f}")
+        print(f"{'':>8}  загружено к первому кадру: {', '.join(runs[0][5:]) or '—'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_tree import make_deep, make_links, make_wide
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baselines', 'baseline.json')
+
+SHAPES = {
+    'wide': make_wide,
+    'deep': make_deep,
+    'links': make_links,
+}
+
+# Случай -> (что измеряется, форма дерева, бэкенд обхода)
+CASES = {
+    'scan-wide': ('scan', 'wide', 'threads'),
+    'scan-deep': ('scan', 'deep', 'threads'),
+    'scan-links': ('scan', 'links', 'threads'),
+    'scan-wide-processes': ('scan', 'wide', 'processes'),
+    'first-size': ('first-size', 'wide', None),
+    'refresh-cycles': ('cycles', 'wide', None),
+}
+
+# Метрика -> True, если больше — лучше. Остальные метрики только выводятся
+METRICS = {
+    'files_per_second': True,
+    'seconds': False,
+    'peak_rss_mb': False,
+    'first_size_seconds': False,
+    'rss_growth_mb': False,
+}
+# Разница меньше этой не считается ухудшением: шум таймера и аллокатора
+ABSOLUTE_SLACK = {
+    'seconds': 0.05,
+    'first_size_seconds': 0.05,
+    'peak_rss_mb': 5,
+    'rss_growth_mb': 5,
+}
+
+
+def thread_count():
+    return int(proc_status('Threads'))
+
+
+def rss_mb():
+    return int(proc_status('VmRSS').split()[0]) / 1024
+
+
+def proc_status(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return line.split(':', 1)[1].strip()
+    return '0'
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def wait_until(app, condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        app.processEvents()
+        time.sleep(0.005)
+    return True
+
+
+# --- случаи, каждый выполняется в отдельном процессе
+
+def run_scan(path, backend, workers, repeat):
+    # Пропускная способность Folder_size_calc.calculate_size без потока и очереди;
+    # первый проход прогревает кэш inode
+    from PySide6.QtCore import QCoreApplication
+    from Folder_size_calc import Folder_size_calc
+    app = QCoreApplication([])
+
+    best = None
+    sizes = None
+    for _ in range(repeat + 1):
+        worker = Folder_size_calc(workers, None, live=False, backend=backend)
+        start = time.perf_counter()
+        worker.calculate_size(path)
+        elapsed = time.perf_counter() - start
+        sizes = worker.find_sizes(path)
+        worker.close_pool()
+        if best is None or elapsed < best:
+            best = elapsed if sizes is not None else best
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return {
+        'seconds': best,
+        'files_per_second': sizes[2] / best,
+        'files': sizes[2],
+        'disk_size': sizes[0],
+        'peak_rss_mb': max(peak_rss_mb(), children),
+        'threads': thread_count(),
+    }
+
+
+def run_first_size(path, timeout):
+    # От show() главного окна до первого размера каталога, который DriveInfoProxyModel
+    # отдал представлению; дерево настроено так же, как в приложении
+    from PySide6.QtCore import QTimer
+    from PySide6.QtWidgets import QApplication
+    app = QApplication([sys.argv[0]])
+    from mainwindow import MainWindow
+
+    window = MainWindow(deferred=False)
+    # Окна очистки по заполненным дискам не открываются
+    window.check_disks_usage = lambda: None
+    proxy = window.proxy_model
+    window.ui.treeView.setRootIndex(proxy.to_view(window.file_model.index(path)))
+
+    result = {}
+
+    def changed(*args):
+        if 'first' not in result and any(size >= 0 for size in proxy.size_cache.values()):
+            result['first'] = time.perf_counter() - start
+            QTimer.singleShot(0, app.quit)
+
+    proxy.dataChanged.connect(changed)
+    QTimer.singleShot(int(timeout * 1000), app.quit)
+    start = time.perf_counter()
+    window.show()
+    app.exec()
+    return {
+        'first_size_seconds': result.get('first', float('inf')),
+        'peak_rss_mb': peak_rss_mb(),
+        'threads': thread_count(),
+    }
+
+
+def run_cycles(path, cycles, timeout):
+    # Повторные циклы главного окна: размер каталога, окно очистки по нему и
+    # update_system_info после его закрытия. Потоки и RSS не должны расти от цикла к циклу
+    from PySide6.QtCore import QEvent
+    from PySide6.QtWidgets import QApplication
+    app = QApplication([sys.argv[0]])
+    from mainwindow import MainWindow
+
+    # Окно не показывается: проверка заполненности дисков по showEvent не запускается
+    window = MainWindow(deferred=False)
+    threads = []
+    rss = []
+    for _ in range(cycles):
+        window.proxy_model.calculator.add_task(path)
+        if not wait_until(app, lambda: path in window.proxy_model.size_cache, timeout):
+            raise RuntimeError(f"нет размера {path} за {timeout} с")
+
+        window.show_cleanup_dialog(path)
+        dialog = window.current_cleanup_dialog
+        if not wait_until(app, lambda: dialog.largest_files.text(1) == "", timeout):
+            raise RuntimeError(f"нет самых больших элементов {path} за {timeout} с")
+        dialog.close()
+        del dialog
+        # Отложенные deleteLater выполняются только в DeferredDelete
+        app.sendPostedEvents(None, QEvent.DeferredDelete)
+        wait_until(app, lambda: False, 0.2)
+        threads.append(thread_count())
+        rss.append(rss_mb())
+
+    window.close()
+    return {
+        'threads_per_cycle': threads,
+        'thread_growth': threads[-1] - threads[0],
+        'rss_per_cycle_mb': [round(value, 1) for value in rss],
+        'rss_growth_mb': rss[-1] - rss[0],
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def child(args):
+    kind, path = args.child, args.path
+    if kind == 'scan':
+        result = run_scan(path, args.backend, args.workers, args.repeat)
+    elif kind == 'first-size':
+        result = run_first_size(path, args.timeout)
+    else:
+        result = run_cycles(path, args.cycles, args.timeout)
+    print(json.dumps(result), flush=True)
+    # Завершение процесса не измеряется
+    os._exit(0)
+
+
+# --- запуск и сравнение
+
+def run_case(name, trees, args, tmp):
+    kind, shape, backend = CASES[name]
+    # Свой каталог кэша на случай: индекс размеров прошлых запусков не подменяет обход
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen',
+               XDG_CACHE_HOME=tempfile.mkdtemp(dir=tmp, prefix='cache-'))
+    command = [sys.executable, os.path.abspath(__file__), '--child', kind,
+               '--path', trees[shape][0], '--workers', str(args.workers),
+               '--repeat', str(args.repeat), '--cycles', str(args.cycles),
+               '--timeout', str(args.timeout)]
+    if backend:
+        command += ['--backend', backend]
+    output = subprocess.run(command, env=env, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(f"{name}: код {output.returncode}\n{output.stderr[-2000:]}")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def check(name, result, trees):
+    # Проверки, не зависящие от базовых результатов
+    problems = []
+    kind, shape, _ = CASES[name]
+    if kind == 'scan' and result['files'] != trees[shape][2]:
+        problems.append(f"файлов {result['files']}, ожидалось {trees[shape][2]}")
+    if kind == 'cycles' and result['thread_growth'] > 0:
+        problems.append(f"потоков стало больше на {result['thread_growth']}: "
+                        f"{result['threads_per_cycle']}")
+    if kind == 'first-size' and result['first_size_seconds'] == float('inf'):
+        problems.append("размеры так и не появились")
+    return problems
+
+
+def compare(result, baseline, tolerance):
+    rows = []
+    for metric, higher_is_better in METRICS.items():
+        if metric not in result:
+            continue
+        value = result[metric]
+        base = baseline.get(metric) if baseline else None
+        regression = False
+        if base:
+            change = (value - base) / base
+            worse = -change if higher_is_better else change
+            regression = (worse > tolerance
+                          and abs(value - base) > ABSOLUTE_SLACK.get(metric, 0))
+            rows.append((metric, value, base, f"{change * 100:+.1f}%", regression))
+        else:
+            rows.append((metric, value, base, "", False))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Набор замеров обхода и моделей с сохранением базовых результатов")
+    parser.add_argument('--files', type=int, default=200000,
+                        help="файлов в каждом синтетическом дереве (для миллионов — 1000000 и больше)")
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=list(CASES))
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--cycles', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--dir', help="где создавать деревья (по умолчанию во временном каталоге)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help="файл базовых результатов для сравнения")
+    parser.add_argument('--save', action='store_true',
+                        help="записать результаты как новые базовые")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="допустимое ухудшение относительно базовых (доля)")
+    parser.add_argument('--child', choices=['scan', 'first-size', 'cycles'], help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    parser.add_argument('--backend', default='threads', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline, encoding='utf-8') as f:
+            stored = json.load(f)
+        if stored.get('files') != args.files:
+            print(f"Базовые результаты сняты для --files {stored.get('files')}, сравнения не будет")
+        else:
+            baseline = stored['results']
+
+    failed = False
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        trees = {}
+        for shape in sorted({CASES[name][1] for name in args.cases}):
+            root = os.path.join(tmp, shape)
+            start = time.perf_counter()
+            dirs, files = SHAPES[shape](root, args.files)
+            trees[shape] = (root, dirs, files)
+            print(f"Дерево {shape}: {dirs} каталогов, {files} файлов "
+                  f"({time.perf_counter() - start:.1f} с)")
+
+        for name in args.cases:
+            try:
+                result = run_case(name, trees, args, tmp)
+            except (RuntimeError, ValueError) as e:
+                print(f"{name}: ошибка: {e}")
+                failed = True
+                continue
+            results[name] = result
+            print(name)
+            for problem in check(name, result, trees):
+                print(f"  ОШИБКА: {problem}")
+                failed = True
+            for metric, value, base, change, regression in compare(
+                    result, baseline.get(name), args.tolerance):
+                base_text = f"{base:14.3f}" if base else f"{'—':>14}"
+                mark = "  УХУДШЕНИЕ" if regression else ""
+                print(f"  {metric:18s} {value:14.3f} {base_text} {change:>8}{mark}")
+                failed = failed or regression
+            if 'threads_per_cycle' in result:
+                print(f"  потоки по циклам: {result['threads_per_cycle']}, "
+                      f"RSS, MB: {result['rss_per_cycle_mb']}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'files': args.files,
+                'machine': {
+                    'platform': platform.platform(),
+                    'python': platform.python_version(),
+                    'cpus': os.cpu_count(),
+                    'workers': args.workers,
+                },
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"Базовые результаты записаны в {args.baseline}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
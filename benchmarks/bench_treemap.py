@@ -0,0 +1,63 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PySide6.QtCore import QPointF
+from PySide6.QtWidgets import QApplication
+from Compact_tree import CompactTree
+from Treemap_view import TreemapLayout, TreemapWidget
+from bench_memory import build_scan_tree
+
+
+def timed(action, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        action()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Раскладка и отрисовка карты каталогов")
+    parser.add_argument('--entries', type=int, default=200000, help="число каталогов в дереве")
+    parser.add_argument('--fanout', type=int, default=12)
+    parser.add_argument('--size', type=int, nargs=2, default=[1600, 1000], metavar=('W', 'H'))
+    args = parser.parse_args()
+
+    app = QApplication([])
+    tree = CompactTree.from_scan_tree(build_scan_tree(args.entries, args.fanout))
+    width, height = args.size
+    print(f"Каталогов: {len(tree)}, окно {width}x{height}")
+
+    layout = TreemapLayout(tree, 0, width, height)
+    print(f"Прямоугольников на экране: {len(layout)}")
+    print(f"  раскладка: {timed(lambda: TreemapLayout(tree, 0, width, height)):.3f} с")
+
+    widget = TreemapWidget()
+    widget.resize(width, height)
+    widget.show()
+    app.processEvents()
+    widget._resize_timer.stop()
+    widget.set_tree(tree)
+    first = timed(widget.repaint)
+    cached = timed(widget.repaint, 20)
+    print(f"  первый кадр (раскладка и картинка): {first:.3f} с")
+    print(f"  кадр из кэша: {cached * 1000:.1f} мс, {1 / cached:.0f} кадров/с")
+
+    hits = [QPointF(x * 7 % width, x * 13 % height) for x in range(1000)]
+    layout = widget.layout()[0]
+    hit = timed(lambda: [layout.item_at(p.x(), p.y()) for p in hits]) / len(hits)
+    print(f"  поиск под курсором: {hit * 1e6:.1f} мкс")
+
+    child = next(tree.children(0))
+    zoom_in = timed(lambda: (widget.set_root(child), widget.repaint()))
+    zoom_back = timed(lambda: (widget.set_root(0), widget.repaint()))
+    print(f"  приближение: {zoom_in:.3f} с, возврат из кэша: {zoom_back * 1000:.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Scan_engine import scan_tree
+from synthetic_tree import make_tree
+
+
+def legacy_walk(path):
+    # Прежний цикл Folder_size_calc.calculate_size: os.walk + islink + getsize
+    total_size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for f in filenames:
+            try:
+                fp = os.path.join(dirpath, f)
+                if not os.path.islink(fp):
+                    total_size += os.path.getsize(fp)
+            except (OSError, PermissionError):
+                continue
+    return total_size
+
+
+def scandir_walk(path):
+    tree = scan_tree(path)
+    return tree.root.size, tree.root.disk_size
+
+
+def best_of(func, path, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение os.walk и os.scandir обхода")
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=6)
+    parser.add_argument('--files', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--path', help="существующий каталог вместо синтетического дерева")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path
+        if path is None:
+            path = os.path.join(tmp, 'tree')
+            dirs, files = make_tree(path, args.depth, args.fanout, args.files,
+                                    sparse_size=1 << 30)
+            print(f"Дерево: {dirs} каталогов, {files} файлов")
+
+        legacy_time, legacy_size = best_of(legacy_walk, path, args.repeat)
+        new_time, (size, disk_size) = best_of(scandir_walk, path, args.repeat)
+
+        print(f"os.walk + getsize: {legacy_time * 1000:8.1f} мс  размер {legacy_size}")
+        print(f"os.scandir:        {new_time * 1000:8.1f} мс  размер {size}, на диске {disk_size}")
+        print(f"Ускорение: {legacy_time / new_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Scan_engine import scan_tree
+from synthetic_tree import make_tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Масштабирование обхода по числу потоков")
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--fanout', type=int, default=6)
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--path', help="существующий каталог (например, на NFS) вместо синтетического дерева")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path
+        if path is None:
+            path = os.path.join(tmp, 'tree')
+            dirs, files = make_tree(path, args.depth, args.fanout, args.files)
+            print(f"Дерево: {dirs} каталогов, {files} файлов")
+
+        baseline = None
+        expected = None
+        for workers in args.workers:
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                tree = scan_tree(path, workers=workers)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+
+            if expected is None:
+                expected = tree.root.size
+            elif tree.root.size != expected:
+                print(f"Размер при {workers} потоках расходится: {tree.root.size} != {expected}")
+                sys.exit(1)
+
+            baseline = baseline or best
+            print(f"{workers:3d} потоков: {best * 1000:8.1f} мс  ускорение {baseline / best:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
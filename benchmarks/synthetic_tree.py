@@ -0,0 +1,84 @@
+import os
+
+
+def make_tree(root, depth=3, fanout=4, files_per_dir=50, file_size=1024, sparse_size=0):
+    # fanout подкаталогов на каждом уровне до глубины depth,
+    # в каждом каталоге files_per_dir файлов по file_size байт.
+    # sparse_size > 0 добавляет в корень разреженный файл такого видимого размера.
+    os.makedirs(root, exist_ok=True)
+    payload = b'x' * file_size
+    dirs = 0
+    files = 0
+    stack = [(root, 0)]
+    while stack:
+        path, level = stack.pop()
+        dirs += 1
+        for i in range(files_per_dir):
+            with open(os.path.join(path, f"f{i}.bin"), 'wb') as f:
+                f.write(payload)
+        files += files_per_dir
+        if level < depth:
+            for j in range(fanout):
+                sub = os.path.join(path, f"d{j}")
+                os.mkdir(sub)
+                stack.append((sub, level + 1))
+
+    if sparse_size:
+        with open(os.path.join(root, 'sparse.img'), 'wb') as f:
+            f.truncate(sparse_size)
+        files += 1
+
+    return dirs, files
+
+
+def make_wide(root, files, dirs=1000, file_size=0):
+    # Один уровень: dirs каталогов в корне, файлы поровну между ними
+    os.makedirs(root, exist_ok=True)
+    payload = b'x' * file_size
+    per_dir = -(-files // dirs)
+    made = 0
+    for d in range(dirs):
+        path = os.path.join(root, f"d{d}")
+        os.mkdir(path)
+        for i in range(min(per_dir, files - made)):
+            with open(os.path.join(path, f"f{i}"), 'wb') as f:
+                f.write(payload)
+        made += min(per_dir, files - made)
+    return dirs + 1, made
+
+
+def make_deep(root, files, depth=256, file_size=0):
+    # Цепочка из depth вложенных каталогов, файлы поровну на каждом уровне
+    payload = b'x' * file_size
+    per_dir = -(-files // depth)
+    path = root
+    made = 0
+    for level in range(depth):
+        path = os.path.join(path, f"l{level}")
+        os.makedirs(path)
+        for i in range(min(per_dir, files - made)):
+            with open(os.path.join(path, f"f{i}"), 'wb') as f:
+                f.write(payload)
+        made += min(per_dir, files - made)
+    return depth + 1, made
+
+
+def make_links(root, files, originals=1000, per_dir=500, file_size=4096):
+    # originals настоящих файлов в originals/, остальные записи — жёсткие ссылки на них,
+    # разложенные по каталогам по per_dir. Занято на диске только originals файлов
+    source = os.path.join(root, 'originals')
+    os.makedirs(source)
+    payload = b'x' * file_size
+    for i in range(originals):
+        with open(os.path.join(source, f"o{i}"), 'wb') as f:
+            f.write(payload)
+    dirs = 2
+    made = originals
+    while made < files:
+        path = os.path.join(root, f"links{dirs}")
+        os.mkdir(path)
+        dirs += 1
+        for i in range(min(per_dir, files - made)):
+            os.link(os.path.join(source, f"o{(made + i) % originals}"), os.path.join(path, f"h{i}"))
+        made += min(per_dir, files - made)
+    return dirs, made
@@ -1,166 +1,253 @@
 import os
 import sys
-import psutil
-import shutil
-from PySide6.QtCore import Qt, QTimer, QSortFilterProxyModel
+from PySide6.QtCore import Qt, QTimer
 from PySide6.QtWidgets import (QApplication, QMainWindow, QFileSystemModel, QMessageBox,
-                              QVBoxLayout)
+                              QVBoxLayout, QHBoxLayout, QPushButton, QTabWidget,
+                              QProgressDialog, QLabel, QWidget, QFileDialog)
 from ui_form import Ui_MainWindow
-from PySide6.QtCharts import QChart, QChartView, QPieSeries
-from PySide6.QtGui import QPainter, QColor
-from ThreadCalculator import ThreadCalculator
-from Disk_cleanup_dialog import DiskCleanupDialog
-
-class DiskUsageChart(QChartView):
-    def __init__(self, parent=None):
+from Size_proxy_model import SizeProxyModel, size_filter_box
+from Mount_usage import MountUsageService, usage_color
+from Treemap_view import TreemapWidget
+from Delete_engine import DeleteService
+from Scan_metrics import STAT_BUCKETS, percentile
+
+
+class ScanMetricsPanel(QLabel):
+    # Постоянная надпись в строке состояния: скорость обхода, задержки stat, ошибки
+    # доступа и очереди. metrics_source возвращает текущий ScanMetrics или None, пока
+    # поток обхода не запущен; после перезапуска потока начинаются новые счётчики
+    def __init__(self, metrics_source, parent=None):
         super().__init__(parent)
-        self.chart = QChart()
-        self.chart.setTitle("Использование дисков")
-        self.setChart(self.chart)
-        self.setRenderHint(QPainter.Antialiasing)
-        self.series = QPieSeries()
-        self.chart.addSeries(self.series)
-        self.chart.legend().setVisible(True)
-
-    def update_chart(self, drives):
-        self.series.clear()
-
-        for drive in drives:
-            try:
-                usage = psutil.disk_usage(drive)
-                slice_ = self.series.append(f"{drive} ({usage.percent}%)", usage.percent)
-
-                red = min(255, int(255 * (usage.percent / 100)))
-                green = max(0, int(255 * (1 - usage.percent / 100)))
-                slice_.setColor(QColor(red, green, 0))
-
-                slice_.setLabelVisible(True)
-
-            except Exception as e:
-                print(f"Ошибка обновления диаграммы для {drive}: {e}")
+        self.metrics_source = metrics_source
+        self._last = None
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+
+    def refresh(self):
+        metrics = self.metrics_source()
+        data = metrics.snapshot() if metrics is not None else None
+        if not data or not data['dirs']:
+            self.setText("")
+            return
 
-class DriveInfoProxyModel(QSortFilterProxyModel):
-    def __init__(self, drives=None, parent=None):
+        # Скорость за последний интервал, пока идёт обход, иначе средняя
+        rate = data['entries_per_second']
+        last, self._last = self._last, (data['scan_seconds'], data['entries'])
+        if last is not None and data['scan_seconds'] > last[0]:
+            rate = (data['entries'] - last[1]) / (data['scan_seconds'] - last[0])
+
+        buckets = [0] * (len(STAT_BUCKETS) + 1)
+        for latency in data['stat_latency'].values():
+            buckets = [a + b for a, b in zip(buckets, latency['buckets'])]
+
+        parts = [f"{rate:,.0f} записей/с".replace(',', ' ')]
+        p50, p99 = percentile(buckets, 0.5), percentile(buckets, 0.99)
+        if p50 is not None:
+            parts.append(f"stat p50 ≤ {format_seconds(p50)}, p99 ≤ {format_seconds(p99)}")
+        if data['permission_errors']:
+            parts.append(f"нет доступа: {data['permission_errors']}")
+        queue = sum(q['depth'] for q in data['queues'].values())
+        if queue:
+            parts.append(f"в очереди: {queue}")
+        if data['first_result_seconds'] is not None:
+            parts.append(f"первый результат: {data['first_result_seconds']:.1f} с")
+        self.setText(" · ".join(parts))
+
+        tooltip = [f"Каталогов прочитано: {data['dirs']}, взято из индекса: {data['cached_dirs']}, "
+                   f"записей: {data['entries']}, прочие ошибки: {data['other_errors']}"]
+        for mount, latency in sorted(data['stat_latency'].items()):
+            p99 = percentile(latency['buckets'], 0.99)
+            tooltip.append(f"{mount or '?'}: stat {latency['count']}, "
+                           f"среднее {format_seconds(latency['sum_seconds'] / latency['count'])}, "
+                           f"p99 ≤ {format_seconds(p99)}")
+        for name, q in sorted(data['queues'].items()):
+            tooltip.append(f"Очередь {name}: {q['depth']} (наибольшая {q['max']})")
+        self.setToolTip("\n".join(tooltip))
+
+
+def format_seconds(seconds):
+    if seconds == float('inf'):
+        return "∞"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.0f} мкс"
+    if seconds < 1:
+        return f"{seconds * 1e3:.0f} мс"
+    return f"{seconds:.1f} с"
+
+
+class DriveInfoProxyModel(SizeProxyModel):
+    # drives = None — список дисков ещё не загружен (отложенный запуск окна):
+    # пока его нет, размеры не запрашиваются, иначе корень диска посчитался бы как каталог
+    def __init__(self, drives=None, mount_usage=None, parent=None):
+        self.drives = drives
+        self.mount_usage = mount_usage
         super().__init__(parent)
-        self.drives = drives or []
-        self.size_cache = {}
-        self.calculator = ThreadCalculator()
-        self.calculator.worker.calculated.connect(self.update_size)
 
     def data(self, index, role=Qt.DisplayRole):
+        if self.drives is None:
+            return super().data(index, role) if index.column() == 0 else None
+
         if index.column() == 1 and role == Qt.DisplayRole:
             source_index = self.mapToSource(index)
             path = self.sourceModel().filePath(source_index)
 
             if path in self.drives:
-                try:
-                    usage = psutil.disk_usage(path)
-                    used = self.format_size(usage.used)
-                    total = self.format_size(usage.total)
-
+                usage = self.mount_usage.get(path)
+                if usage is None:
+                    return "Вычисление..."
+                if usage.stale and not usage.total:
+                    return "Нет ответа"
 
-                    return f"Используется {used}/{total}({usage.percent}%)"
-                except Exception:
-                    return "Ошибка"
+                used = self.format_size(usage.used)
+                total = self.format_size(usage.total)
+                text = f"Используется {used}/{total}({usage.percent}%)"
+                return text + " — нет ответа" if usage.stale else text
 
-            if os.path.isdir(path) or os.path.islink(path):
-                if path in self.size_cache:
-                    return self.size_cache[path]
-                else:
-                    QTimer.singleShot(0, lambda p=path: self.calculator.add_task(p))
-                    return "Вычисление..."
+            size = self.directory_size(source_index, path)
+            if size is not None:
+                return size
 
         if role == Qt.BackgroundRole and index.column() == 0:
             source_index = self.mapToSource(index)
             path = self.sourceModel().filePath(source_index)
 
             if path in self.drives:
-                try:
-                    usage = psutil.disk_usage(path)
-
-                    red = min(255, int(255 * (usage.percent / 100)))
-                    green = max(0, int(255 * (1 - usage.percent / 100)))
-                    return QColor(red, green, 0)
-                except Exception:
+                usage = self.mount_usage.get(path)
+                if usage is None or usage.stale:
                     return None
+                return usage_color(usage.percent)
 
         return super().data(index, role)
 
-    def update_size(self, path, size):
-        if path not in self.size_cache or self.size_cache[path] != size:
-            self.size_cache[path] = size
-            root_index = self.sourceModel().index(path)
-            if root_index.isValid():
-                proxy_index = self.mapFromSource(root_index)
-                if proxy_index.isValid():
-                    self.dataChanged.emit(proxy_index, proxy_index, [Qt.DisplayRole])
-
-    def format_size(self, bytes):
-        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-            if bytes < 1024:
-                return f"{bytes:.1f} {unit}"
-            bytes /= 1024
-        return f"{bytes:.1f} PB"
+    def update_drive(self, path):
+        source_index = self.sourceModel().index(path)
+        if source_index.isValid():
+            first = self.mapFromSource(source_index)
+            last = self.mapFromSource(source_index.siblingAtColumn(1))
+            if first.isValid() and last.isValid():
+                self.dataChanged.emit(first, last, [Qt.DisplayRole, Qt.BackgroundRole])
 
 class MainWindow(QMainWindow):
-    def __init__(self, parent=None):
+    # deferred — отложенный запуск: конструктор создаёт только то, что нужно для первого
+    # кадра, а список дисков (psutil), диаграмма (QtCharts) и наблюдение за корнем
+    # файловой системы появляются в finish_startup сразу после первой отрисовки.
+    # Поток обхода запускается при первом запросе размера (SizeProxyModel.calculator).
+    def __init__(self, parent=None, deferred=True):
         super().__init__(parent)
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
+        self.started = False
 
-        self.drives = self.load_drives()
+        self.drives = None
+        self.mount_usage = MountUsageService([], parent=self)
+        self.mount_usage.updated.connect(self.on_mount_usage_updated)
 
         self.file_model = QFileSystemModel()
-        self.file_model.setRootPath("")
         self.file_model.setReadOnly(False)
 
-        self.proxy_model = DriveInfoProxyModel(self.drives)
+        self.proxy_model = DriveInfoProxyModel(None, self.mount_usage)
+        self.proxy_model.calculator_started.connect(self.connect_calculator)
         self.proxy_model.setSourceModel(self.file_model)
 
-        self.ui.treeView.setModel(self.proxy_model)
+        self.proxy_model.show_in(self.ui.treeView)
 
         self.show_drives()
 
         self.ui.treeView.clicked.connect(self.on_item_clicked)
+        self.ui.treeView.collapsed.connect(self.proxy_model.cancel_branch)
         self.ui.treeView.setColumnWidth(1, 270)
+        # Иначе высота каждой строки считается через data() всех столбцов
+        self.ui.treeView.setUniformRowHeights(True)
+        self.ui.treeView.setSortingEnabled(True)
+        self.ui.treeView.sortByColumn(0, Qt.AscendingOrder)
+        self.size_filter = size_filter_box(self.proxy_model)
+        self.ui.verticalLayout_2.insertWidget(0, self.size_filter)
 
         self.setup_chart()
-        self.update_chart()
+        self.treemap_path = None
 
         self.current_selection = None
-        self.ui.treeView.selectionModel().selectionChanged.connect(self.update_delete_button_state)
+        self.proxy_model.selection_changed.connect(self.update_delete_button_state)
         self.ui.deleteButton.clicked.connect(self.delete_selected_item)
         self.ui.deleteButton.setEnabled(False)
 
+        self.deleter = DeleteService(parent=self)
+        self.deleter.progress.connect(self.on_delete_progress)
+        self.deleter.path_deleted.connect(self.proxy_model.forget_deleted)
+        self.deleter.finished.connect(self.on_delete_finished)
+        self.delete_progress = None
+
+        self.scan_metrics_panel = ScanMetricsPanel(self.scan_metrics)
+        self.statusBar().addPermanentWidget(self.scan_metrics_panel)
+
         self.disks_to_clean = []
+        # Диски, заполненность которых уже проверена: окно очистки предлагается один раз
+        self.checked_drives = set()
         self.current_cleanup_dialog = None
 
-    def check_disks_usage(self):
-        self.disks_to_clean = [
-            drive for drive in self.drives
-            if self.is_disk_almost_full(drive)
-        ]
+        if not deferred:
+            self.finish_startup()
 
-        if self.disks_to_clean:
-            self.safe_stop_calculator()
-            self.start_cleanup_process()
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.started:
+            self.started = True
+            QTimer.singleShot(0, self.finish_startup)
 
-    def safe_stop_calculator(self):
-        if hasattr(self.proxy_model, 'calculator'):
-            self.proxy_model.calculator.stop(500)
+    def finish_startup(self):
+        self.started = True
+        if self.drives is not None:
+            return
+        self.drives = self.load_drives()
+        self.proxy_model.drives = self.drives
+        self.mount_usage.mounts = list(self.drives)
+        self.mount_usage.start()
+        self.file_model.setRootPath("")
+        self.show_chart()
+        for drive in self.drives:
+            self.proxy_model.update_drive(drive)
+
+    def scan_metrics(self):
+        calculator = self.proxy_model.running_calculator()
+        return calculator.worker.metrics if calculator is not None else None
+
+    def check_disks_usage(self):
+        # Диск проверяется, как только для него пришла заполненность, а не через
+        # фиксированное время после показа окна: медленный диск не пропускается
+        if not self.isVisible():
+            return
+        for drive in self.drives or []:
+            usage = self.mount_usage.get(drive)
+            if drive in self.checked_drives or usage is None or usage.stale:
+                continue
+            self.checked_drives.add(drive)
+            if self.is_disk_almost_full(drive):
+                self.disks_to_clean.append(drive)
+
+        if self.disks_to_clean and self.current_cleanup_dialog is None:
+            # Поток обхода общий с окном очистки: его удаления он учитывает сам
+            self.start_cleanup_process()
 
     def is_disk_almost_full(self, drive_path):
-        try:
-            usage = psutil.disk_usage(drive_path)
-            return usage.percent >= 50 #для теста
-        except Exception:
+        usage = self.mount_usage.get(drive_path)
+        if usage is None or usage.stale:
             return False
+        return usage.percent >= 50 #для теста
+
+    def on_mount_usage_updated(self, mount):
+        self.proxy_model.update_drive(mount)
+        self.update_chart()
+        if mount not in self.checked_drives:
+            self.check_disks_usage()
 
     def start_cleanup_process(self):
         drive = self.disks_to_clean.pop(0)
         self.show_cleanup_dialog(drive)
 
     def show_cleanup_dialog(self, drive_path):
+        from Disk_cleanup_dialog import DiskCleanupDialog
         self.current_cleanup_dialog = DiskCleanupDialog(drive_path, self)
         self.current_cleanup_dialog.dialog_finished.connect( self.on_cleanup_dialog_closed)
         self.current_cleanup_dialog.show()
@@ -174,19 +261,22 @@ class MainWindow(QMainWindow):
 
     def showEvent(self, event):
         super().showEvent(event)
-        QTimer.singleShot(1000, self.check_disks_usage)
+        self.check_disks_usage()
 
     def update_system_info(self):
-        self.file_model.setRootPath("")
-        self.proxy_model.size_cache.clear()
-
-        self.proxy_model.calculator = ThreadCalculator()
-        self.proxy_model.calculator.worker.calculated.connect(self.proxy_model.update_size)
-
+        # Без отслеживания изменений посчитанное до очистки могло устареть
+        calculator = self.proxy_model.running_calculator()
+        if calculator is not None and not calculator.is_live():
+            self.file_model.setRootPath("")
+            self.proxy_model.clear_sizes()
+            calculator.reset()
+
+        self.mount_usage.refresh()
         self.update_chart()
 
     def load_drives(self):
         try:
+            import psutil
             return [
                 part.mountpoint for part in psutil.disk_partitions()
                 if part.fstype
@@ -202,26 +292,141 @@ class MainWindow(QMainWindow):
             return []
 
     def show_drives(self):
-        root_index = self.proxy_model.mapFromSource(self.file_model.index(""))
+        root_index = self.proxy_model.to_view(self.file_model.index(""))
         self.ui.treeView.setRootIndex(root_index)
 
     def on_item_clicked(self, index):
-        path = self.file_model.filePath(self.proxy_model.mapToSource(index))
+        path = self.file_model.filePath(self.proxy_model.from_view(index))
         self.statusBar().showMessage(f"Выбрано: {path}")
         self.current_selection = path
 
     def closeEvent(self, event):
-        self.proxy_model.calculator.stop()
+        self.deleter.stop(1.0)
+        self.mount_usage.stop()
+        calculator = self.proxy_model.running_calculator()
+        if calculator is not None:
+            calculator.stop()
         super().closeEvent(event)
 
     def setup_chart(self):
-        self.chart_view = DiskUsageChart()
+        # Диаграмма с QtCharts создаётся в show_chart, до этого на её месте пустая вкладка
+        self.chart_view = None
+        self.treemap = TreemapWidget()
+        self.treemap.path_activated.connect(self.reveal_path)
+        self.chart_tabs = QTabWidget()
+        self.chart_tabs.addTab(QWidget(), "Диски")
+        self.chart_tabs.addTab(self.treemap, "Карта")
         layout = self.ui.graphicsView.layout() or QVBoxLayout()
-        layout.addWidget(self.chart_view)
+        layout.addWidget(self.chart_tabs)
+
+        snapshot_layout = QHBoxLayout()
+        self.save_snapshot_button = QPushButton("Сохранить снимок")
+        self.save_snapshot_button.clicked.connect(self.save_snapshot)
+        snapshot_layout.addWidget(self.save_snapshot_button)
+        self.compare_snapshot_button = QPushButton("Сравнить со снимком")
+        self.compare_snapshot_button.clicked.connect(self.compare_snapshot)
+        snapshot_layout.addWidget(self.compare_snapshot_button)
+        self.treemap_button = QPushButton("Карта каталога")
+        self.treemap_button.clicked.connect(self.build_treemap)
+        snapshot_layout.addWidget(self.treemap_button)
+        self.open_scan_button = QPushButton("Открыть скан")
+        self.open_scan_button.clicked.connect(self.open_scan_file)
+        snapshot_layout.addWidget(self.open_scan_button)
+        layout.addLayout(snapshot_layout)
+
         self.ui.graphicsView.setLayout(layout)
 
+    def show_chart(self):
+        from Disk_usage_chart import DiskUsageChart
+        current = self.chart_tabs.currentIndex()
+        placeholder = self.chart_tabs.widget(0)
+        self.chart_view = DiskUsageChart(self.mount_usage)
+        self.chart_tabs.removeTab(0)
+        self.chart_tabs.insertTab(0, self.chart_view, "Диски")
+        self.chart_tabs.setCurrentIndex(current)
+        placeholder.deleteLater()
+        self.update_chart()
+
+    def connect_calculator(self, calculator):
+        worker = calculator.worker
+        worker.snapshot_saved.connect(self.on_snapshot_saved)
+        worker.snapshot_compared.connect(self.on_snapshot_compared)
+        worker.snapshot_failed.connect(self.on_snapshot_failed)
+        worker.treemap_ready.connect(self.on_treemap_ready)
+
+    def snapshot_target(self):
+        path = self.current_selection
+        if not path or not os.path.isdir(path):
+            self.statusBar().showMessage("Выберите каталог или диск для снимка")
+            return None
+        return path
+
+    def save_snapshot(self):
+        path = self.snapshot_target()
+        if path:
+            self.statusBar().showMessage(f"Сохранение снимка {path}...")
+            self.proxy_model.calculator.save_snapshot(path)
+
+    def compare_snapshot(self):
+        path = self.snapshot_target()
+        if path:
+            self.statusBar().showMessage(f"Сравнение {path} с последним снимком...")
+            self.proxy_model.calculator.compare_snapshot(path)
+
+    def build_treemap(self):
+        path = self.snapshot_target()
+        if path:
+            self.statusBar().showMessage(f"Построение карты {path}...")
+            self.treemap_path = path
+            self.proxy_model.calculator.build_treemap(path)
+
+    def open_scan_file(self):
+        from Scan_file import SCAN_SUFFIX, ScanFile
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Открыть скан", os.path.expanduser('~'),
+            f"Сканы (*{SCAN_SUFFIX});;Все файлы (*)")
+        if not path:
+            return
+        try:
+            scan = ScanFile(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Скан", f"{path}: {str(e)}")
+            return
+        from Scan_file_dialog import ScanFileDialog
+        ScanFileDialog(scan, self).show()
+
+    def on_treemap_ready(self, path, tree):
+        # Поток обхода общий: карты, построенные для окна очистки, сюда тоже приходят
+        if path != self.treemap_path:
+            return
+        self.treemap_path = None
+        self.statusBar().clearMessage()
+        self.treemap.set_tree(tree)
+        self.chart_tabs.setCurrentWidget(self.treemap)
+
+    def reveal_path(self, path):
+        # Каталог, выбранный на карте, раскрывается и выделяется в дереве
+        index = self.proxy_model.to_view(self.file_model.index(path))
+        if index.isValid():
+            self.ui.treeView.scrollTo(index)
+            self.ui.treeView.setCurrentIndex(index)
+        self.statusBar().showMessage(f"Выбрано: {path}")
+        self.current_selection = path
+
+    def on_snapshot_saved(self, path, snapshot_path):
+        self.statusBar().showMessage(f"Снимок {path} сохранён: {snapshot_path}")
+
+    def on_snapshot_compared(self, path, snapshot_path, entries):
+        from Snapshot_diff_dialog import SnapshotDiffDialog
+        self.statusBar().clearMessage()
+        SnapshotDiffDialog(path, snapshot_path, entries, self).show()
+
+    def on_snapshot_failed(self, path, message):
+        self.statusBar().clearMessage()
+        QMessageBox.warning(self, "Снимок", f"{path}: {message}")
+
     def update_chart(self):
-        if hasattr(self, 'chart_view'):
+        if self.chart_view is not None:
             self.chart_view.update_chart(self.drives)
 
     def update_delete_button_state(self):
@@ -239,18 +444,45 @@ class MainWindow(QMainWindow):
         )
 
         if reply == QMessageBox.Yes:
-            try:
-                if os.path.isdir(self.current_selection):
-                    shutil.rmtree(self.current_selection)
-                else:
-                    os.remove(self.current_selection)
-
-                    self.file_model.setRootPath("")
-
-                QMessageBox.information(self, "Успех", "Удаление завершено успешно")
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Не удалось удалить: {str(e)}")
+            self.start_deletion([self.current_selection])
 
+    def start_deletion(self, paths):
+        if not self.deleter.start(paths):
+            QMessageBox.warning(self, "Удаление", "Предыдущее удаление ещё не завершено")
+            return
+        self.ui.deleteButton.setEnabled(False)
+        self.delete_progress = QProgressDialog("Удаление...", "Отмена", 0, 0, self)
+        self.delete_progress.setWindowTitle("Удаление")
+        self.delete_progress.setMinimumDuration(0)
+        self.delete_progress.canceled.connect(self.deleter.cancel)
+        self.delete_progress.show()
+
+    def on_delete_progress(self, files, disk_size):
+        if self.delete_progress is not None:
+            self.delete_progress.setLabelText(
+                f"Удалено файлов: {files}, освобождено {self.proxy_model.format_size(disk_size)}")
+
+    def on_delete_finished(self, files, disk_size, errors, cancelled):
+        if self.delete_progress is not None:
+            self.delete_progress.canceled.disconnect(self.deleter.cancel)
+            self.delete_progress.close()
+            self.delete_progress = None
+        if self.current_selection and not os.path.lexists(self.current_selection):
+            self.current_selection = None
+        self.update_delete_button_state()
+        self.mount_usage.refresh()
+
+        freed = self.proxy_model.format_size(disk_size)
+        if errors:
+            message = "\n".join(errors[:10])
+            if len(errors) > 10:
+                message += f"\n\n...и ещё {len(errors) - 10} ошибок"
+            QMessageBox.critical(self, "Ошибка", f"Не удалось удалить:\n{message}")
+        elif cancelled:
+            QMessageBox.information(
+                self, "Удаление", f"Удаление отменено. Удалено файлов: {files}, освобождено {freed}")
+        else:
+            QMessageBox.information(self, "Успех", f"Удаление завершено успешно. Освобождено {freed}")
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)